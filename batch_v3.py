@@ -0,0 +1,349 @@
+r"""
+batch_v3.py - run pipeline_v3 for every row of a vehicles CSV in one process
+
+An opt-in alternative (``run_batch_v3.ps1 -Batch``) to the per-row
+``py scripts/pipeline_v3.py`` loop in scripts/run_batch_v3.ps1. Vehicles run
+concurrently on a thread pool, and each pipeline stage (extract, llm, tts,
+render) has its own concurrency cap shared by all vehicles, so a batch
+finishes in roughly the time of its slowest vehicle instead of the sum of all
+of them.
+
+CSV columns (same as data/vehicles_v3.csv): ``vehicleId,pdf,images``, plus an
+optional ``section`` column (semicolon-separated section/feature titles) that
+overrides ``--section`` for that row, and an optional ``search`` column that
+does the same for ``--search``.
+
+Each vehicle runs the repo-root pipeline_v3.run_vehicle, not
+scripts/pipeline_v3.py that ``run_batch_v3.ps1`` calls by default. The two
+write different scripts: the root pipeline uses the technical-writer prompt
+(numbered steps, 12-16 sentences) where the scripts/ one asks for 12-20 short
+narration sentences, so a batch run does not reproduce the per-row output.
+
+Usage (Windows PowerShell):
+  py batch_v3.py --csv data\vehicles_v3.csv --output C:\...\dist\pipeline-output ^
+    --ffmpeg $env:FFMPEG_EXE --workers 8 --limit tts=4 --limit render=2
+
+Offline LLM batch (see vi_pipeline.llm_batch): ``--llm-batch-out requests.jsonl``
+extracts every vehicle and writes its script request instead of calling the
+API; after the batch endpoint has run it, rerun with ``--llm-batch-in
+results.jsonl`` (same CSV and options) to render from the batched scripts.
+
+Durable queue (see vi_pipeline.jobqueue): ``--queue jobs.db`` pulls vehicles
+from a SQLite job queue instead of running the CSV directly; with ``--csv``
+the rows are enqueued first. Start several processes on the same database
+to scale out; a crashed worker's vehicles are picked up again once their
+lease expires, and each retry resumes at the stage that failed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import pathlib
+import sqlite3
+import subprocess
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import pipeline_v3
+from vi_pipeline import trace
+from vi_pipeline.cache import add_cache_args, cache_mode_from_args
+from vi_pipeline.concurrency import DEFAULT_STAGE_LIMITS, StageLimits, parse_stage_limits, positive_int
+from vi_pipeline.jobqueue import JobQueue, Lease, add_queue_args
+from vi_pipeline.llm_batch import ingest, write_requests
+from vi_pipeline.search import add_search_args
+from vi_pipeline.sections import add_section_args
+from vi_pipeline.trace import add_trace_args, format_summary
+
+
+@dataclass
+class VehicleJob:
+    vehicle_id: str
+    pdf: str
+    images: List[str]
+    sections: List[str] = field(default_factory=list)
+    search: List[str] = field(default_factory=list)
+
+
+@dataclass
+class VehicleResult:
+    vehicle_id: str
+    ok: bool
+    seconds: float
+    error: str = ""
+    uploaded: Optional[bool] = None
+    manifest: dict = field(default_factory=dict)
+
+
+def read_jobs(csv_path: pathlib.Path) -> List[VehicleJob]:
+    """Read ``vehicleId,pdf,images`` rows from a CSV file.
+
+    Raises:
+        SystemExit: If the file has no usable rows or is missing columns.
+    """
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        missing = {"vehicleId", "pdf", "images"} - set(reader.fieldnames or [])
+        if missing:
+            raise SystemExit(f"[batch] CSV {csv_path} is missing columns: {', '.join(sorted(missing))}")
+        jobs = [
+            VehicleJob(
+                row["vehicleId"].strip(), row["pdf"].strip(), pipeline_v3.parse_images(row["images"]),
+                [s.strip() for s in (row.get("section") or "").split(";") if s.strip()],
+                [s.strip() for s in (row.get("search") or "").split(";") if s.strip()],
+            )
+            for row in reader
+            if (row.get("vehicleId") or "").strip()
+        ]
+    if not jobs:
+        raise SystemExit(f"[batch] CSV {csv_path} has zero rows")
+    return jobs
+
+
+def upload(vehicle_id: str, output_dir: pathlib.Path) -> bool:
+    """Push a finished vehicle with scripts/upload_to_firebase_v2.js, if present."""
+    script = pathlib.Path(__file__).resolve().parent / "scripts" / "upload_to_firebase_v2.js"
+    if not script.is_file():
+        return False
+    p = subprocess.run(["node", str(script), vehicle_id, str(output_dir)])
+    return p.returncode == 0
+
+
+def run_job(job: VehicleJob, args: argparse.Namespace, limits: StageLimits,
+            on_stage: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> VehicleResult:
+    """Run one vehicle, converting any failure (including SystemExit) into a result."""
+    start = time.perf_counter()
+    try:
+        with trace.span("vehicle", vehicle=job.vehicle_id):
+            manifest = pipeline_v3.run_vehicle(
+                job.pdf, job.images, args.output, job.vehicle_id,
+                model=args.model, ffmpeg=args.ffmpeg, limits=limits, render=args.render, resume=not args.no_resume,
+                summarize=args.summarize, map_workers=args.map_workers, stream=args.stream,
+                extract=args.extract, segment_encoder=args.segment_encoder, still_audio=args.still_audio,
+                caption_weight=args.caption_weight, prompt_tokens=args.prompt_tokens,
+                strip_boilerplate=not args.keep_boilerplate, sections=job.sections or args.sections,
+                search=job.search or args.search, search_k=args.search_k,
+                until="extract" if args.llm_batch_out else None, on_stage=on_stage, voice_id=args.voice_id,
+            )
+    except BaseException as exc:  # pipeline_v3 reports errors via SystemExit
+        if isinstance(exc, KeyboardInterrupt):
+            raise
+        detail = str(exc) if isinstance(exc, SystemExit) else traceback.format_exc(limit=3)
+        return VehicleResult(job.vehicle_id, False, time.perf_counter() - start, error=detail)
+    result = VehicleResult(job.vehicle_id, True, time.perf_counter() - start, manifest=manifest)
+    if args.upload and not args.llm_batch_out:
+        with trace.span("upload", vehicle=job.vehicle_id):
+            result.uploaded = upload(job.vehicle_id, args.output)
+    return result
+
+
+def report(res: VehicleResult, note: str = "") -> None:
+    status = "ok" if res.ok else "FAIL"
+    run = res.manifest.get("run", {})
+    detail = f" (ran {len(run.get('ran', []))}, skipped {len(run.get('skipped', []))} stages)" if run else ""
+    print(f"[batch] {status} {res.vehicle_id} in {res.seconds:.1f}s{detail}{note}")
+    if not res.ok:
+        print(f"[batch]   {res.error.strip()}", file=sys.stderr)
+
+
+def run_batch(jobs: List[VehicleJob], args: argparse.Namespace) -> List[VehicleResult]:
+    limits = StageLimits(args.stage_limits)
+    workers = args.workers or len(jobs)
+    print(f"[batch] Rows={len(jobs)} Workers={workers} Limits={limits.limits} OutDir={args.output}")
+    results: List[VehicleResult] = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vehicle") as pool:
+        futures = {pool.submit(run_job, job, args, limits): job for job in jobs}
+        for fut in as_completed(futures):
+            res = fut.result()
+            results.append(res)
+            report(res)
+    order = {job.vehicle_id: i for i, job in enumerate(jobs)}
+    results.sort(key=lambda r: order.get(r.vehicle_id, 0))
+    return results
+
+
+# Vehicles in flight per queue worker process when --workers is not given
+QUEUE_WORKERS = 4
+# Idle wait while other workers hold the remaining jobs or retries back off
+QUEUE_POLL_SECONDS = 5.0
+
+
+def manifest_stages(output: pathlib.Path, vehicle_id: str) -> Dict[str, dict]:
+    """Stage records from a vehicle's manifest on disk (written after every stage)."""
+    try:
+        return json.loads((output / f"{vehicle_id}_manifest.json").read_text(encoding="utf-8")).get("stages", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def run_queue(queue: JobQueue, args: argparse.Namespace) -> List[VehicleResult]:
+    """Claim and run vehicles until the queue has nothing queued or running."""
+    limits = StageLimits(args.stage_limits)
+    workers = args.workers or QUEUE_WORKERS
+    counts = queue.counts()
+    print(f"[batch] Queue={queue.path} {counts} Workers={workers} Limits={limits.limits} OutDir={args.output}")
+    results: List[VehicleResult] = []
+
+    def work() -> None:
+        while True:
+            claimed = queue.claim()
+            if claimed is None:
+                if not queue.pending():
+                    queue.close()
+                    return
+                time.sleep(QUEUE_POLL_SECONDS)
+                continue
+            job = VehicleJob(**claimed.payload)
+
+            def on_stage(name: str, record: Dict[str, Any], claimed=claimed) -> None:
+                # Progress only: a busy database must not fail the vehicle, and
+                # the full manifest is recorded again when the job ends
+                try:
+                    queue.record_stages(claimed, {name: record})
+                except sqlite3.Error:
+                    pass
+
+            with Lease(queue, claimed) as lease:
+                res = run_job(job, args, limits, on_stage=on_stage)
+            queue.record_stages(claimed, manifest_stages(args.output, job.vehicle_id))
+            if lease.lost:
+                note = " (lease lost; another worker owns it now)"
+            elif res.ok:
+                queue.complete(claimed)
+                note = ""
+            else:
+                state = queue.fail(claimed, res.error)
+                note = f" (attempt {claimed.attempts}/{claimed.max_attempts}, {state or 'lease lost'})"
+            results.append(res)
+            report(res, note)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="queue") as pool:
+        for fut in [pool.submit(work) for _ in range(workers)]:
+            fut.result()
+    return results
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run pipeline_v3 for every row of a vehicles CSV")
+    parser.add_argument("--csv", type=pathlib.Path, help="CSV with vehicleId,pdf,images columns (required without --queue)")
+    parser.add_argument("--output", required=True, type=pathlib.Path, help="Output directory shared by all vehicles")
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--voice", dest="voice_id", default=pipeline_v3.TTS_VOICE_ID, help="ElevenLabs voice ID (default: Rachel)")
+    parser.add_argument("--ffmpeg", default=os.environ.get("FFMPEG_EXE", "ffmpeg"))
+    parser.add_argument("--render", choices=pipeline_v3.RENDER_MODES, default="single")
+    parser.add_argument("--extract", choices=pipeline_v3.EXTRACT_MODES, default="fast")
+    parser.add_argument("--segment-encoder", choices=pipeline_v3.SEGMENT_ENCODERS, default="still")
+    parser.add_argument("--still-audio", choices=pipeline_v3.STILL_AUDIO_CODECS, default="aac")
+    parser.add_argument("--keep-boilerplate", action="store_true", help="Keep repeated page headers, footers and warning boxes")
+    parser.add_argument("--caption-weight", choices=pipeline_v3.CAPTION_WEIGHTS, default="syllables")
+    parser.add_argument("--stream", action="store_true", help="With --render segments, encode while TTS downloads")
+    parser.add_argument("--summarize", choices=pipeline_v3.SUMMARIZE_MODES, default="truncate")
+    parser.add_argument("--prompt-tokens", type=int, default=pipeline_v3.PROMPT_MAX_TOKENS, help="Manual excerpt budget in tokens of --model (truncate mode)")
+    parser.add_argument("--map-workers", type=int, default=pipeline_v3.DEFAULT_MAP_WORKERS)
+    parser.add_argument("--no-resume", action="store_true", help="Ignore manifest checkpoints and rerun every stage")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Vehicles in flight at once (default: one per CSV row)",
+    )
+    parser.add_argument(
+        "--limit",
+        action="append",
+        default=[],
+        metavar="STAGE=N",
+        help=f"Per-stage concurrency cap, repeatable (defaults: {DEFAULT_STAGE_LIMITS})",
+    )
+    parser.add_argument("--tts-concurrency", type=positive_int, default=None, help="ElevenLabs requests in flight across all vehicles")
+    parser.add_argument("--tts-chars-per-minute", type=positive_int, default=None, help="ElevenLabs character budget per minute")
+    parser.add_argument("--speech-wps", type=float, default=None, help="Words per second for balancing segments")
+    parser.add_argument("--speech-pause", type=float, default=None, help="Pause per sentence (s) for balancing segments")
+    parser.add_argument("--upload", action="store_true", help="Run upload_to_firebase_v2.js for each finished vehicle")
+    batch = parser.add_mutually_exclusive_group()
+    batch.add_argument("--llm-batch-out", type=pathlib.Path, help="Extract only and write each script request to this JSONL batch file")
+    batch.add_argument("--llm-batch-in", type=pathlib.Path, help="Load scripts from this batch results JSONL, then run the batch")
+    parser.add_argument("--queue", type=pathlib.Path, help="SQLite job queue to pull vehicles from (--csv rows are enqueued first)")
+    parser.add_argument("--retry-dead", action="store_true", help="With --queue, requeue dead-lettered vehicles first")
+    add_queue_args(parser)
+    add_section_args(parser)
+    add_search_args(parser)
+    add_cache_args(parser)
+    add_trace_args(parser)
+    args = parser.parse_args(argv)
+    if not args.csv and not args.queue:
+        parser.error("--csv is required without --queue")
+    if args.queue and args.llm_batch_out:
+        parser.error("--llm-batch-out runs the CSV directly; drop --queue")
+    try:
+        args.stage_limits = parse_stage_limits(args.limit)
+    except ValueError as exc:
+        parser.error(f"--limit: {exc}")
+    try:
+        pipeline_v3.configure_tts_limiter(args.tts_concurrency, args.tts_chars_per_minute)
+    except ValueError as exc:
+        parser.error(str(exc))
+    return args
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+    pipeline_v3.configure_speech_model(args.speech_wps, args.speech_pause)
+    mode = cache_mode_from_args(args)
+    for store in (pipeline_v3.LLM_CACHE, pipeline_v3.TTS_CACHE, pipeline_v3.STILL_CACHE, pipeline_v3.SEARCH_CACHE,
+                  pipeline_v3.BOILERPLATE_CACHE, pipeline_v3.PAGE_STORE):
+        store.mode = mode
+    jobs = read_jobs(args.csv) if args.csv else []
+    queue = None
+    if args.queue:
+        queue = JobQueue(args.queue, lease_seconds=args.lease, max_attempts=args.max_attempts)
+        outcomes: Dict[str, int] = {}
+        for job in jobs:
+            outcome = queue.enqueue(job.vehicle_id, asdict(job))
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        if jobs:
+            print(f"[batch] Enqueued {args.csv}: {outcomes}")
+        if args.retry_dead:
+            print(f"[batch] Requeued {queue.retry_dead()} dead jobs")
+    if args.llm_batch_in:
+        report = ingest(args.llm_batch_in, pipeline_v3.LLM_CACHE)
+        print(f"[batch] LLM batch results {args.llm_batch_in}: {report.describe()}")
+        for cid, error in report.failed.items():
+            print(f"[batch]   {cid}: {error}", file=sys.stderr)
+    tracer = trace.configure(args.trace)
+    start = time.perf_counter()
+    try:
+        results = run_queue(queue, args) if queue is not None else run_batch(jobs, args)
+    finally:
+        summary = tracer.close()
+    failed = [r.vehicle_id for r in results if not r.ok]
+    ok, total = len(results) - len(failed), len(results)
+    if queue is not None:
+        # Judge each vehicle this process worked on by its final queue state: a
+        # retried failure counts once it finishes, and only dead-lettered ones
+        # fail the run. Other workers' vehicles are theirs to report.
+        handled = {r.vehicle_id for r in results}
+        states = {row["key"]: row["state"] for row in queue.jobs() if row["key"] in handled}
+        failed = [key for key, state in states.items() if state == "dead"]
+        ok, total = sum(state == "done" for state in states.values()), len(states)
+        print(f"[batch] Queue: {queue.counts()}")
+    if args.llm_batch_out:
+        # CSV order; vehicles with identical excerpts share one request
+        count = write_requests(args.llm_batch_out, (r.manifest["script_request"] for r in results if r.ok))
+        print(f"[batch] Wrote {count} script requests for {ok} vehicles to {args.llm_batch_out}")
+    print(f"[batch] Done: {ok}/{total} ok in {time.perf_counter() - start:.1f}s")
+    if args.trace:
+        print(f"[batch] Trace written to {args.trace}\n{format_summary(summary)}")
+    if failed:
+        print(f"[batch] Failed: {', '.join(failed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,10 @@
+"""
+Offline benchmarks for the content pipelines.
+
+``stub_api`` serves local stand-ins for the OpenAI and ElevenLabs endpoints,
+``fixtures`` generates synthetic manuals and media, and ``run`` times each
+stage (and each pipeline end to end) in its own process:
+
+    python -m benchmarks.run --json bench.json
+    python -m benchmarks.run --baseline bench.json   # exit 1 on regressions
+"""
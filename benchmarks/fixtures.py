@@ -0,0 +1,64 @@
+"""
+Synthetic inputs for the benchmarks: owner's-manual-like PDFs, a background
+image and narration scripts. Everything is generated from a seed, so runs are
+comparable across machines and commits.
+"""
+
+from __future__ import annotations
+
+import pathlib
+import random
+from typing import Union
+
+import fitz  # PyMuPDF
+
+PathLike = Union[str, pathlib.Path]
+
+_WORDS = (
+    "press hold button engine start brake pedal display indicator warning light "
+    "seat belt mirror adjust lever steering wheel cruise control lane assist tire "
+    "pressure fuel door lock key fob climate fan defrost wiper headlight hazard "
+    "parking camera sensor gear shift transmission battery charge port trunk hood"
+).split()
+_HEADINGS = ("Starting and Stopping", "Instruments and Controls", "Driving Assistance",
+             "Climate", "Maintenance", "Safety Systems", "Lights and Wipers")
+
+
+def sentence(rng: random.Random, words: int = 12) -> str:
+    s = " ".join(rng.choice(_WORDS) for _ in range(words))
+    return s[0].upper() + s[1:] + "."
+
+
+def make_pdf(path: PathLike, pages: int, lines_per_page: int = 45, seed: int = 7) -> pathlib.Path:
+    """Letter-size PDF with a numbered heading and body text on every page."""
+    path = pathlib.Path(path)
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for n in range(pages):
+        page = doc.new_page(width=612, height=792)
+        heading = f"{n // 10 + 1}.{n % 10 + 1} {rng.choice(_HEADINGS)}"
+        page.insert_text((54, 60), heading, fontsize=14)
+        body = "\n".join(sentence(rng) for _ in range(lines_per_page))
+        page.insert_textbox(fitz.Rect(54, 80, 558, 760), body, fontsize=9)
+        page.insert_text((300, 780), str(n + 1), fontsize=8)
+    doc.save(str(path))
+    doc.close()
+    return path
+
+
+def make_image(path: PathLike, size=(1920, 1080)) -> pathlib.Path:
+    """Gradient PNG (enough detail that the encoder does real work)."""
+    path = pathlib.Path(path)
+    w, h = size
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, w, h), False)
+    band = max(1, w // 64)
+    for x in range(0, w, band):
+        shade = int(255 * x / w)
+        pix.set_rect(fitz.IRect(x, 0, x + band, h), (shade, 96, 255 - shade))
+    pix.save(str(path))
+    return path
+
+
+def make_script(sentences: int = 120, seed: int = 11) -> str:
+    rng = random.Random(seed)
+    return "\n".join(sentence(rng, rng.randint(6, 18)) for _ in range(sentences))
@@ -0,0 +1,284 @@
+"""
+Time each pipeline stage, and each pipeline end to end, against the local API
+stand-in and synthetic inputs.
+
+Every case runs in a fresh interpreter so its peak RSS is its own (measured
+with ``os.wait4``; reported as ``-`` where that is unavailable). Stage cases
+repeat ``--repeat`` times inside the child and report the median; all caches
+and the page store are off so every repeat does the full work.
+
+    python -m benchmarks.run                                  # everything
+    python -m benchmarks.run --cases extract_full,split --pages 10,400
+    python -m benchmarks.run --json bench.json                # save a baseline
+    python -m benchmarks.run --baseline bench.json --tolerance 0.25
+
+With ``--baseline``, any case more than ``--tolerance`` slower than its
+baseline is reported and the exit status is 1.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import pathlib
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from benchmarks.fixtures import make_image, make_pdf, make_script
+from benchmarks.stub_api import StubAPI, StubConfig, silent_mp3
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+# Stage cases and whether they run once per --pages value
+STAGE_CASES = {
+    "extract_budget": True,   # pipeline_v3.read_pdf_text (budgeted, stops early)
+    "extract_full": True,     # vi_pipeline.pdftext.read_all_text (whole manual)
+    "split": False,           # pipeline_v3.split_script_into_segments
+    "llm": False,             # pipeline_v3.openai_summarize_to_script
+    "tts": False,             # pipeline_v3.eleven_tts
+    "render_loop": False,     # pipeline_v3.ffmpeg_segment
+    "render_still": False,    # vi_pipeline.still.StillRenderer.render
+    "concat": False,          # pipeline_v3.ffmpeg_concat
+}
+PIPELINES = {
+    "pipeline": "pipeline.py",
+    "pipeline_v2": "scripts/pipeline_v2.py",
+    "pipeline_v3": "pipeline_v3.py",
+}
+ALL_CASES = tuple(STAGE_CASES) + tuple(f"e2e_{name}" for name in PIPELINES)
+
+
+# ---------------------------------------------------------------------------
+# Child side: one stage, timed in-process
+# ---------------------------------------------------------------------------
+
+def _stage(case: str, a: argparse.Namespace) -> Tuple[Callable[[], float], str]:
+    """Return (run-once -> units processed, unit name) for ``case``."""
+    work = pathlib.Path(a.work)
+    import pipeline_v3 as v3
+    from vi_pipeline.mp3 import mp3_duration
+
+    for cache in (v3.LLM_CACHE, v3.TTS_CACHE, v3.STILL_CACHE, v3.PAGE_STORE):
+        cache.mode = "off"
+
+    if case == "extract_budget":
+        pdf = str(work / f"manual_{a.pages}.pdf")
+        return (lambda: len(v3.read_pdf_text(pdf, max_tokens=v3.PROMPT_MAX_TOKENS).text)), "chars"
+    if case == "extract_full":
+        from vi_pipeline.pdftext import read_all_text
+        pdf = str(work / f"manual_{a.pages}.pdf")
+
+        def extract_full() -> float:
+            read_all_text(pdf, store=None)
+            return a.pages
+        return extract_full, "pages"
+    if case == "split":
+        script = make_script(2000)
+        return (lambda: sum(len(s) for s in v3.split_script_into_segments(script, a.segments))), "chars"
+    if case == "llm":
+        excerpt = make_script(60)
+
+        def llm() -> float:
+            v3.openai_summarize_to_script(excerpt)
+            return 1
+        return llm, "requests"
+    if case == "tts":
+        text = make_script(40)
+        out = work / "tts.mp3"
+
+        def tts() -> float:
+            v3.eleven_tts(text, str(out))
+            return mp3_duration(str(out))
+        return tts, "audio s"
+
+    image = str(work / "image.png")
+    mp3 = work / "narration.mp3"
+    if not mp3.exists():
+        mp3.write_bytes(silent_mp3(a.audio_seconds))
+    duration = mp3_duration(str(mp3))
+    if case == "render_loop":
+        def render_loop() -> float:
+            v3.ffmpeg_segment(a.ffmpeg, image, str(mp3), str(work / "loop.mp4"))
+            return duration
+        return render_loop, "audio s"
+    if case == "render_still":
+        from vi_pipeline.still import StillRenderer
+        renderer = StillRenderer(a.ffmpeg)  # the clip is encoded on the first repeat only
+
+        def render_still() -> float:
+            renderer.render(image, str(mp3), str(work / "still.mp4"), duration=duration)
+            return duration
+        return render_still, "audio s"
+    if case == "concat":
+        from vi_pipeline.still import StillRenderer
+        renderer = StillRenderer(a.ffmpeg)
+        parts = []
+        for i in range(a.segments):
+            part = work / f"part_{i}.mp4"
+            renderer.render(image, str(mp3), str(part), duration=duration)
+            parts.append(str(part))
+
+        def concat() -> float:
+            v3.ffmpeg_concat(a.ffmpeg, parts, str(work / "joined.mp4"), outpoints=[duration] * len(parts))
+            return duration * len(parts)
+        return concat, "audio s"
+    raise SystemExit(f"unknown case: {case}")
+
+
+def run_child(a: argparse.Namespace) -> None:
+    once, unit = _stage(a.case, a)
+    times, units = [], 0.0
+    for _ in range(a.repeat):
+        t0 = time.perf_counter()
+        units = once()
+        times.append(time.perf_counter() - t0)
+    print(json.dumps({"seconds": statistics.median(times), "units": units, "unit": unit}))
+
+
+# ---------------------------------------------------------------------------
+# Parent side: fixtures, stub API, one process per case
+# ---------------------------------------------------------------------------
+
+def run_measured(cmd: List[str], env: Dict[str, str], cwd: pathlib.Path) -> Tuple[int, str, str, Optional[float]]:
+    """Run ``cmd``; return (exit code, stdout, stderr, peak RSS in MB or None)."""
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        p = subprocess.Popen(cmd, env=env, cwd=str(cwd), stdout=out, stderr=err)
+        rss_mb = None
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(p.pid, 0)
+            p.returncode = os.waitstatus_to_exitcode(status)
+            # ru_maxrss is KiB on Linux, bytes on macOS
+            rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+        else:
+            p.wait()
+        out.seek(0)
+        err.seek(0)
+        return p.returncode, out.read().decode(errors="ignore"), err.read().decode(errors="ignore"), rss_mb
+
+
+def e2e_cmd(name: str, a: argparse.Namespace, work: pathlib.Path, pdf: pathlib.Path) -> List[str]:
+    out = work / f"out_{name}_{pdf.stem}"
+    cmd = [sys.executable, str(ROOT / PIPELINES[name]), "--pdf", str(pdf), "--output", str(out),
+           "--vehicle", "bench", "--no-cache"]
+    image = str(work / "image.png")
+    if name == "pipeline":
+        return cmd + ["--image", image]
+    if name == "pipeline_v2":
+        return cmd + ["--image", image, "--ffmpeg", a.ffmpeg]
+    return cmd + ["--images", image, "--ffmpeg", a.ffmpeg, "--no-resume"]
+
+
+def run_cases(a: argparse.Namespace, cases: List[str], pages: List[int]) -> List[Dict]:
+    results = []
+    with tempfile.TemporaryDirectory(prefix="vi-bench-") as tmp, StubAPI(StubConfig(
+        latency_ms=a.latency_ms, error_rate=a.error_rate, realtime_factor=a.realtime_factor,
+    )) as api:
+        work = pathlib.Path(tmp)
+        make_image(work / "image.png")
+        for n in pages:
+            make_pdf(work / f"manual_{n}.pdf", n)
+        env = dict(os.environ, **api.env())
+        env["VI_CACHE_DIR"] = str(work / "cache")
+        env["VI_PAGESTORE_DIR"] = str(work / "pages")
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT), env.get("PYTHONPATH")]))
+
+        for case in cases:
+            for n in (pages if case.startswith("e2e_") or STAGE_CASES.get(case) else [None]):
+                label = case if n is None else f"{case}[{n}p]"
+                if case.startswith("e2e_"):
+                    cmd = e2e_cmd(case[4:], a, work, work / f"manual_{n}.pdf")
+                else:
+                    cmd = [sys.executable, "-m", "benchmarks.run", "--case", case, "--work", str(work),
+                           "--pages", str(n or 0), "--repeat", str(a.repeat), "--segments", str(a.segments),
+                           "--audio-seconds", str(a.audio_seconds), "--ffmpeg", a.ffmpeg]
+                t0 = time.perf_counter()
+                code, out, err, rss_mb = run_measured(cmd, env, ROOT)
+                wall = time.perf_counter() - t0
+                if code != 0:
+                    print(f"{label}: FAILED (exit {code})\n{err[-1500:]}", file=sys.stderr)
+                    results.append({"case": label, "error": code})
+                    continue
+                if case.startswith("e2e_"):
+                    row = {"case": label, "seconds": wall, "units": n, "unit": "pages"}
+                else:
+                    row = dict(json.loads(out.strip().splitlines()[-1]), case=label)
+                row["rss_mb"] = rss_mb
+                results.append(row)
+                print(format_row(row), flush=True)
+        print(f"stub API: {api.stats.chat} chat, {api.stats.tts} tts, {api.stats.errors} injected errors")
+    return results
+
+
+def format_row(row: Dict) -> str:
+    rate = row["units"] / row["seconds"] if row["seconds"] > 0 else float("inf")
+    rss = f"{row['rss_mb']:7.0f}" if row.get("rss_mb") is not None else f"{'-':>7}"
+    return f"{row['case']:<26} {row['seconds']:9.3f}s {rate:12.1f} {row['unit'] + '/s':<10} {rss} MB"
+
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    base = {r["case"]: r for r in baseline if "seconds" in r}
+    regressions = []
+    for r in results:
+        b = base.get(r["case"])
+        if b is None:
+            continue
+        if "seconds" not in r:
+            regressions.append(f"{r['case']}: failed (baseline {b['seconds']:.3f}s)")
+        elif r["seconds"] > b["seconds"] * (1 + tolerance):
+            regressions.append(f"{r['case']}: {r['seconds']:.3f}s vs {b['seconds']:.3f}s "
+                               f"(+{(r['seconds'] / b['seconds'] - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--cases", default=",".join(ALL_CASES), help=f"comma-separated subset of: {', '.join(ALL_CASES)}")
+    ap.add_argument("--pages", default="10,100,400", help="synthetic manual sizes for the extract and e2e cases")
+    ap.add_argument("--repeat", type=int, default=3, help="repeats per stage case (median reported)")
+    ap.add_argument("--segments", type=int, default=6)
+    ap.add_argument("--audio-seconds", type=float, default=60.0, help="narration length for the render cases")
+    ap.add_argument("--ffmpeg", default=shutil.which("ffmpeg") or "ffmpeg")
+    ap.add_argument("--latency-ms", type=float, default=StubConfig.latency_ms)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub API calls answered 429/503")
+    ap.add_argument("--realtime-factor", type=float, default=0.0, help="TTS streaming speed vs real time (0 = unthrottled)")
+    ap.add_argument("--json", help="write results here")
+    ap.add_argument("--baseline", help="results JSON from an earlier run to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs --baseline (0.25 = 25%%)")
+    ap.add_argument("--case", help=argparse.SUPPRESS)  # child mode
+    ap.add_argument("--work", help=argparse.SUPPRESS)
+    a = ap.parse_args(argv)
+    a.pages = [int(p) for p in str(a.pages).split(",") if p.strip()]
+
+    if a.case:
+        a.pages = a.pages[0]
+        run_child(a)
+        return 0
+
+    cases = [c.strip() for c in a.cases.split(",") if c.strip()]
+    unknown = set(cases) - set(ALL_CASES)
+    if unknown:
+        ap.error(f"unknown case(s): {', '.join(sorted(unknown))}")
+    print(f"{'case':<26} {'median':>10} {'throughput':>12} {'':<10} {'peak RSS':>10}")
+    results = run_cases(a, cases, a.pages)
+    if a.json:
+        meta = {"python": platform.python_version(), "platform": platform.platform(), "when": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        pathlib.Path(a.json).write_text(json.dumps({"meta": meta, "results": results}, indent=2), encoding="utf-8")
+    failed = any("error" in r for r in results)
+    if a.baseline:
+        baseline = json.loads(pathlib.Path(a.baseline).read_text(encoding="utf-8"))["results"]
+        regressions = compare(results, baseline, a.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
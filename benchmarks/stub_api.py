@@ -0,0 +1,257 @@
+"""
+Local HTTP stand-in for the OpenAI chat and ElevenLabs TTS endpoints.
+
+Point the pipelines at it with ``OPENAI_BASE_URL`` / ``ELEVENLABS_BASE_URL``
+(see :func:`vi_pipeline.http_client.resolve_url`); :meth:`StubAPI.env` returns
+both. Behaviour is deterministic for a given seed:
+
+* ``POST /v1/chat/completions`` waits ``latency_ms`` and answers with a
+  narration built from the prompt's own words.
+* ``POST /v1/text-to-speech/{voice}`` waits ``latency_ms``, then streams a
+  valid silent MP3 (``chars_per_second`` sets its length) in chunks paced
+  at ``realtime_factor`` times real time, like the live API.
+* ``error_rate`` of requests fail with 429 (``Retry-After: 0``) or 503 so the
+  shared client's retry path is exercised.
+
+:func:`answer_batch` stands in for the OpenAI batch endpoint: it turns a
+batch input JSONL (see :mod:`vi_pipeline.llm_batch`) into the results JSONL
+the endpoint would return, failing ``error_rate`` of the lines.
+
+Run standalone for manual testing:
+
+    python -m benchmarks.stub_api --port 8765 --latency-ms 200
+    python -m benchmarks.stub_api --batch requests.jsonl --batch-out results.jsonl
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, mono, no CRC: 417-byte frames of
+# 1152 samples. All-zero side info and main data decode as silence.
+_FRAME_HEADER = bytes([0xFF, 0xFB, 0x90, 0xC0])
+FRAME_BYTES = 417
+FRAME_SECONDS = 1152 / 44100
+_SILENT_FRAME = _FRAME_HEADER + bytes(FRAME_BYTES - 4)
+
+
+def silent_mp3(seconds: float) -> bytes:
+    """A decodable silent MP3 of roughly ``seconds``."""
+    return _SILENT_FRAME * max(1, round(seconds / FRAME_SECONDS))
+
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 150.0
+    error_rate: float = 0.0
+    chars_per_second: float = 15.0  # narration speed used to size the MP3
+    realtime_factor: float = 0.0  # 0 = stream as fast as possible
+    chunk_bytes: int = 8192
+    sentences: int = 16
+    seed: int = 1234
+
+
+@dataclass
+class StubStats:
+    chat: int = 0
+    tts: int = 0
+    errors: int = 0
+    tts_bytes: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, **counts: int) -> None:
+        with self.lock:
+            for name, n in counts.items():
+                setattr(self, name, getattr(self, name) + n)
+
+
+def narration_for(prompt: str, sentences: int) -> str:
+    words = re.findall(r"[A-Za-z]{3,}", prompt) or ["vehicle", "control", "button"]
+    out = []
+    for i in range(sentences):
+        picked = [words[(i * 7 + k * 3) % len(words)] for k in range(8)]
+        out.append(f"Step {i + 1}: use the {' '.join(picked).lower()}.")
+    return " ".join(out)
+
+
+def chat_completion(payload: Dict, sentences: int) -> Dict:
+    prompt = " ".join(m.get("content", "") for m in payload.get("messages", []))
+    content = narration_for(prompt, sentences)
+    # roughly 4 characters per token, like the real tokenizer on English
+    usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4}
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+    return {"object": "chat.completion", "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage}
+
+
+def answer_batch(requests_path: str, results_path: str, config: Optional[StubConfig] = None) -> StubStats:
+    """Write the results file the batch endpoint would return for ``requests_path``."""
+    cfg = config or StubConfig()
+    rng = random.Random(cfg.seed)
+    stats = StubStats()
+    with open(requests_path, encoding="utf-8") as src, open(results_path, "w", encoding="utf-8") as out:
+        for n, line in enumerate(src):
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            result = {"id": f"batch_req_{n:06d}", "custom_id": request["custom_id"], "error": None}
+            if rng.random() < cfg.error_rate:
+                stats.add(errors=1)
+                result["response"] = {"status_code": 500, "request_id": f"req_{n:06d}",
+                                      "body": {"error": {"message": "stub failure", "type": "server_error"}}}
+            else:
+                stats.add(chat=1)
+                result["response"] = {"status_code": 200, "request_id": f"req_{n:06d}",
+                                      "body": chat_completion(request.get("body") or {}, cfg.sentences)}
+            out.write(json.dumps(result) + "\n")
+    return stats
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_Server"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):  # keep benchmark output clean
+        pass
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b"{}"
+        return json.loads(body or b"{}")
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _maybe_fail(self) -> bool:
+        cfg, rng = self.server.config, self.server.rng
+        with self.server.rng_lock:
+            roll = rng.random()
+            status = rng.choice((429, 503))
+        if roll >= cfg.error_rate:
+            return False
+        self.server.stats.add(errors=1)
+        self._send_json(status, {"error": "stub failure"}, {"Retry-After": "0"})
+        return True
+
+    def do_POST(self):
+        cfg = self.server.config
+        payload = self._read_json()
+        time.sleep(cfg.latency_ms / 1000.0)
+        if self._maybe_fail():
+            return
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            self.server.stats.add(chat=1)
+            self._send_json(200, chat_completion(payload, cfg.sentences))
+        elif "/text-to-speech/" in self.path:
+            self._stream_tts(payload.get("text", ""))
+        else:
+            self._send_json(404, {"error": f"no stub for {self.path}"})
+
+    def _stream_tts(self, text: str) -> None:
+        cfg = self.server.config
+        audio = silent_mp3(max(len(text), 1) / cfg.chars_per_second)
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        per_byte = (FRAME_SECONDS / FRAME_BYTES) / cfg.realtime_factor if cfg.realtime_factor else 0.0
+        for i in range(0, len(audio), cfg.chunk_bytes):
+            chunk = audio[i:i + cfg.chunk_bytes]
+            if per_byte:
+                time.sleep(len(chunk) * per_byte)
+            self.wfile.write(f"{len(chunk):X}\r\n".encode("ascii") + chunk + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.server.stats.add(tts=1, tts_bytes=len(audio))
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, config: StubConfig):
+        super().__init__(addr, _Handler)
+        self.config = config
+        self.stats = StubStats()
+        self.rng = random.Random(config.seed)
+        self.rng_lock = threading.Lock()
+
+
+class StubAPI:
+    """Run the stand-in on a background thread (``with StubAPI() as api: ...``)."""
+
+    def __init__(self, config: Optional[StubConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.server = _Server((host, port), config or StubConfig())
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def stats(self) -> StubStats:
+        return self.server.stats
+
+    def env(self) -> Dict[str, str]:
+        """Environment that routes the pipelines (and their API-key checks) here."""
+        return {
+            "OPENAI_BASE_URL": f"{self.url}/v1",
+            "ELEVENLABS_BASE_URL": f"{self.url}/v1",
+            "OPENAI_API_KEY": "stub",
+            "ELEVENLABS_API_KEY": "stub",
+        }
+
+    def start(self) -> "StubAPI":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "StubAPI":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Local OpenAI/ElevenLabs stand-in")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency-ms", type=float, default=StubConfig.latency_ms)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--realtime-factor", type=float, default=0.0, help="TTS streaming speed vs real time (0 = unthrottled)")
+    ap.add_argument("--batch", help="Answer this batch input JSONL offline instead of serving")
+    ap.add_argument("--batch-out", help="Results JSONL for --batch (default: <batch>.results.jsonl)")
+    a = ap.parse_args()
+    if a.batch:
+        out = a.batch_out or f"{a.batch}.results.jsonl"
+        stats = answer_batch(a.batch, out, StubConfig(error_rate=a.error_rate))
+        print(f"Batch results in {out}: {stats.chat} ok, {stats.errors} failed")
+        return
+    api = StubAPI(StubConfig(latency_ms=a.latency_ms, error_rate=a.error_rate, realtime_factor=a.realtime_factor), port=a.port)
+    print(f"Stub API on {api.url}; export OPENAI_BASE_URL={api.url}/v1 ELEVENLABS_BASE_URL={api.url}/v1")
+    try:
+        api.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -54,12 +54,34 @@ import os
 import pathlib
 import subprocess
 import sys
+import tempfile
 import textwrap
-from dataclasses import dataclass
-from typing import Optional
-
-import fitz  # PyMuPDF
-import requests
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional, Union
+
+from vi_pipeline import http_client, trace
+from vi_pipeline.boilerplate import Stripper
+from vi_pipeline.cache import (
+    TTS_MAX_AGE,
+    TTS_MAX_BYTES,
+    DiskCache,
+    add_cache_args,
+    cache_mode_from_args,
+    link_or_copy,
+    llm_cache_key,
+    open_cache,
+    tts_cache_key,
+)
+from vi_pipeline.pagestore import PageStore, open_page_store
+from vi_pipeline.pdftext import read_all_text
+from vi_pipeline.search import DEFAULT_TOP_K, add_search_args, open_index, search_excerpt, text_variant
+from vi_pipeline.sections import add_section_args, load_or_build, resolve_pages
+from vi_pipeline.stages import file_sha256
+from vi_pipeline.prompt import pack
+from vi_pipeline.still import StillRenderer
+from vi_pipeline.stream import SHORTEST_FROM_PIPE, STDIN_MP3, pipe_to_ffmpeg
+from vi_pipeline.summarize import DEFAULT_MAP_WORKERS, SUMMARIZE_MODES, map_reduce
+from vi_pipeline.trace import add_trace_args, format_summary
 
 
 @dataclass
@@ -70,36 +92,81 @@ class PipelineConfig:
     vehicle_id: str
     voice_id: str = "21m00Tcm4TlvDq8ikWAM"  # default ElevenLabs voice (Rachel)
     model: str = "gpt-4"  # default OpenAI model
+    cache_mode: str = "use"  # "use", "refresh" or "off" (see --no-cache / --refresh)
+    summarize: str = "truncate"  # or "map-reduce" to cover the whole manual
+    map_workers: int = DEFAULT_MAP_WORKERS
+    extract: str = "fast"  # or "tiered" to recover scanned/thin pages
+    strip_boilerplate: bool = True  # drop repeated page headers/footers and warning boxes
+    sections: List[str] = field(default_factory=list)  # only extract pages of these sections (--section)
+    search: List[str] = field(default_factory=list)  # excerpt = best BM25 chunks for these titles (--search)
+    search_k: int = DEFAULT_TOP_K
+    video_encoder: str = "loop"  # or "still": encode the image once, 1 fps output (--video-encoder)
+    stream_audio: bool = False  # pipe TTS chunks straight into FFmpeg
+    save_audio: bool = True  # in streaming mode, also tee the MP3 to disk
+    trace_path: Optional[pathlib.Path] = None  # JSON-lines span trace (see --trace)
     # Additional parameters could be added here (e.g. audio format)
 
 
-def extract_text(pdf_path: pathlib.Path) -> str:
+def extract_text(
+    pdf_path: pathlib.Path,
+    workers: Optional[int] = None,
+    tiered: bool = False,
+    store: Optional[PageStore] = None,
+    strip: Optional[Stripper] = None,
+    pages: Optional[List[int]] = None,
+) -> str:
     """Extract all text from a PDF using PyMuPDF.
 
     Args:
         pdf_path: Path to the PDF file.
+        workers: Extraction processes. ``None`` shards long manuals across a
+            process pool automatically; ``1`` forces a single pass.
+        tiered: Re-read pages with little extractable text using pdfminer,
+            then OCR for scanned pages (see :mod:`vi_pipeline.tiered`).
+        store: Optional page-text store. Pages it already holds for this
+            PDF's SHA-256 are read from it instead of the PDF, and newly
+            extracted pages are added to it.
+        strip: Optional boilerplate stripper (see
+            :mod:`vi_pipeline.boilerplate`) applied to every page.
+        pages: Optional 0-based page indices to extract instead of the
+            whole document (see :mod:`vi_pipeline.sections`).
 
     Returns:
         A single string containing the concatenated text from all pages.
     """
-    doc = fitz.open(pdf_path)
-    text = []
-    for page in doc:
-        text.append(page.get_text())
-    doc.close()
-    return "\n".join(text)
+    return read_all_text(
+        str(pdf_path), sep="\n", workers=workers, tiered=tiered, store=store, strip=strip, pages=pages
+    )
 
 
-def generate_script(manual_text: str, openai_api_key: str, model: str = "gpt-4") -> str:
-    """Generate a concise narration script from the manual text using OpenAI.
+SCRIPT_SYSTEM_PROMPT = (
+    "You are an automotive trainer. Summarise the following vehicle manual "
+    "into a friendly narration script that can be read aloud in 8–10 minutes."
+)
+SCRIPT_USER_TEMPLATE = "{text}"
+SCRIPT_TEMPERATURE = 0.5
 
-    Args:
-        manual_text: The raw text extracted from the PDF manual.
-        openai_api_key: Your OpenAI API key.
-        model: The OpenAI model to use for summarisation.
 
-    Returns:
-        A narration script suitable for a how‑to video.
+# Map-reduce condenses the joined section summaries again above this size
+SCRIPT_MAX_CHARS = 15000
+# Manual excerpt budget for the script prompt, in tokens of the configured model
+SCRIPT_MAX_TOKENS = 3750
+# (connect, read) seconds; the shared client also retries 429/5xx with backoff
+OPENAI_TIMEOUT = (10, 120)
+TTS_TIMEOUT = (10, 240)
+TTS_MODEL_ID = "eleven_monolingual_v1"
+TTS_STABILITY = 0.75
+TTS_SIMILARITY_BOOST = 0.75
+
+
+def chat_completion(
+    system_prompt: str,
+    user_prompt: str,
+    openai_api_key: str,
+    model: str = "gpt-4",
+    temperature: float = SCRIPT_TEMPERATURE,
+) -> str:
+    """Send one chat completion request and return the message text.
 
     Raises:
         RuntimeError: If the API response is not successful or missing content.
@@ -108,63 +175,173 @@ def generate_script(manual_text: str, openai_api_key: str, model: str = "gpt-4")
         "Authorization": f"Bearer {openai_api_key}",
         "Content-Type": "application/json",
     }
-    # Frame the prompt to cast the assistant as an automotive trainer and limit
-    # the response length. You can tweak the prompt to suit your needs.
-    system_prompt = (
-        "You are an automotive trainer. Summarise the following vehicle manual "
-        "into a friendly narration script that can be read aloud in 8–10 minutes."
-    )
-    # We truncate extremely long manuals for the model's context window. Users
-    # should consider splitting long manuals into sections for better quality.
-    max_chars = 15000
-    truncated_text = manual_text[:max_chars]
     messages = [
         {"role": "system", "content": system_prompt},
-        {"role": "user", "content": truncated_text},
+        {"role": "user", "content": user_prompt},
     ]
     data = {
         "model": model,
         "messages": messages,
-        "temperature": 0.5,
+        "temperature": temperature,
     }
-    response = requests.post(
-        "https://api.openai.com/v1/chat/completions", headers=headers, json=data
+    response = http_client.post(
+        "https://api.openai.com/v1/chat/completions",
+        headers=headers,
+        json=data,
+        timeout=OPENAI_TIMEOUT,
     )
     if response.status_code != 200:
         raise RuntimeError(
             f"OpenAI API returned status {response.status_code}: {response.text}"
         )
     result = response.json()
+    trace.note_usage(result)
     try:
         return result["choices"][0]["message"]["content"].strip()
     except (KeyError, IndexError) as exc:
         raise RuntimeError(f"Unexpected OpenAI response: {result}") from exc
 
 
+def generate_script(
+    manual_text: str,
+    openai_api_key: str,
+    model: str = "gpt-4",
+    cache: Optional[DiskCache] = None,
+) -> str:
+    """Generate a concise narration script from the manual text using OpenAI.
+
+    Args:
+        manual_text: The raw text extracted from the PDF manual.
+        openai_api_key: Your OpenAI API key.
+        model: The OpenAI model to use for summarisation.
+        cache: Optional script cache. A hit on the same text, model and
+            prompt skips the API call entirely.
+
+    Returns:
+        A narration script suitable for a how‑to video.
+
+    Raises:
+        RuntimeError: If the API response is not successful or missing content.
+    """
+    # Long manuals are cut to whole paragraphs within a token budget for the
+    # model's context window. Use summarise_manual() to cover the whole manual.
+    packed = pack(manual_text, SCRIPT_MAX_TOKENS, model)
+    print(f"[pipeline] Manual excerpt: {packed.describe()}")
+    truncated_text = packed.text
+    key = llm_cache_key(
+        truncated_text, model, SCRIPT_SYSTEM_PROMPT, SCRIPT_USER_TEMPLATE, SCRIPT_TEMPERATURE
+    )
+    if cache is not None:
+        cached = cache.get_text(key)
+        if cached is not None:
+            return cached
+
+    # Frame the prompt to cast the assistant as an automotive trainer and limit
+    # the response length. You can tweak the prompt to suit your needs.
+    script = chat_completion(
+        SCRIPT_SYSTEM_PROMPT,
+        SCRIPT_USER_TEMPLATE.format(text=truncated_text),
+        openai_api_key,
+        model=model,
+        temperature=SCRIPT_TEMPERATURE,
+    )
+    if cache is not None:
+        cache.put_text(key, script)
+    return script
+
+
+def summarise_manual(
+    manual_text: str,
+    openai_api_key: str,
+    model: str = "gpt-4",
+    cache: Optional[DiskCache] = None,
+    workers: int = DEFAULT_MAP_WORKERS,
+) -> str:
+    """Generate the narration script from the whole manual via map-reduce.
+
+    Section-aligned chunks are summarised concurrently (at most ``workers``
+    requests in flight, each cached per chunk), then :func:`generate_script`
+    merges the partial summaries into the final script.
+    """
+    return map_reduce(
+        manual_text,
+        complete=lambda system, user, temperature: chat_completion(
+            system, user, openai_api_key, model=model, temperature=temperature
+        ),
+        reduce=lambda summaries: generate_script(summaries, openai_api_key, model=model, cache=cache),
+        model=model,
+        reduce_budget=SCRIPT_MAX_CHARS,
+        workers=workers,
+        cache=cache,
+        log=lambda msg: print(f"[pipeline] {msg}"),
+    )
+
+
 def generate_audio(
     script_text: str,
     elevenlabs_api_key: str,
+    output_path: pathlib.Path,
     voice_id: str = "21m00Tcm4TlvDq8ikWAM",
-    model_id: str = "eleven_monolingual_v1",
-    stability: float = 0.75,
-    similarity_boost: float = 0.75,
-) -> bytes:
+    model_id: str = TTS_MODEL_ID,
+    stability: float = TTS_STABILITY,
+    similarity_boost: float = TTS_SIMILARITY_BOOST,
+    cache: Optional[DiskCache] = None,
+) -> pathlib.Path:
     """Call the ElevenLabs API to generate an MP3 audio from the narration script.
 
+    The response is streamed to ``output_path`` chunk by chunk through a
+    temporary file, so the MP3 is never held in memory.
+
     Args:
         script_text: The narration script to be read.
         elevenlabs_api_key: Your ElevenLabs API key.
+        output_path: Where to write the MP3.
         voice_id: The identifier of the voice to use (see ElevenLabs voices).
         model_id: The TTS model ID.
         stability: Voice stability setting (0.0–1.0).
         similarity_boost: Voice similarity boost setting (0.0–1.0).
+        cache: Optional audio cache keyed on the normalised text, voice, model
+            and voice settings.
 
     Returns:
-        Binary audio data (MP3).
+        ``output_path``.
 
     Raises:
         RuntimeError: If the API request fails.
     """
+
+    def produce(path: pathlib.Path) -> None:
+        write_binary_file(
+            path,
+            stream_audio(
+                script_text,
+                elevenlabs_api_key,
+                voice_id=voice_id,
+                model_id=model_id,
+                stability=stability,
+                similarity_boost=similarity_boost,
+            ),
+        )
+
+    output_path = pathlib.Path(output_path)
+    if cache is None:
+        produce(output_path)
+    else:
+        key = tts_cache_key(script_text, voice_id, model_id, stability, similarity_boost)
+        cache.fetch_file(key, output_path, produce)
+    return output_path
+
+
+def _tts_request(
+    script_text: str,
+    elevenlabs_api_key: str,
+    voice_id: str,
+    model_id: str,
+    stability: float,
+    similarity_boost: float,
+    stream: bool = False,
+):
+    trace.add(tts_chars=len(script_text))
     url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
     headers = {
         "xi-api-key": elevenlabs_api_key,
@@ -178,23 +355,102 @@ def generate_audio(
             "similarity_boost": similarity_boost,
         },
     }
-    response = requests.post(url, headers=headers, json=payload)
+    response = http_client.post(
+        url, headers=headers, json=payload, timeout=TTS_TIMEOUT, stream=stream
+    )
     if response.status_code != 200:
         raise RuntimeError(
             f"ElevenLabs API returned status {response.status_code}: {response.text}"
         )
-    return response.content
+    return response
 
 
-def write_binary_file(path: pathlib.Path, data: bytes) -> None:
-    """Write binary data to a file, ensuring the parent directory exists."""
+def stream_audio(
+    script_text: str,
+    elevenlabs_api_key: str,
+    voice_id: str = "21m00Tcm4TlvDq8ikWAM",
+    model_id: str = TTS_MODEL_ID,
+    stability: float = TTS_STABILITY,
+    similarity_boost: float = TTS_SIMILARITY_BOOST,
+    chunk_size: int = 8192,
+) -> Iterator[bytes]:
+    """Like :func:`generate_audio`, but yield the MP3 as it downloads.
+
+    The request is sent on the first ``next()``, so the caller can start its
+    consumer (e.g. FFmpeg) before any audio has arrived.
+
+    Raises:
+        RuntimeError: If the API request fails.
+    """
+    response = _tts_request(
+        script_text,
+        elevenlabs_api_key,
+        voice_id,
+        model_id,
+        stability,
+        similarity_boost,
+        stream=True,
+    )
+    with response:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if chunk:
+                yield chunk
+
+
+def write_binary_file(path: pathlib.Path, data: Union[bytes, Iterable[bytes]]) -> None:
+    """Write binary data (bytes or an iterable of chunks) to a file, ensuring
+    the parent directory exists.
+
+    The data goes to a temporary file that is renamed over ``path``, so a
+    ``path`` hardlinked to a cache entry is replaced, never overwritten.
+    """
     path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "wb") as f:
-        f.write(data)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if isinstance(data, (bytes, bytearray)):
+                f.write(data)
+            else:
+                for chunk in data:
+                    f.write(chunk)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def fetch_audio(
+    config: PipelineConfig,
+    script_text: str,
+    elevenlabs_api_key: str,
+    audio_path: pathlib.Path,
+    cache: DiskCache,
+) -> bool:
+    """Materialise the narration at ``audio_path`` from the TTS cache, synthesising on a miss.
+
+    Goes through :meth:`DiskCache.fetch_file` like pipeline_v2/v3, so the
+    output is a fresh link to the cache entry and is never written in place.
+    Returns True on a cache hit.
+    """
+    key = tts_cache_key(
+        script_text, config.voice_id, TTS_MODEL_ID, TTS_STABILITY, TTS_SIMILARITY_BOOST
+    )
+    return cache.fetch_file(
+        key,
+        audio_path,
+        lambda tmp: generate_audio(script_text, elevenlabs_api_key, tmp, voice_id=config.voice_id),
+    )
 
 
 def create_video(
-    image_path: pathlib.Path, audio_path: pathlib.Path, output_path: pathlib.Path
+    image_path: pathlib.Path,
+    audio_path: pathlib.Path,
+    output_path: pathlib.Path,
+    encoder: str = "loop",
+    still_cache: Optional[DiskCache] = None,
 ) -> None:
     """Use FFmpeg to combine a static image and an audio track into an MP4.
 
@@ -202,18 +458,53 @@ def create_video(
         image_path: Path to the background image file.
         audio_path: Path to the MP3 audio file.
         output_path: Path where the resulting MP4 should be written.
+        encoder: ``"loop"`` re-encodes the looped image for the whole
+            duration (25 fps H.264 + AAC); ``"still"`` encodes the image once
+            as a 1 fps keyframe clip and remuxes it under the audio (see
+            :mod:`vi_pipeline.still`), so render time barely depends on
+            narration length. Both write AAC audio. A failed still render
+            falls back to ``"loop"``.
+        still_cache: Optional cache for the encoded image clip.
     """
     # Ensure output directory exists
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    cmd = [
+    if encoder == "still":
+        renderer = StillRenderer("ffmpeg", still_cache)
+        try:
+            renderer.render(image_path, audio_path, output_path, audio_codec="aac")
+            return
+        except RuntimeError as exc:
+            print(f"[pipeline] Still render failed, re-encoding: {str(exc).splitlines()[0]}")
+        finally:
+            renderer.close()
+    cmd = video_command(image_path, ["-i", str(audio_path)], output_path)
+    # Run FFmpeg and capture output. If FFmpeg is not on PATH this will raise
+    # FileNotFoundError.
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    trace.note_ffmpeg(result.returncode)
+    result.check_returncode()
+
+
+def video_command(
+    image_path: pathlib.Path, audio_input: List[str], output_path: pathlib.Path
+) -> List[str]:
+    """FFmpeg command pairing a looped still image with one audio input.
+
+    Args:
+        image_path: Path to the background image file.
+        audio_input: Input arguments for the audio, e.g. ``["-i", "a.mp3"]``
+            or :data:`vi_pipeline.stream.STDIN_MP3`.
+        output_path: Path where the resulting MP4 should be written.
+    """
+    shortest = SHORTEST_FROM_PIPE if audio_input == STDIN_MP3 else ["-shortest"]
+    return [
         "ffmpeg",
         "-y",  # overwrite output if it exists
         "-loop",
         "1",
         "-i",
         str(image_path),
-        "-i",
-        str(audio_path),
+        *audio_input,
         "-c:v",
         "libx264",
         "-tune",
@@ -222,12 +513,89 @@ def create_video(
         "aac",
         "-b:a",
         "192k",
-        "-shortest",
+        *shortest,
         str(output_path),
     ]
-    # Run FFmpeg and capture output. If FFmpeg is not on PATH this will raise
-    # FileNotFoundError.
-    subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def create_video_from_stream(
+    image_path: pathlib.Path,
+    audio_chunks: Iterable[bytes],
+    output_path: pathlib.Path,
+    tee_path: Optional[pathlib.Path] = None,
+) -> None:
+    """Like :func:`create_video`, but feed the audio to FFmpeg's stdin as it arrives.
+
+    Encoding overlaps the TTS download instead of waiting for the whole
+    file, and the audio is never held in memory.
+
+    Args:
+        image_path: Path to the background image file.
+        audio_chunks: MP3 bytes, e.g. from :func:`stream_audio`.
+        output_path: Path where the resulting MP4 should be written.
+        tee_path: If given, the MP3 is also written here.
+
+    Raises:
+        RuntimeError: If FFmpeg exits with an error.
+    """
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    cmd = video_command(image_path, STDIN_MP3, output_path)
+    result = pipe_to_ffmpeg(audio_chunks, cmd, tee=tee_path)
+    if result.returncode != 0:
+        raise RuntimeError(
+            "FFmpeg failed: " + result.stderr.decode(errors="ignore")[-2000:]
+        )
+
+
+def stream_to_video(
+    config: PipelineConfig,
+    script_text: str,
+    elevenlabs_api_key: str,
+    audio_path: pathlib.Path,
+    video_path: pathlib.Path,
+    cache: DiskCache,
+) -> None:
+    """Synthesise and encode in one pass (``--stream``).
+
+    A cache hit is rendered from the cached file. On a miss the download is
+    teed to a temporary file only when the cache or ``save_audio`` needs it.
+    """
+    key = tts_cache_key(
+        script_text, config.voice_id, TTS_MODEL_ID, TTS_STABILITY, TTS_SIMILARITY_BOOST
+    )
+    cached = cache.get_path(key)
+    if cached is not None:
+        if config.save_audio:
+            link_or_copy(cached, audio_path)
+        create_video(
+            config.image_path,
+            cached,
+            video_path,
+            encoder=config.video_encoder,
+            still_cache=open_cache("still", mode=config.cache_mode, suffix=".mp4"),
+        )
+        return
+
+    chunks = stream_audio(script_text, elevenlabs_api_key, voice_id=config.voice_id)
+    keep = cache.mode != "off" or config.save_audio
+    tee = audio_path.with_name(audio_path.name + ".part") if keep else None
+    if tee is not None:
+        tee.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        create_video_from_stream(config.image_path, chunks, video_path, tee_path=tee)
+    except BaseException:
+        if tee is not None and tee.exists():
+            tee.unlink()
+        raise
+    if tee is None:
+        return
+    entry = cache.put_file(key, tee, evict=False)
+    if entry is None:
+        os.replace(tee, audio_path)
+        return
+    if config.save_audio:
+        link_or_copy(entry, audio_path)
+    cache.record_write(entry.stat().st_size)
 
 
 def run_pipeline(config: PipelineConfig) -> None:
@@ -241,12 +609,69 @@ def run_pipeline(config: PipelineConfig) -> None:
 
     # 1. Extract text from the manual
     print(f"[pipeline] Extracting text from {config.pdf_path}...")
-    manual_text = extract_text(config.pdf_path)
+    with trace.span("extract", vehicle=config.vehicle_id) as span:
+        strip = None
+        if config.strip_boilerplate:
+            strip = Stripper.for_pdf(
+                str(config.pdf_path),
+                cache=open_cache("boilerplate", mode=config.cache_mode, suffix=".json"),
+            )
+        pages = None
+        if config.sections:
+            index = load_or_build(
+                config.pdf_path, config.output_dir / f"{config.vehicle_id}_sections.json"
+            )
+            pages = resolve_pages(index, config.sections)
+            span.set(pages=len(pages))
+            print(f"[pipeline] Sections {', '.join(config.sections)}: {len(pages)} pages")
+        manual_text = extract_text(
+            config.pdf_path,
+            tiered=config.extract == "tiered",
+            store=open_page_store(mode=config.cache_mode),
+            strip=strip,
+            pages=pages,
+        )
+        span.set(bytes_in=config.pdf_path.stat().st_size, chars_out=len(manual_text))
+        if strip is not None:
+            span.set(boilerplate_bytes=strip.bytes_removed)
+            print(f"[pipeline] Boilerplate: {strip.describe()}")
     print(f"[pipeline] Extracted {len(manual_text)} characters of text.")
 
+    if config.search and config.summarize == "truncate":
+        # The excerpt is the manual chunks that best match the feature titles,
+        # from a BM25 index built once per manual
+        with trace.span("search", vehicle=config.vehicle_id) as span:
+            index = open_index(
+                open_cache("bm25", mode=config.cache_mode, suffix=".vibm25"),
+                file_sha256(config.pdf_path),
+                text_variant(config.extract == "tiered", strip is not None, pages),
+                lambda: read_all_text(
+                    str(config.pdf_path), sep="\n\n", tiered=config.extract == "tiered",
+                    store=open_page_store(mode=config.cache_mode),
+                    strip=None if strip is None else strip.fresh(), pages=pages,
+                ),
+            )
+            packed = search_excerpt(index, config.search, SCRIPT_MAX_TOKENS, config.model, k=config.search_k)
+            span.set(chunks=len(index.chunks), excerpt_tokens=packed.tokens)
+        print(f"[pipeline] Search excerpt for {', '.join(config.search)}: {packed.describe()}")
+        manual_text = packed.text
+
     # 2. Generate narration script via OpenAI
     print("[pipeline] Generating narration script via OpenAI...")
-    script_text = generate_script(manual_text, openai_key, model=config.model)
+    llm_cache = open_cache("llm", mode=config.cache_mode, suffix=".txt")
+    with trace.span("script", vehicle=config.vehicle_id):
+        if config.summarize == "map-reduce":
+            script_text = summarise_manual(
+                manual_text,
+                openai_key,
+                model=config.model,
+                cache=llm_cache,
+                workers=config.map_workers,
+            )
+        else:
+            script_text = generate_script(
+                manual_text, openai_key, model=config.model, cache=llm_cache
+            )
     print(f"[pipeline] Generated script ({len(script_text.split())} words).")
 
     # Save the script to disk for reference
@@ -255,21 +680,43 @@ def run_pipeline(config: PipelineConfig) -> None:
     script_path.write_text(script_text, encoding="utf-8")
 
     # 3. Generate audio via ElevenLabs
-    print("[pipeline] Generating audio narration via ElevenLabs...")
-    audio_data = generate_audio(
-        script_text,
-        eleven_key,
-        voice_id=config.voice_id,
+    tts_cache = open_cache(
+        "tts",
+        mode=config.cache_mode,
+        suffix=".mp3",
+        max_bytes=TTS_MAX_BYTES,
+        max_age=TTS_MAX_AGE,
     )
     audio_path = config.output_dir / f"{config.vehicle_id}_audio.mp3"
-    write_binary_file(audio_path, audio_data)
-    print(f"[pipeline] Audio saved to {audio_path}")
-
-    # 4. Create video using FFmpeg
-    print("[pipeline] Creating video with FFmpeg...")
     video_path = config.output_dir / f"{config.vehicle_id}_video.mp4"
-    create_video(config.image_path, audio_path, video_path)
-    print(f"[pipeline] Video saved to {video_path}")
+    if config.stream_audio:
+        # 3+4. Stream the narration straight into FFmpeg
+        print("[pipeline] Streaming ElevenLabs audio into FFmpeg...")
+        with trace.span("stream", vehicle=config.vehicle_id) as span:
+            stream_to_video(config, script_text, eleven_key, audio_path, video_path, tts_cache)
+            span.set(bytes_out=video_path.stat().st_size)
+        if config.save_audio:
+            print(f"[pipeline] Audio saved to {audio_path}")
+        print(f"[pipeline] Video saved to {video_path}")
+    else:
+        print("[pipeline] Generating audio narration via ElevenLabs...")
+        with trace.span("tts", vehicle=config.vehicle_id) as span:
+            hit = fetch_audio(config, script_text, eleven_key, audio_path, tts_cache)
+            span.set(bytes_out=audio_path.stat().st_size, cached=hit)
+        print(f"[pipeline] Audio saved to {audio_path}")
+
+        # 4. Create video using FFmpeg
+        print("[pipeline] Creating video with FFmpeg...")
+        with trace.span("video", vehicle=config.vehicle_id) as span:
+            create_video(
+                config.image_path,
+                audio_path,
+                video_path,
+                encoder=config.video_encoder,
+                still_cache=open_cache("still", mode=config.cache_mode, suffix=".mp4"),
+            )
+            span.set(bytes_in=audio_path.stat().st_size, bytes_out=video_path.stat().st_size)
+        print(f"[pipeline] Video saved to {video_path}")
 
     print("[pipeline] Done.")
 
@@ -311,6 +758,54 @@ def parse_args(argv: Optional[list[str]] = None) -> PipelineConfig:
         default="gpt-4",
         help="OpenAI model to use for summarisation (default: gpt-4)",
     )
+    parser.add_argument(
+        "--summarize",
+        choices=SUMMARIZE_MODES,
+        default="truncate",
+        help="truncate: whole paragraphs up to 3750 tokens (default); map-reduce: summarise every section",
+    )
+    parser.add_argument(
+        "--map-workers",
+        type=int,
+        default=DEFAULT_MAP_WORKERS,
+        help="Concurrent section summaries in map-reduce mode",
+    )
+    parser.add_argument(
+        "--keep-boilerplate",
+        action="store_false",
+        dest="strip_boilerplate",
+        help="Keep repeated page headers, footers and warning boxes in the extracted text",
+    )
+    parser.add_argument(
+        "--extract",
+        choices=("fast", "tiered"),
+        default="fast",
+        help="fast: PyMuPDF only (default); tiered: escalate thin pages to pdfminer, then OCR",
+    )
+    parser.add_argument(
+        "--video-encoder",
+        choices=("still", "loop"),
+        default="loop",
+        help="loop: re-encode the looped image for the whole narration (default); "
+        "still: encode the image once and remux it under the audio, much faster "
+        "but the video track is 1 fps",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        dest="stream_audio",
+        help="Pipe the TTS download straight into FFmpeg instead of buffering it",
+    )
+    parser.add_argument(
+        "--no-save-audio",
+        action="store_false",
+        dest="save_audio",
+        help="With --stream, do not write the narration MP3 to the output directory",
+    )
+    add_section_args(parser)
+    add_search_args(parser)
+    add_cache_args(parser)
+    add_trace_args(parser)
     args = parser.parse_args(argv)
     return PipelineConfig(
         pdf_path=args.pdf,
@@ -319,16 +814,35 @@ def parse_args(argv: Optional[list[str]] = None) -> PipelineConfig:
         vehicle_id=args.vehicle_id,
         voice_id=args.voice_id,
         model=args.model,
+        cache_mode=cache_mode_from_args(args),
+        summarize=args.summarize,
+        map_workers=args.map_workers,
+        extract=args.extract,
+        strip_boilerplate=args.strip_boilerplate,
+        sections=args.sections,
+        search=args.search,
+        search_k=args.search_k,
+        video_encoder=args.video_encoder,
+        stream_audio=args.stream_audio,
+        save_audio=args.save_audio,
+        trace_path=pathlib.Path(args.trace) if args.trace else None,
     )
 
 
 def main(argv: Optional[list[str]] = None) -> int:
     config = parse_args(argv)
+    tracer = trace.configure(config.trace_path)
     try:
-        run_pipeline(config)
+        with trace.span("vehicle", vehicle=config.vehicle_id):
+            run_pipeline(config)
     except Exception as exc:
         print(f"[pipeline] Error: {exc}", file=sys.stderr)
         return 1
+    finally:
+        summary = tracer.close()
+        if config.trace_path is not None:
+            print(f"[pipeline] Trace written to {config.trace_path}")
+            print(format_summary(summary))
     return 0
 
 
@@ -2,59 +2,143 @@
 # pipeline_v3.py - Multi-segment PDF -> script -> TTS -> slideshow video
 # Usage:
 #   py scripts/pipeline_v3.py --pdf "C:\path\manual.pdf" --images "C:\img1.jpg;C:\img2.jpg;C:\img3.jpg" --output "C:\out" --vehicle "camry-2025" --ffmpeg "C:\ffmpeg\bin\ffmpeg.exe" --model gpt-4o
-import argparse, os, json, textwrap, time, tempfile, subprocess, sys
+import argparse, os, tempfile, subprocess, sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-# External deps: PyMuPDF (import name 'fitz'), requests
-import fitz  # PyMuPDF
-import requests
+# External deps: PyMuPDF (import name 'fitz', used via vi_pipeline.pdftext), requests (via vi_pipeline.http_client)
+from vi_pipeline import http_client, trace
+from vi_pipeline.boilerplate import Stripper
+from vi_pipeline.cache import TTS_MAX_AGE, TTS_MAX_BYTES, add_cache_args, cache_mode_from_args, llm_cache_key, open_cache, tts_cache_key
+from vi_pipeline.captions import CAPTION_WEIGHTS, build_cues, write_webvtt
+from vi_pipeline.concurrency import PROVIDER_QUOTAS, RateLimiter, positive_int, stage_slot
+from vi_pipeline.llm_batch import batch_request
+from vi_pipeline.mp3 import locate_segments, probe, probe_many
+from vi_pipeline.pagestore import open_page_store
+from vi_pipeline.pdftext import read_all_text, read_token_budget
+from vi_pipeline.sections import SECTION_INDEX_VERSION, SectionIndex, add_section_args, build_index, resolve_pages
+from vi_pipeline.search import add_search_args, open_index, search_excerpt, text_variant
+from vi_pipeline.segmenter import SpeechModel, split_balanced
+from vi_pipeline.stages import StageManifest, file_sha256
+from vi_pipeline.still import STILL_AUDIO_CODECS, StillRenderer
+from vi_pipeline.stream import SHORTEST_FROM_PIPE, STDIN_MP3, pipe_to_ffmpeg
+from vi_pipeline.summarize import DEFAULT_MAP_WORKERS, SUMMARIZE_MODES, map_reduce
+from vi_pipeline.trace import add_trace_args, format_summary
 
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
 ELEVEN_API_KEY = os.environ.get("ELEVENLABS_API_KEY", "")
 
-def read_pdf_text(pdf_path, max_chars=4000):
-    doc = fitz.open(pdf_path)
-    chunks = []
-    for page in doc:
-        t = page.get_text().strip()
-        if t:
-            chunks.append(t)
-    full = "\n\n".join(chunks)
-    return full[:max_chars]
+# Shared by every vehicle in the process so batch runs respect the account quota.
+# Env/CLI overrides are applied (and validated) by configure_tts_limiter().
+TTS_LIMITER = RateLimiter(**PROVIDER_QUOTAS["elevenlabs"])
+# Narration scripts keyed on (excerpt, model, prompts, temperature); see --no-cache / --refresh
+LLM_CACHE = open_cache("llm", suffix=".txt")
+# Segment MP3s, hardlinked into the output dir on a hit
+TTS_CACHE = open_cache("tts", suffix=".mp3", max_bytes=TTS_MAX_BYTES, max_age=TTS_MAX_AGE)
+# Encoded once-per-image still clips for --render segments (see vi_pipeline.still)
+STILL_CACHE = open_cache("still", suffix=".mp4")
+# BM25 chunk indexes per manual for --search excerpts (see vi_pipeline.search)
+SEARCH_CACHE = open_cache("bm25", suffix=".vibm25")
+# Sampled header/footer line counts per manual (see vi_pipeline.boilerplate)
+BOILERPLATE_CACHE = open_cache("boilerplate", suffix=".json")
+# Per-page manual text keyed by PDF hash, shared with the other pipelines and workers
+PAGE_STORE = open_page_store()
 
-def openai_summarize_to_script(text, model="gpt-4o"):
+def read_pdf_text(pdf_path, max_tokens=1500, model="gpt-4o", tiered=False, strip=None, pages=None):
+    # Whole paragraphs up to a token budget for the model (vi_pipeline.prompt); pages
+    # are extracted lazily and extraction stops once the budget is met;
+    # tiered re-reads thin/scanned pages with pdfminer, then OCR; `strip` is a
+    # vi_pipeline.boilerplate.Stripper dropping repeated headers/footers first;
+    # `pages` limits extraction to those page indices (one section)
+    return read_token_budget(pdf_path, max_tokens, model, tiered=tiered, store=PAGE_STORE, strip=strip, pages=pages)
+
+def search_pdf_text(pdf_path, queries, max_tokens=1500, model="gpt-4o", tiered=False, strip=None, pages=None, k=8):
+    # Best-matching ~900-char chunks for the feature titles, from a BM25 index
+    # built once per manual (and extraction variant) and kept in SEARCH_CACHE
+    index = open_index(SEARCH_CACHE, file_sha256(pdf_path), text_variant(tiered, strip is not None, pages),
+                       lambda: read_all_text(pdf_path, sep="\n\n", tiered=tiered, store=PAGE_STORE, strip=strip, pages=pages))
+    return search_excerpt(index, queries, max_tokens, model, k=k)
+
+SCRIPT_SYSTEM_PROMPT = "You are a technical writer. Produce a first-person narrated, step-by-step script for a car owner to follow. Keep it clear, concrete, and broken into numbered steps with short sentences."
+SCRIPT_USER_TEMPLATE = "Create an instructional narration script from this manual excerpt. 12-16 sentences total.:\n\n{text}"
+SCRIPT_TEMPERATURE = 0.4
+
+def chat_payload(system, user, model="gpt-4o", temperature=SCRIPT_TEMPERATURE):
+    messages = [
+        {"role":"system","content":system},
+        {"role":"user","content":user}
+    ]
+    return {"model": model, "messages": messages, "temperature": temperature}
+
+def openai_chat(system, user, model="gpt-4o", temperature=SCRIPT_TEMPERATURE):
     if not OPENAI_API_KEY:
         raise SystemExit("OPENAI_API_KEY env var not set.")
     url = "https://api.openai.com/v1/chat/completions"
-    messages = [
-        {"role":"system","content":"You are a technical writer. Produce a first-person narrated, step-by-step script for a car owner to follow. Keep it clear, concrete, and broken into numbered steps with short sentences."},
-        {"role":"user","content":f"Create an instructional narration script from this manual excerpt. 12-16 sentences total.:\n\n{text}"}
-    ]
     headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
-    payload = {"model": model, "messages": messages, "temperature": 0.4}
-    r = requests.post(url, headers=headers, json=payload, timeout=120)
+    payload = chat_payload(system, user, model=model, temperature=temperature)
+    r = http_client.post(url, headers=headers, json=payload, timeout=120)
     if r.status_code != 200:
         raise SystemExit(f"OpenAI error {r.status_code}: {r.text}")
-    return r.json()["choices"][0]["message"]["content"].strip()
+    data = r.json()
+    trace.note_usage(data)
+    return data["choices"][0]["message"]["content"].strip()
+
+def script_cache_key(text, model="gpt-4o"):
+    return llm_cache_key(text, model, SCRIPT_SYSTEM_PROMPT, SCRIPT_USER_TEMPLATE, SCRIPT_TEMPERATURE)
+
+def script_batch_request(text, model="gpt-4o"):
+    # The request openai_summarize_to_script would send, as an offline batch line
+    # whose custom_id is its LLM_CACHE key (see vi_pipeline.llm_batch)
+    payload = chat_payload(SCRIPT_SYSTEM_PROMPT, SCRIPT_USER_TEMPLATE.format(text=text), model=model)
+    return batch_request(script_cache_key(text, model), payload)
+
+def openai_summarize_to_script(text, model="gpt-4o"):
+    key = script_cache_key(text, model)
+    cached = LLM_CACHE.get_text(key)
+    if cached is not None:
+        return cached
+    script = openai_chat(SCRIPT_SYSTEM_PROMPT, SCRIPT_USER_TEMPLATE.format(text=text), model=model)
+    LLM_CACHE.put_text(key, script)
+    return script
+
+# Reduce input for --summarize map-reduce: merged section summaries are kept
+# under this many characters before the final script call.
+REDUCE_MAX_CHARS = 12000
+
+def map_reduce_to_script(text, model="gpt-4o", workers=DEFAULT_MAP_WORKERS, limits=None):
+    # Whole manual -> per-section summaries (concurrent, cached) -> narration script;
+    # every map and reduce call takes its own "llm" slot from `limits`
+    return map_reduce(
+        text,
+        complete=lambda system, user, temperature: openai_chat(system, user, model=model, temperature=temperature),
+        reduce=lambda summaries: openai_summarize_to_script(summaries, model=model),
+        model=model, reduce_budget=REDUCE_MAX_CHARS, workers=workers, cache=LLM_CACHE,
+        log=lambda msg: print(f"[v3] {msg}"), slot=lambda: stage_slot(limits, "llm"),
+    )
+
+# Speaking-time model for balancing segments; fit it with `python -m vi_pipeline.segmenter <manifests>`
+SPEECH_MODEL = SpeechModel()
 
 def split_script_into_segments(script, n_segments):
-    # Split into sentences/lines and distribute across segments
-    lines = [ln.strip() for ln in script.splitlines() if ln.strip()]
-    # flatten if it's numbered
-    flat = []
-    for ln in lines:
-        flat.extend([s.strip() for s in ln.replace("•","- ").split(". ") if s.strip()])
-    if not flat:
-        flat = [script]
-    # chunk evenly
-    segs = [[] for _ in range(n_segments)]
-    for i, sentence in enumerate(flat):
-        segs[i % n_segments].append(sentence if sentence.endswith(".") else sentence + ".")
-    return [" ".join(s) for s in segs]
-
-def eleven_tts(text, out_mp3, voice_id="21m00Tcm4TlvDq8ikWAM"):  # default Rachel
+    # Contiguous runs of sentences, balanced by estimated speaking time so no
+    # single segment dominates the concurrent TTS/render wall time
+    return split_balanced(script, n_segments, SPEECH_MODEL)
+
+TTS_MODEL_ID = "eleven_turbo_v2"
+TTS_VOICE_ID = "21m00Tcm4TlvDq8ikWAM"  # Rachel
+TTS_VOICE_SETTINGS = {"stability": 0.4, "similarity_boost": 0.7}
+
+def eleven_tts(text, out_mp3, voice_id=TTS_VOICE_ID, on_stream=None):
+    # Cached per (normalised text, voice, model, settings); only misses hit the API.
+    # On a miss, on_stream(chunks, path) may consume the download instead of it being
+    # written straight to disk; it must write every chunk to path. Returns True on a hit.
+    key = tts_cache_key(text, voice_id, TTS_MODEL_ID, TTS_VOICE_SETTINGS["stability"], TTS_VOICE_SETTINGS["similarity_boost"])
+    return TTS_CACHE.fetch_file(key, Path(out_mp3), lambda tmp: _eleven_tts_request(text, tmp, voice_id, on_stream))
+
+def _eleven_tts_request(text, out_mp3, voice_id, on_stream=None):
     if not ELEVEN_API_KEY:
         raise SystemExit("ELEVENLABS_API_KEY env var not set.")
+    trace.add(tts_chars=len(text))
     url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
     headers = {
         "xi-api-key": ELEVEN_API_KEY,
@@ -63,114 +147,426 @@ def eleven_tts(text, out_mp3, voice_id="21m00Tcm4TlvDq8ikWAM"):  # default Rache
     }
     payload = {
         "text": text,
-        "model_id": "eleven_turbo_v2",
-        "voice_settings": {"stability": 0.4, "similarity_boost": 0.7}
+        "model_id": TTS_MODEL_ID,
+        "voice_settings": dict(TTS_VOICE_SETTINGS)
     }
-    with requests.post(url, headers=headers, json=payload, stream=True, timeout=240) as r:
-        if r.status_code != 200:
-            raise SystemExit(f"ElevenLabs error {r.status_code}: {r.text}")
-        with open(out_mp3, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+    with TTS_LIMITER.acquire(len(text)):
+        with http_client.post(url, headers=headers, json=payload, stream=True, timeout=240) as r:
+            if r.status_code != 200:
+                raise SystemExit(f"ElevenLabs error {r.status_code}: {r.text}")
+            if on_stream is not None:
+                on_stream(r.iter_content(chunk_size=8192), out_mp3)
+                return
+            with open(out_mp3, "wb") as f:
+                for chunk in r.iter_content(chunk_size=8192):
+                    if chunk:
+                        f.write(chunk)
+
+def run_ffmpeg(cmd):
+    # Every ffmpeg call goes through here so its exit code lands on the current trace span
+    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    trace.note_ffmpeg(p.returncode)
+    return p
+
+def segment_cmd(ffmpeg, image, audio, out_mp4, vcodec="libx264"):
+    # audio=None reads the MP3 from stdin (see ffmpeg_segment_stream)
+    audio_in, shortest = (STDIN_MP3, SHORTEST_FROM_PIPE) if audio is None else (["-i", audio], ["-shortest"])
+    codec = ["-c:v", "libx264", "-tune", "stillimage"] if vcodec == "libx264" else ["-c:v", vcodec, "-pix_fmt", "yuv420p"]
+    return [ffmpeg, "-y", "-loop", "1", "-i", image, *audio_in, *codec, "-c:a", "aac", "-b:a", "192k", *shortest, out_mp4]
 
 def ffmpeg_segment(ffmpeg, image, audio, out_mp4):
     # Try libx264 first, then fallback to mpeg4
-    cmd1 = [ffmpeg, "-y", "-loop","1", "-i", image, "-i", audio, "-c:v","libx264","-tune","stillimage","-c:a","aac","-b:a","192k","-shortest", out_mp4]
-    p = subprocess.run(cmd1, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    p = run_ffmpeg(segment_cmd(ffmpeg, image, audio, out_mp4))
     if p.returncode == 0:
         return
     if b"Unknown encoder 'libx264'" in p.stderr or b"not found" in p.stderr:
-        cmd2 = [ffmpeg, "-y", "-loop","1", "-i", image, "-i", audio, "-c:v","mpeg4","-pix_fmt","yuv420p","-c:a","aac","-b:a","192k","-shortest", out_mp4]
-        p2 = subprocess.run(cmd2, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        p2 = run_ffmpeg(segment_cmd(ffmpeg, image, audio, out_mp4, vcodec="mpeg4"))
         if p2.returncode == 0:
             return
         sys.exit("FFmpeg fallback failed:\n" + p2.stderr.decode(errors="ignore"))
     sys.exit("FFmpeg failed:\n" + p.stderr.decode(errors="ignore"))
 
-def ffmpeg_concat(ffmpeg, files_list, out_mp4):
-    # Use concat demuxer
+SEGMENT_ENCODERS = ("still", "loop")
+
+def ffmpeg_segment_stream(ffmpeg, image, chunks, out_mp4, tee_mp3):
+    # Encode while the TTS response is still downloading; every chunk is also
+    # written to tee_mp3. If the streamed encode fails (e.g. no libx264) the
+    # complete tee file is re-encoded with the normal fallback chain.
+    result = pipe_to_ffmpeg(chunks, segment_cmd(ffmpeg, image, None, out_mp4), tee=tee_mp3)
+    if result.returncode != 0:
+        ffmpeg_segment(ffmpeg, image, str(tee_mp3), out_mp4)
+
+def write_concat_list(files_list, outpoints=None):
+    # concat demuxer list file; single quotes in paths are escaped as '\''.
+    # outpoints (seconds per file) cut each file there, e.g. at its audio end
     with tempfile.NamedTemporaryFile("w", delete=False, suffix=".txt") as f:
-        for p in files_list:
-            f.write(f"file '{p.replace(\"'\",\"'\\''\")}'\n")
-        list_path = f.name
+        for i, p in enumerate(files_list):
+            escaped = p.replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+            if outpoints is not None:
+                f.write(f"outpoint {outpoints[i]:.3f}\n")
+        return f.name
+
+def ffmpeg_concat(ffmpeg, files_list, out_mp4, outpoints=None):
+    # Use concat demuxer
+    list_path = write_concat_list(files_list, outpoints)
     cmd = [ffmpeg, "-y", "-f","concat","-safe","0","-i", list_path, "-c","copy", out_mp4]
-    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    p = run_ffmpeg(cmd)
     if p.returncode != 0:
         # if stream copy fails (codec mismatch), re-encode
         cmd2 = [ffmpeg, "-y", "-f","concat","-safe","0","-i", list_path, "-c:v","libx264","-c:a","aac", out_mp4]
-        p2 = subprocess.run(cmd2, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        p2 = run_ffmpeg(cmd2)
         if p2.returncode != 0:
             sys.exit("FFmpeg concat failed:\n" + p2.stderr.decode(errors="ignore"))
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--pdf", required=True)
-    ap.add_argument("--images", required=True, help="semicolon or comma-separated list of image paths")
-    ap.add_argument("--output", required=True)
-    ap.add_argument("--vehicle", required=True)
-    ap.add_argument("--model", default="gpt-4o")
-    ap.add_argument("--ffmpeg", default=r'"C:\Users\gregc\vi-clean\ffmpeg\ffmpeg\bin\ffmpeg.exe"')
-    args = ap.parse_args()
+def ffmpeg_concat_audio(ffmpeg, files_list, out_mp3):
+    # join audio with concat demuxer
+    list_a = write_concat_list(files_list)
+    cmd_a = [ffmpeg, "-y", "-f","concat","-safe","0","-i", list_a, "-c","copy", out_mp3]
+    pa = run_ffmpeg(cmd_a)
+    if pa.returncode != 0:
+        # fallback re-encode
+        cmd_a2 = [ffmpeg, "-y", "-f","concat","-safe","0","-i", list_a, "-c:a","aac", out_mp3]
+        pa2 = run_ffmpeg(cmd_a2)
+        if pa2.returncode != 0:
+            sys.exit("FFmpeg audio concat failed:\n" + pa2.stderr.decode(errors="ignore"))
 
-    outdir = Path(args.output); outdir.mkdir(parents=True, exist_ok=True)
-    vehicle = args.vehicle
+SLIDESHOW_SIZE = (1280, 720)
+SLIDESHOW_FPS = 25
 
-    # parse images list
-    raw = args.images.replace(";", ",")
-    image_paths = [p.strip().strip('"') for p in raw.split(",") if p.strip()]
+def slideshow_cmd(ffmpeg, images, audios, durations, out_mp4, vcodec="libx264"):
+    # One filtergraph: each still is looped for exactly its segment's audio
+    # duration, scaled/padded to a common frame, and the stills and audio are
+    # concatenated in the graph. Every duration must be > 0 ("-t 0" is invalid).
+    w, h = SLIDESHOW_SIZE
+    n = len(images)
+    cmd = [ffmpeg, "-y"]
+    for img, dur in zip(images, durations):
+        cmd += ["-loop","1", "-framerate",str(SLIDESHOW_FPS), "-t",f"{dur:.3f}", "-i", img]
+    for aud in audios:
+        cmd += ["-i", aud]
+    graph = []
+    for i in range(n):
+        graph.append(f"[{i}:v]scale={w}:{h}:force_original_aspect_ratio=decrease,pad={w}:{h}:(ow-iw)/2:(oh-ih)/2,setsar=1,format=yuv420p[v{i}]")
+    graph.append("".join(f"[v{i}]" for i in range(n)) + f"concat=n={n}:v=1:a=0[v]")
+    graph.append("".join(f"[{n + i}:a]" for i in range(n)) + f"concat=n={n}:v=0:a=1[a]")
+    venc = ["-c:v","libx264","-tune","stillimage"] if vcodec == "libx264" else ["-c:v",vcodec,"-q:v","3"]
+    cmd += ["-filter_complex", ";".join(graph),
+            "-map","[v]", "-map","[a]", *venc, "-pix_fmt","yuv420p", "-c:a","aac","-b:a","192k", "-movflags","+faststart", out_mp4]
+    return cmd
+
+def ffmpeg_slideshow(ffmpeg, images, audios, durations, out_mp4):
+    # Single ffmpeg process for the final MP4. Every frame is encoded once, by
+    # one encoder, so there is no per-segment codec mismatch to break a
+    # stream-copy concat. The full MP3 is joined separately with -c copy.
+    p = run_ffmpeg(slideshow_cmd(ffmpeg, images, audios, durations, out_mp4))
+    if p.returncode == 0:
+        return
+    if b"Unknown encoder 'libx264'" in p.stderr or b"not found" in p.stderr:
+        p2 = run_ffmpeg(slideshow_cmd(ffmpeg, images, audios, durations, out_mp4, vcodec="mpeg4"))
+        if p2.returncode == 0:
+            return
+        sys.exit("FFmpeg slideshow fallback failed:\n" + p2.stderr.decode(errors="ignore"))
+    sys.exit("FFmpeg slideshow failed:\n" + p.stderr.decode(errors="ignore"))
+
+RENDER_MODES = ("single", "segments")
+
+# Manual excerpt budget for --summarize truncate, in prompt tokens of --model
+PROMPT_MAX_TOKENS = 1500
+EXTRACT_MODES = ("fast", "tiered")
+
+def run_vehicle(pdf, image_paths, output, vehicle, model="gpt-4o", ffmpeg="ffmpeg", limits=None, render="single", resume=True,
+                summarize="truncate", map_workers=DEFAULT_MAP_WORKERS, stream=False, extract="fast",
+                segment_encoder="still", still_audio="aac", caption_weight="syllables",
+                prompt_tokens=PROMPT_MAX_TOKENS, strip_boilerplate=True, sections=(), search=(), search_k=8, until=None, on_stage=None,
+                voice_id=TTS_VOICE_ID):
+    # One vehicle end to end. `limits` is an optional vi_pipeline.concurrency.StageLimits
+    # so a batch process can share stage capacity across many vehicles.
+    # until="extract" stops after extraction and returns the manifest with the
+    # script request as "script_request" (offline LLM batches, see batch_v3).
+    # Every stage is checkpointed in <vehicle>_manifest.json; with resume=True a
+    # stage whose inputs are unchanged and whose outputs still verify is skipped.
+    # on_stage(name, record) is called as each stage finishes (see StageManifest).
+    outdir = Path(output); outdir.mkdir(parents=True, exist_ok=True)
+    ffmpeg = ffmpeg.strip('"')
+    tag = f"[v3:{vehicle}]" if limits is not None else "[v3]"
     if not image_paths:
         raise SystemExit("No images provided for --images")
+    if until not in (None, "extract"):
+        raise SystemExit(f"Unknown stop stage {until!r}")
+    if until == "extract" and summarize == "map-reduce":
+        raise SystemExit("Offline LLM batches need --summarize truncate (map-reduce chains its calls)")
+    if stream and render != "segments":
+        raise SystemExit("--stream needs --render segments (the single pass needs every duration up front)")
+
+    stages = StageManifest(outdir / f"{vehicle}_manifest.json", base={"vehicle": vehicle, "segments": []}, resume=resume,
+                           on_stage=on_stage)
+
+    # Section index (TOC, else detected headings), kept beside the extract; --section
+    # narrows extraction to the matching pages
+    pages = None
+    if sections:
+        sections_path = outdir / f"{vehicle}_sections.json"
+        def do_sections():
+            with stage_slot(limits, "extract"):
+                index = build_index(pdf)
+            index.save(sections_path)
+            trace.add(sections=len(index.sections))
+        stages.run("sections", {"pdf": file_sha256(pdf), "version": SECTION_INDEX_VERSION}, [sections_path], do_sections)
+        pages = resolve_pages(SectionIndex.load(sections_path), sections)
+        print(f"{tag} Sections {', '.join(sections)}: {len(pages)} pages")
+
+    extract_path = outdir / f"{vehicle}_extract.txt"
+    # map-reduce summarises the whole manual, so it needs the full text
+    max_tokens = None if summarize == "map-reduce" else prompt_tokens
+    # --search picks the truncate-mode excerpt; map-reduce reads everything anyway
+    search = list(search) if max_tokens is not None else []
+    def do_extract():
+        print(f"{tag} Extracting PDF text…")
+        with stage_slot(limits, "extract"):
+            tiered = extract == "tiered"
+            strip = Stripper.for_pdf(pdf, cache=BOILERPLATE_CACHE) if strip_boilerplate else None
+            if max_tokens is None:
+                text = read_all_text(pdf, sep="\n\n", tiered=tiered, store=PAGE_STORE, strip=strip, pages=pages)
+            else:
+                if search:
+                    packed = search_pdf_text(pdf, search, max_tokens=max_tokens, model=model, tiered=tiered, strip=strip, pages=pages, k=search_k)
+                else:
+                    packed = read_pdf_text(pdf, max_tokens=max_tokens, model=model, tiered=tiered, strip=strip, pages=pages)
+                text = packed.text
+                print(f"{tag} Prompt excerpt: {packed.describe()}")
+                stages.update(excerpt=packed.as_dict())
+                trace.add(excerpt_tokens=packed.tokens)
+            if strip is not None and strip.pages:
+                print(f"{tag} Boilerplate: {strip.describe()}")
+                stages.update(boilerplate=strip.stats())
+                trace.add(boilerplate_bytes=strip.bytes_removed)
+            extract_path.write_text(text, encoding="utf-8")
+            trace.add(bytes_in=os.path.getsize(pdf), chars_out=len(text))
+    extract_inputs = {"pdf": file_sha256(pdf), "max_tokens": max_tokens, "model": model if max_tokens else None, "extract": extract,
+                      "boilerplate": strip_boilerplate, "pages": pages, "search": search, "search_k": search_k if search else None}
+    stages.run("extract", extract_inputs, [extract_path], do_extract)
+    text = extract_path.read_text(encoding="utf-8")
+    if until == "extract":
+        summary = stages.summary()
+        print(f"{tag} Stages ran: {', '.join(summary['ran']) or 'none'}; skipped: {', '.join(summary['skipped']) or 'none'}")
+        return {**stages.data, "script_request": script_batch_request(text, model=model)}
 
-    print("[v3] Extracting PDF text…")
-    text = read_pdf_text(args.pdf, max_chars=6000)
-    print("[v3] Generating narration script via OpenAI…")
-    script = openai_summarize_to_script(text, model=args.model)
     script_path = outdir / f"{vehicle}_script.txt"
-    script_path.write_text(script, encoding="utf-8")
+    def do_script():
+        print(f"{tag} Generating narration script via OpenAI…")
+        if summarize == "map-reduce":
+            script = map_reduce_to_script(text, model=model, workers=map_workers, limits=limits)
+        else:
+            with stage_slot(limits, "llm"):
+                script = openai_summarize_to_script(text, model=model)
+        script_path.write_text(script, encoding="utf-8")
+    script_inputs = {"text": stages.output_hash("extract", extract_path), "model": model, "summarize": summarize,
+                     "system": SCRIPT_SYSTEM_PROMPT, "user": SCRIPT_USER_TEMPLATE, "temperature": SCRIPT_TEMPERATURE}
+    stages.run("script", script_inputs, [script_path], do_script)
+    script = script_path.read_text(encoding="utf-8")
 
-    print("[v3] Splitting script into", len(image_paths), "segments…")
-    seg_texts = split_script_into_segments(script, len(image_paths))
+    print(f"{tag} Splitting script into", len(image_paths), "segments…")
+    with trace.span("split", vehicle=vehicle, chars_in=len(script), segments=len(image_paths)):
+        seg_texts = split_script_into_segments(script, len(image_paths))
 
     segment_mp3s = []
     segment_mp4s = []
-    manifest = {"vehicle": vehicle, "segments": []}
-
-    for idx, (img, seg_text) in enumerate(zip(image_paths, seg_texts), start=1):
-        seg_id = f"{idx:02d}"
-        a_out = outdir / f"{vehicle}_seg{seg_id}.mp3"
-        v_out = outdir / f"{vehicle}_seg{seg_id}.mp4"
-        print(f"[v3] TTS seg {seg_id}…")
-        eleven_tts(seg_text, str(a_out))
-        segment_mp3s.append(str(a_out))
-        print(f"[v3] Making video seg {seg_id}…")
-        ffmpeg_segment(args.ffmpeg.strip('"'), img, str(a_out), str(v_out))
-        segment_mp4s.append(str(v_out))
-        # duration probe could be added; keep simple
-        manifest["segments"].append({"index": idx, "image": img, "text": seg_text, "audio": str(a_out), "video": str(v_out)})
+    segments = []
 
-    final_mp4 = outdir / f"{vehicle}_video.mp4"
-    print("[v3] Concatenating segments ->", final_mp4)
-    ffmpeg_concat(args.ffmpeg.strip('"'), segment_mp4s, str(final_mp4))
+    # seg_ids whose video was encoded while their audio streamed in
+    streamed = set()
+
+    def synth(seg_id, seg_text, a_out, img):
+        def encode_stream(chunks, tmp_mp3):
+            v_out = str(outdir / f"{vehicle}_seg{seg_id}.mp4")
+            print(f"{tag} Streaming TTS seg {seg_id} into ffmpeg…")
+            with stage_slot(limits, "render"), trace.span(f"video:{seg_id}", vehicle=vehicle, streamed=True):
+                ffmpeg_segment_stream(ffmpeg, img, chunks, v_out, tmp_mp3)
+            streamed.add(seg_id)
+        def do_tts():
+            print(f"{tag} TTS seg {seg_id}…")
+            with stage_slot(limits, "tts"):
+                eleven_tts(seg_text, str(a_out), voice_id=voice_id, on_stream=encode_stream if stream else None)
+        tts_inputs = {"text": seg_text, "voice_id": voice_id, "model_id": TTS_MODEL_ID, "voice_settings": TTS_VOICE_SETTINGS}
+        stages.run(f"tts:{seg_id}", tts_inputs, [a_out], do_tts)
+
+    # All TTS requests go out at once (API calls bounded by TTS_LIMITER). In
+    # "segments" mode each segment is rendered in index order as its audio lands;
+    # either way the manifest order is fixed.
+    with ThreadPoolExecutor(max_workers=TTS_LIMITER.max_in_flight, thread_name_prefix=f"tts-{vehicle}") as pool:
+        jobs = []
+        for idx, (img, seg_text) in enumerate(zip(image_paths, seg_texts), start=1):
+            seg_id = f"{idx:02d}"
+            a_out = outdir / f"{vehicle}_seg{seg_id}.mp3"
+            jobs.append((idx, seg_id, img, seg_text, a_out, pool.submit(synth, seg_id, seg_text, a_out, img)))
+
+        # Streamed segments are loop-encoded, so keep file-based ones on the same
+        # encoder; mixed codecs would force the final concat to re-encode
+        encoder = "loop" if stream else segment_encoder
+        renderer = StillRenderer(ffmpeg, STILL_CACHE, size=SLIDESHOW_SIZE) if encoder == "still" else None
+        def video_stage(seg_id, img, a_out, v_out):
+            def do_segment():
+                if seg_id in streamed:
+                    return  # already encoded from the live TTS stream
+                print(f"{tag} Making video seg {seg_id}…")
+                with stage_slot(limits, "render"):
+                    if encoder == "still":
+                        # Remux the audio under the image's once-encoded still clip (cut at the MP3's duration)
+                        renderer.render(img, str(a_out), v_out, audio_codec=still_audio)
+                    else:
+                        ffmpeg_segment(ffmpeg, img, str(a_out), v_out)
+            seg_inputs = {"image": file_sha256(img), "audio": stages.output_hash(f"tts:{seg_id}", a_out),
+                          "encoder": encoder, "still_audio": still_audio if encoder == "still" else None}
+            stages.run(f"video:{seg_id}", seg_inputs, [v_out], do_segment)
+        rendered = []
+        for idx, seg_id, img, seg_text, a_out, fut in jobs:
+            fut.result()
+            segment_mp3s.append(str(a_out))
+            v_out = None
+            if render == "segments":
+                v_out = str(outdir / f"{vehicle}_seg{seg_id}.mp4")
+                rendered.append((seg_id, img, a_out, v_out))
+                try:
+                    video_stage(seg_id, img, a_out, v_out)
+                except RuntimeError as exc:
+                    if encoder != "still":
+                        raise
+                    # Still and loop segments differ in frame rate and audio codec, so
+                    # the stream-copy concat needs them all on one encoder
+                    print(f"{tag} still render failed, re-encoding every segment: {str(exc).splitlines()[0]}")
+                    encoder = "loop"
+                    for done in rendered:
+                        video_stage(*done)
+                segment_mp4s.append(v_out)
+            segments.append({"index": idx, "image": img, "text": seg_text, "audio": str(a_out), "video": v_out})
+        if renderer is not None:
+            renderer.close()
+    # Segment durations from the MP3 headers (no ffprobe); reused for the final render
+    seg_info = probe_many(segment_mp3s)
+    durations = [info.duration for info in seg_info]
+    stages.update(segments=segments)
 
+    final_mp4 = outdir / f"{vehicle}_video.mp4"
     audio_full = outdir / f"{vehicle}_audio.mp3"
-    print("[v3] Concatenating audio segments ->", audio_full)
-    # join audio with concat demuxer
-    with tempfile.NamedTemporaryFile("w", delete=False, suffix=".txt") as f:
-        for p in segment_mp3s:
-            f.write(f"file '{p.replace(\"'\",\"'\\''\")}'\n")
-        list_a = f.name
-    cmd_a = [args.ffmpeg.strip('"'), "-y", "-f","concat","-safe","0","-i", list_a, "-c","copy", str(audio_full)]
-    pa = subprocess.run(cmd_a, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    if pa.returncode != 0:
-        # fallback re-encode
-        cmd_a2 = [args.ffmpeg.strip('"'), "-y", "-f","concat","-safe","0","-i", list_a, "-c:a","aac", str(audio_full)]
-        pa2 = subprocess.run(cmd_a2, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if pa2.returncode != 0:
-            sys.exit("FFmpeg audio concat failed:\n" + pa2.stderr.decode(errors="ignore"))
+    def do_final():
+        # A segment without audio frames has nothing to show or play, and would
+        # be an invalid "-t 0" input
+        keep = [i for i, d in enumerate(durations) if d > 0]
+        if not keep:
+            raise SystemExit(f"{tag} no segment has any audio to render")
+        if render == "single":
+            print(f"{tag} Rendering slideshow ->", final_mp4)
+            with stage_slot(limits, "render"):
+                ffmpeg_slideshow(ffmpeg, [image_paths[i] for i in keep], [segment_mp3s[i] for i in keep],
+                                 [durations[i] for i in keep], str(final_mp4))
+            print(f"{tag} Concatenating audio segments ->", audio_full)
+            with stage_slot(limits, "render"):
+                ffmpeg_concat_audio(ffmpeg, [segment_mp3s[i] for i in keep], str(audio_full))
+        else:
+            print(f"{tag} Concatenating segments ->", final_mp4)
+            with stage_slot(limits, "render"):
+                ffmpeg_concat(ffmpeg, [segment_mp4s[i] for i in keep], str(final_mp4), outpoints=[durations[i] for i in keep])
+            print(f"{tag} Concatenating audio segments ->", audio_full)
+            with stage_slot(limits, "render"):
+                ffmpeg_concat_audio(ffmpeg, [segment_mp3s[i] for i in keep], str(audio_full))
+    final_inputs = {
+        "render": render, "audio_join": "copy",
+        "size": SLIDESHOW_SIZE, "fps": SLIDESHOW_FPS,
+        "images": [file_sha256(img) for img in image_paths[:len(segment_mp3s)]],
+        "audio": [stages.output_hash(f"tts:{i:02d}", a) for i, a in enumerate(segment_mp3s, start=1)],
+        "video": [stages.output_hash(f"video:{i:02d}", v) for i, v in enumerate(segment_mp4s, start=1)],
+    }
+    stages.run("final", final_inputs, [final_mp4, audio_full], do_final)
+
+    # Where each segment sits in the joined narration, for captions, image timing and verification
+    start = 0.0
+    for seg, info, (offset, length) in zip(segments, seg_info, locate_segments(seg_info, audio_full)):
+        seg.update(duration_ms=info.duration_ms, start_ms=int(round(start * 1000)), audio_offset=offset, audio_bytes=length)
+        start += info.duration
+    full = probe(audio_full)
+
+    # Captions: each segment spans its measured audio, sentences within it by syllable/char share
+    captions_path = outdir / f"{vehicle}.vtt"
+    def do_captions():
+        write_webvtt(captions_path, build_cues(zip(seg_texts, durations), by=caption_weight))
+    caption_inputs = {"texts": seg_texts, "durations_ms": [i.duration_ms for i in seg_info], "weight": caption_weight}
+    stages.run("captions", caption_inputs, [captions_path], do_captions)
+
+    stages.update(segments=segments, final={
+        "video": str(final_mp4), "audio": str(audio_full), "script": str(script_path), "captions": str(captions_path),
+        "duration_ms": full.duration_ms, "sample_rate": full.sample_rate, "bitrate_kbps": round(full.bitrate_kbps, 1),
+    })
+    summary = stages.summary()
+    print(f"{tag} Stages ran: {', '.join(summary['ran']) or 'none'}; skipped: {', '.join(summary['skipped']) or 'none'}")
+    print(f"{tag} Done.")
+    return stages.data
+
+def configure_speech_model(words_per_second=None, sentence_pause=None):
+    global SPEECH_MODEL
+    if words_per_second is not None or sentence_pause is not None:
+        SPEECH_MODEL = SpeechModel(words_per_second or SPEECH_MODEL.words_per_second,
+                                   SPEECH_MODEL.sentence_pause if sentence_pause is None else sentence_pause)
+
+def configure_tts_limiter(max_in_flight=None, chars_per_minute=None):
+    # Raises ValueError for a quota below 1 (here or in ELEVENLABS_* env vars)
+    global TTS_LIMITER
+    TTS_LIMITER = RateLimiter.for_provider("elevenlabs", max_in_flight=max_in_flight, units_per_minute=chars_per_minute)
+
+def parse_images(raw):
+    # semicolon or comma-separated list, optionally quoted
+    raw = raw.replace(";", ",")
+    return [p.strip().strip('"') for p in raw.split(",") if p.strip()]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pdf", required=True)
+    ap.add_argument("--images", required=True, help="semicolon or comma-separated list of image paths")
+    ap.add_argument("--output", required=True)
+    ap.add_argument("--vehicle", required=True)
+    ap.add_argument("--model", default="gpt-4o")
+    ap.add_argument("--voice", dest="voice_id", default=TTS_VOICE_ID, help="ElevenLabs voice ID (default: Rachel)")
+    ap.add_argument("--ffmpeg", default=r'"C:\Users\gregc\vi-clean\ffmpeg\ffmpeg\bin\ffmpeg.exe"')
+    ap.add_argument("--render", choices=RENDER_MODES, default="single", help="single: one ffmpeg pass for the whole video; segments: legacy per-segment encode + concat")
+    ap.add_argument("--segment-encoder", choices=SEGMENT_ENCODERS, default="still", help="with --render segments: still = encode each image once and remux per segment; loop = legacy full encode")
+    ap.add_argument("--still-audio", choices=STILL_AUDIO_CODECS, default="aac", help="audio codec for still segments: transcode to AAC like loop segments, or copy the MP3 (faster, MP3-in-MP4)")
+    ap.add_argument("--extract", choices=EXTRACT_MODES, default="fast", help="fast: PyMuPDF only; tiered: escalate thin pages to pdfminer, then OCR")
+    ap.add_argument("--keep-boilerplate", action="store_true", help="do not strip repeated page headers, footers and warning boxes from the extracted text")
+    ap.add_argument("--caption-weight", choices=CAPTION_WEIGHTS, default="syllables", help="time caption cues within a segment by syllable or character count")
+    ap.add_argument("--stream", action="store_true", help="with --render segments, pipe each TTS download straight into its ffmpeg encode")
+    ap.add_argument("--summarize", choices=SUMMARIZE_MODES, default="truncate", help="truncate: whole paragraphs up to --prompt-tokens; map-reduce: summarise the whole manual section by section")
+    ap.add_argument("--prompt-tokens", type=int, default=PROMPT_MAX_TOKENS, help="manual excerpt budget in tokens of --model for --summarize truncate")
+    ap.add_argument("--map-workers", type=int, default=DEFAULT_MAP_WORKERS, help="concurrent section summaries in map-reduce mode")
+    ap.add_argument("--no-resume", action="store_true", help="rerun every stage even if its manifest checkpoint is current")
+    ap.add_argument("--tts-concurrency", type=positive_int, default=None, help="max ElevenLabs requests in flight")
+    ap.add_argument("--tts-chars-per-minute", type=positive_int, default=None, help="ElevenLabs character budget per minute")
+    ap.add_argument("--speech-wps", type=float, default=None, help="words per second for balancing segments (default 2.6)")
+    ap.add_argument("--speech-pause", type=float, default=None, help="seconds of pause per sentence for balancing segments (default 0.35)")
+    add_section_args(ap)
+    add_search_args(ap)
+    add_cache_args(ap)
+    add_trace_args(ap)
+    args = ap.parse_args()
+    LLM_CACHE.mode = TTS_CACHE.mode = STILL_CACHE.mode = SEARCH_CACHE.mode = BOILERPLATE_CACHE.mode = PAGE_STORE.mode = cache_mode_from_args(args)
+    try:
+        configure_tts_limiter(args.tts_concurrency, args.tts_chars_per_minute)
+    except ValueError as exc:
+        ap.error(str(exc))
+    configure_speech_model(args.speech_wps, args.speech_pause)
+
+    tracer = trace.configure(args.trace)
 
-    manifest["final"] = {"video": str(final_mp4), "audio": str(audio_full), "script": str(script_path)}
-    (outdir / f"{vehicle}_manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
-    print("[v3] Done.")
+    image_paths = parse_images(args.images)
+    try:
+        with trace.span("vehicle", vehicle=args.vehicle):
+            run_vehicle(args.pdf, image_paths, args.output, args.vehicle, model=args.model, ffmpeg=args.ffmpeg, render=args.render, resume=not args.no_resume,
+                        summarize=args.summarize, map_workers=args.map_workers, stream=args.stream, extract=args.extract,
+                        segment_encoder=args.segment_encoder, still_audio=args.still_audio, caption_weight=args.caption_weight,
+                        prompt_tokens=args.prompt_tokens, strip_boilerplate=not args.keep_boilerplate, sections=args.sections,
+                        search=args.search, search_k=args.search_k, voice_id=args.voice_id)
+    finally:
+        summary = tracer.close()
+        if args.trace:
+            print(f"[v3] Trace written to {args.trace}\n" + format_summary(summary))
 if __name__ == "__main__":
     main()
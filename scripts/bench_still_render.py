@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+r"""
+bench_still_render.py
+Segment render time: legacy loop encode vs encode-once still clip + remux.
+
+Generates a test image and sine-tone MP3s of several lengths, then times
+  loop   the current command line (-loop 1 -i image ... libx264 -shortest)
+  still  vi_pipeline.still: one keyframe clip per image, stream-copied per segment
+
+Usage:
+  py scripts\bench_still_render.py --ffmpeg "C:\ffmpeg\bin\ffmpeg.exe" --durations 15,60,180
+"""
+
+import argparse, os, subprocess, sys, tempfile, time, pathlib
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))  # repo root, for vi_pipeline
+from vi_pipeline.mp3 import mp3_duration
+from vi_pipeline.still import STILL_AUDIO_CODECS, StillRenderer
+
+def run(cmd):
+    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if p.returncode != 0:
+        sys.exit("ffmpeg failed:\n" + p.stderr.decode(errors="ignore")[-1500:])
+
+def loop_cmd(ffmpeg, image, audio, out_mp4):
+    # Same as pipeline_v3.ffmpeg_segment / pipeline.create_video before the still path
+    return [ffmpeg, "-y", "-loop", "1", "-i", image, "-i", audio, "-c:v", "libx264", "-tune", "stillimage",
+            "-c:a", "aac", "-b:a", "192k", "-shortest", out_mp4]
+
+def timed(fn):
+    t0 = time.perf_counter(); fn(); return time.perf_counter() - t0
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--ffmpeg", default="ffmpeg")
+    ap.add_argument("--image", help="background image (default: generated 1920x1080 test pattern)")
+    ap.add_argument("--durations", default="15,60,180", help="comma-separated narration lengths in seconds")
+    ap.add_argument("--still-audio", choices=STILL_AUDIO_CODECS, default="aac")
+    ap.add_argument("--skip-loop", action="store_true", help="only time the still path")
+    a = ap.parse_args()
+    durations = [float(d) for d in a.durations.split(",") if d.strip()]
+
+    with tempfile.TemporaryDirectory(prefix="vi-bench-") as tmp:
+        image = a.image
+        if not image:
+            image = os.path.join(tmp, "image.png")
+            run([a.ffmpeg, "-y", "-f", "lavfi", "-i", "testsrc2=s=1920x1080", "-frames:v", "1", image])
+        audios = []
+        for d in durations:
+            mp3 = os.path.join(tmp, f"tone_{int(d)}.mp3")
+            run([a.ffmpeg, "-y", "-f", "lavfi", "-i", f"sine=frequency=440:duration={d}",
+                 "-ac", "1", "-ar", "44100", "-c:a", "libmp3lame", "-b:a", "128k", mp3])
+            audios.append(mp3)
+
+        renderer = StillRenderer(a.ffmpeg)
+        encode_s = timed(lambda: renderer.still_for(image))
+        print(f"still clip encode (once per image): {encode_s:.2f}s")
+        print(f"{'audio s':>8} {'loop s':>8} {'still s':>8} {'speedup':>8} {'loop MB':>8} {'still MB':>9}")
+        for d, mp3 in zip(durations, audios):
+            out_still = os.path.join(tmp, f"still_{int(d)}.mp4")
+            still_s = timed(lambda: renderer.render(image, mp3, out_still, duration=mp3_duration(mp3),
+                                                    audio_codec=a.still_audio))
+            still_mb = os.path.getsize(out_still) / 1e6
+            if a.skip_loop:
+                print(f"{d:8.0f} {'-':>8} {still_s:8.2f} {'-':>8} {'-':>8} {still_mb:9.2f}")
+                continue
+            out_loop = os.path.join(tmp, f"loop_{int(d)}.mp4")
+            loop_s = timed(lambda: run(loop_cmd(a.ffmpeg, image, mp3, out_loop)))
+            loop_mb = os.path.getsize(out_loop) / 1e6
+            print(f"{d:8.0f} {loop_s:8.2f} {still_s:8.2f} {loop_s / max(still_s, 1e-6):7.1f}x {loop_mb:8.2f} {still_mb:9.2f}")
+        renderer.close()
+
+if __name__ == "__main__":
+    main()
@@ -12,8 +12,19 @@ Usage (Windows PowerShell):
 """
 
 import os, sys, json, argparse, textwrap, subprocess, pathlib
-import fitz  # PyMuPDF
-import requests
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))  # repo root, for vi_pipeline
+from vi_pipeline import http_client, trace
+from vi_pipeline.boilerplate import Stripper
+from vi_pipeline.cache import TTS_MAX_AGE, TTS_MAX_BYTES, add_cache_args, cache_mode_from_args, llm_cache_key, open_cache, tts_cache_key
+from vi_pipeline.pagestore import open_page_store
+from vi_pipeline.pdftext import read_all_text
+from vi_pipeline.prompt import pack
+from vi_pipeline.search import add_search_args, open_index, search_excerpt, text_variant
+from vi_pipeline.sections import add_section_args, load_or_build, resolve_pages
+from vi_pipeline.stages import file_sha256
+from vi_pipeline.still import StillRenderer
+from vi_pipeline.summarize import DEFAULT_MAP_WORKERS, SUMMARIZE_MODES, map_reduce
+from vi_pipeline.trace import add_trace_args, format_summary
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
@@ -22,6 +33,26 @@ DEFAULT_VOICE_ID = "21m00Tcm4TlvDq8ikWAM"  # ElevenLabs "Rachel"
 OPENAI_URL = "https://api.openai.com/v1/chat/completions"
 ELEVEN_TTS_URL_TMPL = "https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
 
+NARRATION_SYSTEM_PROMPT = "You write tight, friendly, instructional voiceover scripts for vehicle owners."
+NARRATION_USER_TEMPLATE = textwrap.dedent("""
+    Based on the following manual excerpt, write a clear ~60–90 second narration script
+    for a short help video. Avoid jargon, keep sentences short, and use second person ("you").
+    End with a one-sentence safety reminder.
+
+    Manual excerpt:
+    {manual_excerpt}
+    """).strip()
+NARRATION_TEMPERATURE = 0.4
+
+# Narration scripts keyed on (excerpt, model, prompts, temperature); see --no-cache / --refresh
+LLM_CACHE = open_cache("llm", suffix=".txt")
+TTS_CACHE = open_cache("tts", suffix=".mp3", max_bytes=TTS_MAX_BYTES, max_age=TTS_MAX_AGE)
+STILL_CACHE = open_cache("still", suffix=".mp4")
+PAGE_STORE = open_page_store()
+# BM25 indexes of manual chunks keyed on (PDF SHA-256, extraction variant); see --search
+SEARCH_CACHE = open_cache("bm25", suffix=".vibm25")
+BOILERPLATE_CACHE = open_cache("boilerplate", suffix=".json")
+
 def die(msg: str, code: int = 1):
     print(f"[pipeline] ERROR: {msg}")
     sys.exit(code)
@@ -29,56 +60,81 @@ def die(msg: str, code: int = 1):
 def ensure_dir(p: str):
     pathlib.Path(p).mkdir(parents=True, exist_ok=True)
 
-def read_pdf_text(pdf_path: str) -> str:
-    doc = fitz.open(pdf_path)
-    parts = []
-    for page in doc:
-        parts.append(page.get_text())
-    doc.close()
-    return "\n".join(parts)
+def read_pdf_text(pdf_path: str, workers=None, strip: Stripper = None, pages=None) -> str:
+    # Whole manual (or just `pages`); long PDFs are extracted page-parallel in a
+    # process pool. `strip` drops repeated page headers/footers and warning boxes.
+    return read_all_text(pdf_path, sep="\n", workers=workers, store=PAGE_STORE, strip=strip, pages=pages)
 
-def openai_narration(model: str, manual_text: str) -> str:
+def search_pdf_text(pdf_path: str, queries, model: str, k: int, strip: Stripper = None, pages=None):
+    # Manual chunks that best match the feature titles, packed into the narration budget
+    index = open_index(SEARCH_CACHE, file_sha256(pdf_path), text_variant(False, strip is not None, pages),
+                       lambda: read_all_text(pdf_path, sep="\n\n", store=PAGE_STORE, strip=strip, pages=pages))
+    return search_excerpt(index, queries, NARRATION_MAX_TOKENS, model, k=k)
+
+def openai_chat(model: str, system: str, user: str, temperature: float = NARRATION_TEMPERATURE) -> str:
     if not OPENAI_API_KEY:
         die("Missing OPENAI_API_KEY in environment.")
-    # Keep prompt size modest to avoid token limits
-    manual_excerpt = manual_text.strip()
-    if len(manual_excerpt) > 12000:
-        manual_excerpt = manual_excerpt[:12000]
-
     payload = {
         "model": model,
         "messages": [
-            {
-                "role": "system",
-                "content": "You write tight, friendly, instructional voiceover scripts for vehicle owners."
-            },
-            {
-                "role": "user",
-                "content": textwrap.dedent(f"""
-                Based on the following manual excerpt, write a clear ~60–90 second narration script
-                for a short help video. Avoid jargon, keep sentences short, and use second person ("you").
-                End with a one-sentence safety reminder.
-
-                Manual excerpt:
-                {manual_excerpt}
-                """).strip()
-            }
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
         ],
-        "temperature": 0.4,
+        "temperature": temperature,
     }
     headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
-    r = requests.post(OPENAI_URL, headers=headers, json=payload, timeout=60)
+    r = http_client.post(OPENAI_URL, headers=headers, json=payload, timeout=60)
     if r.status_code != 200:
         die(f"OpenAI API returned {r.status_code}: {r.text}")
     data = r.json()
+    trace.note_usage(data)
     try:
         return data["choices"][0]["message"]["content"].strip()
     except Exception:
         die(f"Unexpected OpenAI response: {json.dumps(data)[:800]}")
 
+# Map-reduce condenses the joined section summaries again above this size
+NARRATION_MAX_CHARS = 12000
+# Manual excerpt budget in prompt tokens of --model; whole paragraphs only
+NARRATION_MAX_TOKENS = 3000
+
+def openai_narration(model: str, manual_text: str) -> str:
+    # Keep prompt size modest to avoid token limits
+    packed = pack(manual_text, NARRATION_MAX_TOKENS, model)
+    manual_excerpt = packed.text
+    print(f"[pipeline] Manual excerpt: {packed.describe()}")
+
+    key = llm_cache_key(manual_excerpt, model, NARRATION_SYSTEM_PROMPT, NARRATION_USER_TEMPLATE, NARRATION_TEMPERATURE)
+    cached = LLM_CACHE.get_text(key)
+    if cached is not None:
+        print("[pipeline] Using cached narration script.")
+        return cached
+    narration = openai_chat(model, NARRATION_SYSTEM_PROMPT, NARRATION_USER_TEMPLATE.format(manual_excerpt=manual_excerpt))
+    LLM_CACHE.put_text(key, narration)
+    return narration
+
+def openai_narration_map_reduce(model: str, manual_text: str, workers: int = DEFAULT_MAP_WORKERS) -> str:
+    # Whole manual: sections summarised concurrently, then one narration call over the summaries
+    return map_reduce(
+        manual_text,
+        complete=lambda system, user, temperature: openai_chat(model, system, user, temperature),
+        reduce=lambda summaries: openai_narration(model, summaries),
+        model=model, reduce_budget=NARRATION_MAX_CHARS, workers=workers, cache=LLM_CACHE,
+        log=lambda msg: print(f"[pipeline] {msg}"),
+    )
+
+TTS_VOICE_SETTINGS = {"stability": 0.4, "similarity_boost": 0.7}
+
 def elevenlabs_tts(text: str, out_mp3: str, voice_id: str = DEFAULT_VOICE_ID):
+    # Cached per (normalised text, voice, settings); a hit is hardlinked into place
+    key = tts_cache_key(text, voice_id, None, TTS_VOICE_SETTINGS["stability"], TTS_VOICE_SETTINGS["similarity_boost"])
+    if TTS_CACHE.fetch_file(key, pathlib.Path(out_mp3), lambda tmp: _elevenlabs_request(text, str(tmp), voice_id)):
+        print("[pipeline] Using cached narration audio.")
+
+def _elevenlabs_request(text: str, out_mp3: str, voice_id: str):
     if not ELEVENLABS_API_KEY:
         die("Missing ELEVENLABS_API_KEY in environment.")
+    trace.add(tts_chars=len(text))
     headers = {
         "xi-api-key": ELEVENLABS_API_KEY,
         "Content-Type": "application/json",
@@ -86,10 +142,10 @@ def elevenlabs_tts(text: str, out_mp3: str, voice_id: str = DEFAULT_VOICE_ID):
     }
     body = {
         "text": text,
-        "voice_settings": {"stability": 0.4, "similarity_boost": 0.7},
+        "voice_settings": dict(TTS_VOICE_SETTINGS),
     }
     url = ELEVEN_TTS_URL_TMPL.format(voice_id=voice_id)
-    with requests.post(url, headers=headers, json=body, stream=True, timeout=120) as r:
+    with http_client.post(url, headers=headers, json=body, stream=True, timeout=120) as r:
         if r.status_code != 200:
             die(f"ElevenLabs API returned {r.status_code}: {r.text}")
         with open(out_mp3, "wb") as f:
@@ -97,7 +153,20 @@ def elevenlabs_tts(text: str, out_mp3: str, voice_id: str = DEFAULT_VOICE_ID):
                 if chunk:
                     f.write(chunk)
 
-def ffmpeg_make_video(ffmpeg_path: str, image_path: str, audio_path: str, out_mp4: str):
+def ffmpeg_make_video(ffmpeg_path: str, image_path: str, audio_path: str, out_mp4: str, encoder: str = "loop"):
+    if encoder == "still":
+        # Encode the image once as a 1 fps keyframe clip and remux it under the
+        # audio, transcoded to AAC like the loop encode
+        renderer = StillRenderer(ffmpeg_path, STILL_CACHE)
+        try:
+            renderer.render(image_path, audio_path, out_mp4, audio_codec="aac")
+            return
+        except FileNotFoundError:
+            die(f"FFmpeg not found at: {ffmpeg_path}")
+        except RuntimeError as e:
+            print(f"[pipeline] Still render failed, re-encoding: {str(e).splitlines()[0]}")
+        finally:
+            renderer.close()
     # Build the command; H.264 + AAC, still-image tuning
     cmd = [
         ffmpeg_path, "-y",
@@ -113,7 +182,9 @@ def ffmpeg_make_video(ffmpeg_path: str, image_path: str, audio_path: str, out_mp
     ]
     print("[pipeline] FFmpeg command:", " ".join(f'"{c}"' if " " in c else c for c in cmd))
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        trace.note_ffmpeg(p.returncode)
+        p.check_returncode()
     except FileNotFoundError:
         die(f"FFmpeg not found at: {ffmpeg_path}")
     except subprocess.CalledProcessError as e:
@@ -129,7 +200,20 @@ def main():
     parser.add_argument("--model", default="gpt-4o")
     parser.add_argument("--voice", default=DEFAULT_VOICE_ID)
     parser.add_argument("--ffmpeg", required=True, help="Full path to ffmpeg.exe")
+    parser.add_argument("--summarize", choices=SUMMARIZE_MODES, default="truncate",
+                        help="truncate: whole paragraphs up to 3000 tokens; map-reduce: summarise the whole manual")
+    parser.add_argument("--map-workers", type=int, default=DEFAULT_MAP_WORKERS)
+    parser.add_argument("--keep-boilerplate", action="store_true",
+                        help="keep repeated page headers, footers and warning boxes in the extracted text")
+    parser.add_argument("--video-encoder", choices=("still", "loop"), default="loop",
+                        help="loop: re-encode the looped image for the whole narration (default); "
+                             "still: encode the image once and remux it under the audio, much faster but 1 fps video")
+    add_section_args(parser)
+    add_search_args(parser)
+    add_cache_args(parser)
+    add_trace_args(parser)
     args = parser.parse_args()
+    LLM_CACHE.mode = TTS_CACHE.mode = STILL_CACHE.mode = PAGE_STORE.mode = SEARCH_CACHE.mode = BOILERPLATE_CACHE.mode = cache_mode_from_args(args)
 
     pdf_path = os.path.abspath(args.pdf)
     image_path = os.path.abspath(args.image)
@@ -149,23 +233,63 @@ def main():
     audio_mp3 = os.path.join(out_dir, f"{vehicle}_audio.mp3")
     video_mp4 = os.path.join(out_dir, f"{vehicle}_video.mp4")
 
-    print(f"[pipeline] Extracting text from {pdf_path}...")
-    manual_text = read_pdf_text(pdf_path)
+    tracer = trace.configure(args.trace)
+    try:
+        with trace.span("vehicle", vehicle=vehicle):
+            run_stages(args, pdf_path, image_path, script_txt, audio_mp3, video_mp4)
+    finally:
+        summary = tracer.close()
+        if args.trace:
+            print(f"[pipeline] Trace written to {args.trace}")
+            print(format_summary(summary))
+
+def run_stages(args, pdf_path, image_path, script_txt, audio_mp3, video_mp4):
+    with trace.span("extract", vehicle=args.vehicle) as span:
+        print(f"[pipeline] Extracting text from {pdf_path}...")
+        strip = None if args.keep_boilerplate else Stripper.for_pdf(pdf_path, cache=BOILERPLATE_CACHE)
+        pages = None
+        if args.sections:
+            # Section index beside the other outputs, rebuilt only when the PDF changes
+            index = load_or_build(pdf_path, os.path.join(os.path.dirname(script_txt), f"{args.vehicle}_sections.json"))
+            pages = resolve_pages(index, args.sections)
+            span.set(pages=len(pages))
+            print(f"[pipeline] Sections {', '.join(args.sections)}: {len(pages)} pages")
+        manual_text = read_pdf_text(pdf_path, strip=strip, pages=pages)
+        span.set(bytes_in=os.path.getsize(pdf_path), chars_out=len(manual_text))
+        if strip is not None:
+            span.set(boilerplate_bytes=strip.bytes_removed)
+            print(f"[pipeline] Boilerplate: {strip.describe()}")
     print(f"[pipeline] Extracted {len(manual_text)} characters of text.")
 
-    print("[pipeline] Generating narration script via OpenAI...")
-    narration = openai_narration(args.model, manual_text)
-    with open(script_txt, "w", encoding="utf-8") as f:
-        f.write(narration)
+    if args.search and args.summarize == "truncate":
+        with trace.span("search", vehicle=args.vehicle) as span:
+            packed = search_pdf_text(pdf_path, args.search, args.model, args.search_k,
+                                     strip=None if strip is None else strip.fresh(), pages=pages)
+            span.set(excerpt_tokens=packed.tokens)
+        print(f"[pipeline] Search excerpt for {', '.join(args.search)}: {packed.describe()}")
+        manual_text = packed.text
+
+    with trace.span("script", vehicle=args.vehicle):
+        print("[pipeline] Generating narration script via OpenAI...")
+        if args.summarize == "map-reduce":
+            narration = openai_narration_map_reduce(args.model, manual_text, workers=args.map_workers)
+        else:
+            narration = openai_narration(args.model, manual_text)
+        with open(script_txt, "w", encoding="utf-8") as f:
+            f.write(narration)
     print(f"[pipeline] Generated script ({len(narration.split())} words).")
     print(f"[pipeline] Script saved to {script_txt}")
 
-    print("[pipeline] Generating audio narration via ElevenLabs...")
-    elevenlabs_tts(narration, audio_mp3, voice_id=args.voice)
+    with trace.span("tts", vehicle=args.vehicle) as span:
+        print("[pipeline] Generating audio narration via ElevenLabs...")
+        elevenlabs_tts(narration, audio_mp3, voice_id=args.voice)
+        span.set(bytes_out=os.path.getsize(audio_mp3))
     print(f"[pipeline] Audio saved to {audio_mp3}")
 
-    print("[pipeline] Creating video with FFmpeg...")
-    ffmpeg_make_video(args.ffmpeg, image_path, audio_mp3, video_mp4)
+    with trace.span("video", vehicle=args.vehicle) as span:
+        print("[pipeline] Creating video with FFmpeg...")
+        ffmpeg_make_video(args.ffmpeg, image_path, audio_mp3, video_mp4, encoder=args.video_encoder)
+        span.set(bytes_in=os.path.getsize(audio_mp3), bytes_out=os.path.getsize(video_mp4))
     print(f"[pipeline] Video saved to {video_mp4}")
 
     print("[pipeline] Done.")
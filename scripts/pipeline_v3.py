@@ -1,29 +1,33 @@
 # pipeline_v3.py (condensed working version)
-import argparse, os, json, subprocess, tempfile
+import argparse, os, json, subprocess, tempfile, sys
 from pathlib import Path
-import requests, fitz
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # repo root, for vi_pipeline
+from vi_pipeline import http_client, trace
+from vi_pipeline.boilerplate import Stripper
+from vi_pipeline.cache import add_cache_args, cache_mode_from_args, open_cache
+from vi_pipeline.pagestore import open_page_store
+from vi_pipeline.pdftext import read_token_budget
+from vi_pipeline.sections import add_section_args, load_or_build, resolve_pages
+from vi_pipeline.segmenter import split_balanced
+from vi_pipeline.trace import add_trace_args, format_summary
 OPENAI_API_KEY=os.getenv("OPENAI_API_KEY"); ELEVEN_API_KEY=os.getenv("ELEVENLABS_API_KEY")
-def read_pdf_text(pdf,max_chars=6000):
-    doc=fitz.open(pdf); t="\n\n".join([p.get_text().strip() for p in doc if p.get_text().strip()]); return t[:max_chars]
+BOILERPLATE_CACHE=open_cache("boilerplate",suffix=".json"); PAGE_STORE=open_page_store()  # modes follow --no-cache / --refresh
+def read_pdf_text(pdf,model="gpt-4o",max_tokens=1500,pages=None,strip_boilerplate=True):
+    s=Stripper.for_pdf(pdf,cache=BOILERPLATE_CACHE) if strip_boilerplate else None  # drops running headers/footers and repeated warning boxes
+    p=read_token_budget(pdf,max_tokens,model,store=PAGE_STORE,strip=s,pages=pages)  # whole paragraphs up to a token budget; stops reading pages once full
+    if s: print(f"[v3] Boilerplate: {s.describe()}")
+    print(f"[v3] Excerpt: {p.describe()}"); return p.text
 def openai_script(text,model="gpt-4o"):
     assert OPENAI_API_KEY, "OPENAI_API_KEY missing"
-    r=requests.post("https://api.openai.com/v1/chat/completions",
+    r=http_client.post("https://api.openai.com/v1/chat/completions",
         headers={"Authorization":f"Bearer {OPENAI_API_KEY}","Content-Type":"application/json"},
         json={"model":model,"messages":[{"role":"system","content":"You are concise."},{"role":"user","content":f"Create 12–20 short narration sentences from:\n{text}"}],"temperature":0.4},timeout=120)
-    r.raise_for_status(); return r.json()["choices"][0]["message"]["content"].strip()
+    r.raise_for_status(); data=r.json(); trace.note_usage(data); return data["choices"][0]["message"]["content"].strip()
 def split_script(s,n):
-    tokens=[]; 
-    for ln in [x.strip() for x in s.splitlines() if x.strip()]:
-        for p in ln.replace("•"," ").split("."):
-            p=p.strip(); 
-            if p: tokens.append(p+".")
-    if not tokens: tokens=[s]
-    seg=[[] for _ in range(n)]; 
-    for i,t in enumerate(tokens): seg[i% n].append(t)
-    return [" ".join(x) for x in seg]
+    return split_balanced(s,n)  # contiguous sentences, balanced by estimated speaking time
 def tts_eleven(text,out,voice="21m00Tcm4TlvDq8ikWAM"):
     assert ELEVEN_API_KEY, "ELEVENLABS_API_KEY missing"
-    with requests.post(f"https://api.elevenlabs.io/v1/text-to-speech/{voice}",
+    with http_client.post(f"https://api.elevenlabs.io/v1/text-to-speech/{voice}",
         headers={"xi-api-key":ELEVEN_API_KEY,"accept":"audio/mpeg","content-type":"application/json"},
         json={"text":text,"model_id":"eleven_turbo_v2","voice_settings":{"stability":0.4,"similarity_boost":0.7}},
         stream=True, timeout=240) as r:
@@ -49,16 +53,36 @@ def main():
     ap.add_argument("--pdf",required=True); ap.add_argument("--images",required=True)
     ap.add_argument("--output",required=True); ap.add_argument("--vehicle",required=True)
     ap.add_argument("--model",default="gpt-4o"); ap.add_argument("--ffmpeg",required=True)
+    ap.add_argument("--keep-boilerplate",action="store_true",help="do not strip repeated page headers, footers and warning boxes from the extracted text")
+    add_section_args(ap); add_cache_args(ap); add_trace_args(ap)
     a=ap.parse_args(); out=Path(a.output); out.mkdir(parents=True,exist_ok=True)
+    BOILERPLATE_CACHE.mode=PAGE_STORE.mode=cache_mode_from_args(a)
     imgs=[x.strip().strip('"') for x in a.images.replace(";",
 ",").split(",") if x.strip()]
-    print("[v3] Extract…"); text=read_pdf_text(a.pdf)
-    print("[v3] Script…"); script=openai_script(text, a.model); (out/f"{a.vehicle}_script.txt").write_text(script,encoding="utf-8")
+    tracer=trace.configure(a.trace)  # --trace: per-stage spans as JSONL (run_batch_v3.ps1 passes it through)
+    try:
+        with trace.span("vehicle",vehicle=a.vehicle): run(a,out,imgs)
+    finally:
+        summary=tracer.close()
+        if a.trace: print(f"[v3] Trace written to {a.trace}\n"+format_summary(summary))
+def run(a,out,imgs):
+    print("[v3] Extract…")
+    with trace.span("extract",vehicle=a.vehicle):
+        pages=resolve_pages(load_or_build(a.pdf,out/f"{a.vehicle}_sections.json"),a.sections) if a.sections else None  # only the --section pages
+        text=read_pdf_text(a.pdf,a.model,pages=pages,strip_boilerplate=not a.keep_boilerplate)
+    print("[v3] Script…")
+    with trace.span("script",vehicle=a.vehicle):
+        script=openai_script(text, a.model); (out/f"{a.vehicle}_script.txt").write_text(script,encoding="utf-8")
     segs=split_script(script,len(imgs)); mp3s=[]; mp4s=[]
     for i,(img,seg) in enumerate(zip(imgs,segs),start=1):
         sid=f"{i:02d}"; aud=str(out/f"{a.vehicle}_seg{sid}.mp3"); vid=str(out/f"{a.vehicle}_seg{sid}.mp4")
-        print(f"[v3] TTS {sid}"); tts_eleven(seg,aud)
-        print(f"[v3] VID {sid}"); ffmpeg_seg(a.ffmpeg,img,aud,vid); mp3s.append(aud); mp4s.append(vid)
-    print("[v3] Concat…"); concat(a.ffmpeg, mp4s, str(out/f"{a.vehicle}_video.mp4"), re=True); concat(a.ffmpeg, mp3s, str(out/f"{a.vehicle}_audio.mp3"), re=True)
+        print(f"[v3] TTS {sid}")
+        with trace.span(f"tts:{sid}",vehicle=a.vehicle): tts_eleven(seg,aud)
+        print(f"[v3] VID {sid}")
+        with trace.span(f"video:{sid}",vehicle=a.vehicle): ffmpeg_seg(a.ffmpeg,img,aud,vid)
+        mp3s.append(aud); mp4s.append(vid)
+    print("[v3] Concat…")
+    with trace.span("final",vehicle=a.vehicle):
+        concat(a.ffmpeg, mp4s, str(out/f"{a.vehicle}_video.mp4"), re=True); concat(a.ffmpeg, mp3s, str(out/f"{a.vehicle}_audio.mp3"), re=True)
     print("[v3] Done")
 if __name__=="__main__": main()
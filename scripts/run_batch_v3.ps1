@@ -1,14 +1,36 @@
 param([Parameter(Mandatory=$true)][string]$CsvPath,
       [string]$OutDir="C:\Users\gregc\vi-clean\dist\pipeline-output",
       [string]$Model="gpt-4o",
-      [string]$Ffmpeg=$env:FFMPEG_EXE)
+      [string]$Ffmpeg=$env:FFMPEG_EXE,
+      [int]$Workers=0,
+      [string[]]$Limit=@(),
+      [string]$Trace="",
+      [string]$Queue="",
+      [switch]$Batch,
+      [switch]$Upload)
+# Default: one scripts\pipeline_v3.py process per row, as before. -Batch opts into one
+# batch_v3.py process running the repo-root pipeline_v3.py instead; its technical-writer
+# prompt (numbered steps) writes different scripts than the loop does. -Upload makes
+# -Batch push finished vehicles too (the loop always uploads when the uploader exists).
 $ErrorActionPreference="Stop"; $VerbosePreference="Continue"
 .\scripts\csv.validate.ps1 -CsvPath $CsvPath
+if($Batch){
+  # One long-lived process: vehicles run in parallel with per-stage caps (see batch_v3.py)
+  $args=@(".\batch_v3.py","--csv",$CsvPath,"--output",$OutDir,"--model",$Model,"--ffmpeg",$Ffmpeg,"--workers",$Workers)
+  foreach($l in $Limit){ $args+=@("--limit",$l) }
+  if($Trace){ $args+=@("--trace",$Trace) }
+  if($Upload){ $args+=@("--upload") }
+  # Durable SQLite job queue: rerun (or start more workers) with the same -Queue to resume
+  if($Queue){ $args+=@("--queue",$Queue) }
+  & py @args 2>&1 | Write-Host
+  exit $LASTEXITCODE
+}
 $rows=Import-Csv $CsvPath; $count=@($rows).Count
 Write-Host "[batch] Rows=$count OutDir=$OutDir" -ForegroundColor Cyan
 foreach($r in $rows){
   $vid=$r.vehicleId; $pdf=$r.pdf; $imgs=$r.images
   $args=@("--pdf",$pdf,"--images",$imgs,"--output",$OutDir,"--vehicle",$vid,"--model",$Model,"--ffmpeg",$Ffmpeg)
+  if($Trace){ $args+=@("--trace",$Trace) }
   Write-Host "[run] $vid" -ForegroundColor Green
   & py .\scripts\pipeline_v3.py @args 2>&1 | Write-Host
   if($LASTEXITCODE -eq 0 -and (Test-Path "$OutDir\$vid`_video.mp4")){
@@ -1,24 +1,112 @@
-﻿import os, sys
-from pdf2image import convert_from_path
+﻿import argparse, collections, os, re, sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from pdf2image import convert_from_path, pdfinfo_from_path
 import pytesseract
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))  # repo root, for vi_pipeline
+from vi_pipeline.pagestore import open_page_store
 
-if len(sys.argv) < 3:
-    print("Usage: python ocr_pdf.py <in.pdf> <out.txt> [max_pages]")
-    sys.exit(2)
+# Pages are rasterised one at a time inside each worker and handed out in small
+# batches, so peak memory is ~workers x one page bitmap no matter how long the
+# scan is. Text is written to the output file in page order as batches finish.
 
-pdf, out = sys.argv[1], sys.argv[2]
-max_pages = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+DEFAULT_DPI = 200
+DEFAULT_BATCH = 4
+DEFAULT_MAX_MEMORY_MB = 1024
+LETTER_PTS = (612.0, 792.0)
 
-if "TESSERACT_PATH" in os.environ:
-    pytesseract.pytesseract.tesseract_cmd = os.environ["TESSERACT_PATH"]
 
-pages = convert_from_path(pdf, dpi=200, first_page=1, last_page=max_pages)
-chunks = []
-for i, img in enumerate(pages, 1):
-    txt = pytesseract.image_to_string(img, lang="eng")
-    chunks.append(txt)
-    print(f"OCR page {i}/{len(pages)} -> {len(txt)} chars")
+def page_bitmap_bytes(info, dpi):
+    # RGB bitmap at dpi, plus the same again for tesseract's internal copy
+    m = re.match(r"\s*([\d.]+)\s*x\s*([\d.]+)", str(info.get("Page size", "")))
+    w, h = (float(m.group(1)), float(m.group(2))) if m else LETTER_PTS
+    return int(w / 72 * dpi) * int(h / 72 * dpi) * 3 * 2
 
-with open(out, "w", encoding="utf-8") as f:
-    f.write("\n\n".join(chunks))
-print(f"Wrote OCR text to {out}")
\ No newline at end of file
+
+def plan_workers(requested, max_memory_mb, page_bytes):
+    fit = max(1, (max_memory_mb * 1024 * 1024) // page_bytes)
+    return max(1, min(requested, fit))
+
+
+def init_worker(tesseract_cmd):
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+
+def ocr_batch(pdf, first, last, dpi, lang):
+    texts = []
+    for page in range(first, last + 1):
+        img = convert_from_path(pdf, dpi=dpi, first_page=page, last_page=page)[0]
+        try:
+            texts.append(pytesseract.image_to_string(img, lang=lang))
+        finally:
+            img.close()
+    return texts
+
+
+def ocr_pages(pdf, first, last, workers, dpi=DEFAULT_DPI, batch=DEFAULT_BATCH, lang="eng", tesseract_cmd=None):
+    """Yield (page_number, text) for pages first..last (1-based), in order."""
+    batches = [(a, min(a + batch - 1, last)) for a in range(first, last + 1, batch)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(tesseract_cmd,)) as pool:
+        pending = collections.deque()
+        nxt = 0
+        while nxt < len(batches) or pending:
+            # only finished text waits in the queue; bitmaps live inside running workers
+            while nxt < len(batches) and len(pending) < 2 * workers:
+                a, b = batches[nxt]
+                pending.append((a, pool.submit(ocr_batch, pdf, a, b, dpi, lang)))
+                nxt += 1
+            a, fut = pending.popleft()
+            for offset, txt in enumerate(fut.result()):
+                yield a + offset, txt
+
+
+def main():
+    ap = argparse.ArgumentParser(usage="python ocr_pdf.py <in.pdf> <out.txt> [max_pages] [--workers N] [--max-memory-mb MB]")
+    ap.add_argument("pdf")
+    ap.add_argument("out")
+    ap.add_argument("max_pages", nargs="?", type=int, default=20)
+    ap.add_argument("--workers", type=int, default=int(os.environ.get("OCR_WORKERS", os.cpu_count() or 1)))
+    ap.add_argument("--max-memory-mb", type=int, default=int(os.environ.get("OCR_MAX_MEMORY_MB", DEFAULT_MAX_MEMORY_MB)),
+                    help="ceiling for page bitmaps held at once across all workers")
+    ap.add_argument("--dpi", type=int, default=DEFAULT_DPI)
+    ap.add_argument("--batch", type=int, default=DEFAULT_BATCH, help="pages per worker task")
+    ap.add_argument("--lang", default="eng")
+    ap.add_argument("--no-store", action="store_true", help="do not read or add to the shared page-text store")
+    if len(sys.argv) < 3:
+        ap.print_usage()
+        sys.exit(2)
+    a = ap.parse_args()
+
+    info = pdfinfo_from_path(a.pdf)
+    total = min(int(info.get("Pages", 0)), a.max_pages)
+    workers = plan_workers(a.workers, a.max_memory_mb, page_bitmap_bytes(info, a.dpi))
+    print(f"OCR {total} pages with {workers} workers (dpi {a.dpi}, ceiling {a.max_memory_mb} MB)")
+
+    # Pages already OCR'd for this PDF (by SHA-256, in any earlier run) come from
+    # the page store; only the rest are rasterised
+    def extract(start):
+        for i, txt in ocr_pages(a.pdf, start + 1, total, workers, dpi=a.dpi, batch=max(1, a.batch), lang=a.lang,
+                                tesseract_cmd=os.environ.get("TESSERACT_PATH")):
+            yield i - 1, txt, "ocr"
+
+    store = open_page_store(mode="off" if a.no_store else "use")
+    pages = store.iter_pages(a.pdf, "ocr", extract, lambda: int(info.get("Pages", 0)))
+    chars = 0
+    with open(a.out, "w", encoding="utf-8") as f:
+        for index, txt, _ in pages:
+            i = index + 1
+            if i > total:
+                break
+            if i > 1:
+                f.write("\n\n")
+            f.write(txt)
+            f.flush()
+            chars += len(txt)
+            print(f"OCR page {i}/{total} -> {len(txt)} chars")
+    pages.close()
+    print(f"Wrote OCR text to {a.out} ({chars} chars)")
+
+
+if __name__ == "__main__":  # guard required: worker processes re-import this module
+    main()
@@ -0,0 +1,5 @@
+"""
+Shared helpers for the content pipelines (pipeline.py, pipeline_v3.py and the
+scripts/ variants). Each module is self-contained; import what you need, e.g.
+``from vi_pipeline.concurrency import StageLimits``.
+"""
@@ -0,0 +1,250 @@
+"""
+Repeated header, footer and boilerplate stripping for extracted manual text.
+
+OEM manuals repeat running headers, footers, page numbers and warning boxes
+on most pages; passed through verbatim they eat a large share of the prompt
+budget. :class:`BoilerplateIndex` samples pages with PyMuPDF block
+coordinates and counts, per normalised line:
+
+* how many pages carry it in the top or bottom margin band (headers,
+  footers, page numbers), with digits folded to ``#`` so "Page 12" and
+  "Page 13" match, and
+* how many pages carry it anywhere (warning boxes, legal lines), matched on
+  the exact text so numbered content lines ("Section 3: ...") stay distinct.
+
+Lines over the threshold are boilerplate. :class:`Stripper` then cleans page
+texts (from the PDF, the page store or the tiered extractor alike): margin
+lines are dropped near the start and end of each page, and repeated body
+lines are kept on first sight and dropped afterwards, so the model still sees
+each warning once. It counts the bytes and lines it removed.
+
+Sampling reopens the PDF and lays out up to :data:`SAMPLE_PAGES` pages, which
+costs more than reading a manual back from the page store, so the counts are
+kept in a cache keyed by the PDF's SHA-256 (:meth:`BoilerplateIndex.load`)
+and a :class:`Stripper` made by :meth:`Stripper.for_pdf` only loads its index
+when it strips its first page: a skipped extract stage or a cached search
+index never touches the PDF.
+"""
+
+from __future__ import annotations
+
+import collections
+import json
+import re
+from typing import Any, Callable, Counter, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+import fitz  # PyMuPDF
+
+from vi_pipeline.cache import DiskCache, cache_key
+from vi_pipeline.stages import file_sha256
+
+# Share of sampled pages a line must appear on to count as boilerplate
+DEFAULT_MARGIN_SHARE = 0.3  # in the top/bottom band
+DEFAULT_BODY_SHARE = 0.5  # anywhere on the page
+# Height of the top and bottom bands, as a fraction of the page
+MARGIN_BAND = 0.1
+# Pages read to build the index, spread evenly over the document
+SAMPLE_PAGES = 60
+# Fewer sampled pages than this cannot tell boilerplate from content
+MIN_PAGES = 4
+# Margin lines are only dropped this close to the start or end of a page's text
+EDGE_LINES = 4
+# Shorter body lines ("NOTE", "CAUTION") are headings worth keeping
+MIN_BODY_CHARS = 24
+
+_DIGITS = re.compile(r"\d+")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(line: str, fold_digits: bool = True) -> str:
+    text = _SPACE.sub(" ", line.strip().lower())
+    return _DIGITS.sub("#", text) if fold_digits else text
+
+
+def sample_pages(total: int, limit: int = SAMPLE_PAGES) -> List[int]:
+    if total <= limit:
+        return list(range(total))
+    step = total / limit
+    return sorted({int(i * step) for i in range(limit)})
+
+
+def _page_lines(page: "fitz.Page") -> Iterator[Tuple[str, bool]]:
+    """``(line, in_margin)`` for every text line of ``page``, using block coordinates."""
+    height = page.rect.height or 1.0
+    top, bottom = page.rect.y0 + height * MARGIN_BAND, page.rect.y1 - height * MARGIN_BAND
+    for x0, y0, x1, y1, text, _, block_type in page.get_text("blocks"):
+        if block_type != 0:  # image block
+            continue
+        in_margin = y1 <= top or y0 >= bottom
+        for line in text.splitlines():
+            if line.strip():
+                yield line, in_margin
+
+
+class BoilerplateIndex:
+    """Cross-page line frequencies for one PDF.
+
+    Args:
+        margin_share: Share of sampled pages a line must sit in the top or
+            bottom band on to be treated as a header/footer.
+        body_share: Share of sampled pages a line must appear on (anywhere)
+            to be treated as repeated boilerplate.
+    """
+
+    def __init__(self, margin_share: float = DEFAULT_MARGIN_SHARE, body_share: float = DEFAULT_BODY_SHARE):
+        self.margin_share = margin_share
+        self.body_share = body_share
+        self.pages = 0
+        self.margin: Counter[str] = collections.Counter()
+        self.anywhere: Counter[str] = collections.Counter()
+
+    def add_page(self, lines: List[Tuple[str, bool]]) -> None:
+        self.pages += 1
+        self.margin.update({normalize(line) for line, in_margin in lines if in_margin})
+        self.anywhere.update({normalize(line, fold_digits=False) for line, _ in lines})
+
+    @classmethod
+    def from_pdf(cls, pdf_path: str, sample: int = SAMPLE_PAGES, **kwargs) -> "BoilerplateIndex":
+        index = cls(**kwargs)
+        with fitz.open(pdf_path) as doc:
+            for i in sample_pages(doc.page_count, sample):
+                index.add_page(list(_page_lines(doc.load_page(i))))
+        return index
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"pages": self.pages, "margin": dict(self.margin), "anywhere": dict(self.anywhere)}
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any], **kwargs) -> "BoilerplateIndex":
+        index = cls(**kwargs)
+        index.pages = int(data["pages"])
+        index.margin.update({str(k): int(n) for k, n in data["margin"].items()})
+        index.anywhere.update({str(k): int(n) for k, n in data["anywhere"].items()})
+        return index
+
+    @classmethod
+    def load(cls, pdf_path: str, cache: Optional[DiskCache] = None, sample: int = SAMPLE_PAGES,
+             **kwargs) -> "BoilerplateIndex":
+        """The index for ``pdf_path`` from ``cache`` when present, else sampled and stored.
+
+        Only the counts are stored, so the share thresholds can change
+        without resampling.
+        """
+        if cache is None:
+            return cls.from_pdf(pdf_path, sample=sample, **kwargs)
+        key = cache_key("boilerplate/v1", file_sha256(pdf_path), sample, MARGIN_BAND)
+        data = cache.get_text(key)
+        if data is not None:
+            try:
+                return cls.from_json(json.loads(data), **kwargs)
+            except (ValueError, KeyError, TypeError, AttributeError):
+                pass
+        index = cls.from_pdf(pdf_path, sample=sample, **kwargs)
+        cache.put_text(key, json.dumps(index.to_json(), ensure_ascii=False, separators=(",", ":")))
+        return index
+
+    def _over(self, counts: Counter[str], share: float) -> Set[str]:
+        if self.pages < MIN_PAGES:
+            return set()
+        need = max(2, share * self.pages)
+        return {key for key, n in counts.items() if n >= need}
+
+    def margin_keys(self) -> Set[str]:
+        return self._over(self.margin, self.margin_share)
+
+    def body_keys(self) -> Set[str]:
+        return {key for key in self._over(self.anywhere, self.body_share) if len(key) >= MIN_BODY_CHARS}
+
+
+class Stripper:
+    """Remove boilerplate lines from page texts, in page order, and count what went.
+
+    Args:
+        index: The PDF's index, or a zero-argument callable that loads it on
+            the first :meth:`strip` call.
+    """
+
+    def __init__(self, index: Union[BoilerplateIndex, Callable[[], BoilerplateIndex]]):
+        self._index: Optional[BoilerplateIndex] = None
+        self._load: Optional[Callable[[], BoilerplateIndex]] = None
+        if isinstance(index, BoilerplateIndex):
+            self._use(index)
+        else:
+            self._load = index
+        self._seen: Set[str] = set()
+        self.pages = 0
+        self.bytes_in = 0
+        self.bytes_removed = 0
+        self.lines_removed = 0
+
+    def _use(self, index: BoilerplateIndex) -> None:
+        self._index = index
+        self._margin = index.margin_keys()
+        self._body = {key for key in index.body_keys() if normalize(key) not in self._margin}
+
+    @property
+    def index(self) -> BoilerplateIndex:
+        if self._index is None:
+            self._use(self._load())
+        return self._index
+
+    @classmethod
+    def for_pdf(cls, pdf_path: str, cache: Optional[DiskCache] = None, **kwargs) -> "Stripper":
+        """A stripper whose index is loaded (see :meth:`BoilerplateIndex.load`) on first use."""
+        return cls(lambda: BoilerplateIndex.load(pdf_path, cache=cache, **kwargs))
+
+    def fresh(self) -> "Stripper":
+        """A new stripper over the same index, for a second pass over the pages."""
+        return Stripper(self._index if self._index is not None else self._load)
+
+    def strip(self, text: str) -> str:
+        if self._index is None:
+            self._use(self._load())
+        lines = text.split("\n")
+        content = [i for i, line in enumerate(lines) if line.strip()]
+        edges = set(content[:EDGE_LINES] + content[-EDGE_LINES:])
+        kept: List[str] = []
+        for i, line in enumerate(lines):
+            key = normalize(line, fold_digits=False) if line.strip() else ""
+            drop = False
+            if key and i in edges and normalize(key) in self._margin:
+                drop = True
+            elif key in self._body:
+                drop = key in self._seen
+                self._seen.add(key)
+            if drop:
+                self.lines_removed += 1
+                self.bytes_removed += len(line.encode("utf-8")) + 1
+            else:
+                kept.append(line)
+        self.pages += 1
+        self.bytes_in += len(text.encode("utf-8"))
+        return "\n".join(kept)
+
+    def strip_pages(self, pages: Iterator[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
+        try:
+            for i, text in pages:
+                yield i, self.strip(text)
+        finally:
+            close = getattr(pages, "close", None)
+            if close is not None:
+                close()
+
+    def _key_counts(self) -> Tuple[int, int]:
+        if self._index is None:
+            return 0, 0
+        return len(self._margin), len(self._body)
+
+    def stats(self) -> dict:
+        margin, body = self._key_counts()
+        return {
+            "pages": self.pages, "bytes_in": self.bytes_in, "bytes_removed": self.bytes_removed,
+            "lines_removed": self.lines_removed, "margin_lines": margin, "body_lines": body,
+        }
+
+    def describe(self) -> str:
+        share = self.bytes_removed / self.bytes_in if self.bytes_in else 0.0
+        margin, body = self._key_counts()
+        return (f"removed {self.bytes_removed} of {self.bytes_in} bytes ({share:.0%}), {self.lines_removed} lines "
+                f"over {self.pages} pages; {margin} header/footer and {body} repeated body lines")
+
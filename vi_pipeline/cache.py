@@ -0,0 +1,348 @@
+"""
+Content-addressed on-disk cache shared by the pipelines.
+
+Entries are keyed by a SHA-256 over everything that affects the result (for
+LLM calls: input text, model, prompts and temperature), written atomically
+and evicted least-recently-used once the cache grows past ``max_bytes`` or
+older than ``max_age`` seconds.
+
+Writes do not rescan the directory: each cache keeps a running byte total
+from its last scan and only walks the directory again once that total passes
+``max_bytes`` or every ``EVICT_EVERY`` writes (which also picks up entries
+written by other processes and expires old ones). An over-full cache is
+trimmed to ``EVICT_LOW_WATER`` of its cap so the writes after it have room.
+
+File artefacts such as TTS MP3s are materialised into the output directory by
+hardlink (or reflink, then copy, as fallbacks) so a hit costs no extra I/O.
+
+The cache lives in ``$VI_CACHE_DIR`` (default ``~/.cache/vi-pipeline``), one
+sub-directory per kind of artefact, e.g. ``llm/`` and ``tts/``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
+from typing import Any, Callable, Optional
+
+CACHE_MODES = ("use", "refresh", "off")
+DEFAULT_MAX_BYTES = int(os.environ.get("VI_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+TTS_MAX_BYTES = int(os.environ.get("VI_TTS_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+TTS_MAX_AGE = float(os.environ.get("VI_TTS_CACHE_MAX_AGE_DAYS", "30")) * 86400
+# Writes between full eviction scans when the running total stays under max_bytes
+EVICT_EVERY = 256
+# An over-full cache is trimmed to this fraction of max_bytes, so the next
+# writes have headroom instead of each one triggering another scan
+EVICT_LOW_WATER = 0.9
+
+
+def default_cache_root() -> pathlib.Path:
+    root = os.environ.get("VI_CACHE_DIR")
+    if root:
+        return pathlib.Path(root)
+    return pathlib.Path.home() / ".cache" / "vi-pipeline"
+
+
+def cache_key(*parts: Any) -> str:
+    """Stable SHA-256 hex digest of JSON-serialisable parts."""
+    blob = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def llm_cache_key(
+    text: str, model: str, system_prompt: str, user_template: str, temperature: float
+) -> str:
+    """Key for a chat completion; any prompt or model change is a new entry."""
+    return cache_key("llm/v1", text, model, system_prompt, user_template, temperature)
+
+
+def normalise_tts_text(text: str) -> str:
+    """NFC-normalise and collapse whitespace; the TTS output does not depend on either."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def tts_cache_key(
+    text: str,
+    voice_id: str,
+    model_id: Optional[str],
+    stability: float,
+    similarity_boost: float,
+) -> str:
+    """Key for one synthesised segment."""
+    return cache_key(
+        "tts/v1", normalise_tts_text(text), voice_id, model_id or "", stability, similarity_boost
+    )
+
+
+def _reflink(src: pathlib.Path, dest: pathlib.Path) -> bool:
+    # FICLONE: copy-on-write clone on btrfs/XFS. Other platforms fall through.
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+
+    ficlone = 0x40049409
+    try:
+        with open(src, "rb") as s, open(dest, "wb") as d:
+            fcntl.ioctl(d.fileno(), ficlone, s.fileno())
+        return True
+    except OSError:
+        try:
+            dest.unlink()
+        except OSError:
+            pass
+        return False
+
+
+def link_or_copy(src: pathlib.Path, dest: pathlib.Path) -> str:
+    """Place ``src`` at ``dest`` by hardlink, reflink or copy. Returns the method used.
+
+    An existing ``dest`` is unlinked first so a previous hardlink into the
+    cache is never truncated in place.
+    """
+    dest = pathlib.Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        dest.unlink()
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(src, dest)
+        return "hardlink"
+    except OSError:
+        pass
+    if _reflink(src, dest):
+        return "reflink"
+    shutil.copyfile(src, dest)
+    return "copy"
+
+
+class DiskCache:
+    """A directory of ``<key[:2]>/<key>`` files with LRU eviction by total size.
+
+    ``mode`` controls behaviour: ``use`` reads and writes, ``refresh`` ignores
+    existing entries but stores new results, ``off`` bypasses the cache.
+    """
+
+    def __init__(
+        self,
+        root: pathlib.Path,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        mode: str = "use",
+        suffix: str = "",
+        max_age: Optional[float] = None,
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode {mode!r}; expected one of {CACHE_MODES}")
+        self.root = pathlib.Path(root)
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.suffix = suffix
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # Bytes on disk as of the last scan plus writes since; None until scanned
+        self._size: Optional[int] = None
+        self._writes = 0
+
+    def path_for(self, key: str) -> pathlib.Path:
+        return self.root / key[:2] / f"{key}{self.suffix}"
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def get_path(self, key: str) -> Optional[pathlib.Path]:
+        """Path of a live entry (marked as recently used), or None."""
+        if self.mode != "use":
+            return None
+        path = self.path_for(key)
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            return None
+        if self.max_age and time.time() - mtime > self.max_age:
+            return None
+        self._touch(path)
+        return path
+
+    def materialize(self, key: str, dest: pathlib.Path) -> bool:
+        """Link a cached entry to ``dest``. Returns False on a miss."""
+        path = self.get_path(key)
+        if path is None:
+            return False
+        try:
+            link_or_copy(path, dest)
+        except FileNotFoundError:  # evicted by another process in between
+            return False
+        return True
+
+    def get_text(self, key: str) -> Optional[str]:
+        data = self.get(key)
+        return None if data is None else data.decode("utf-8")
+
+    def put(self, key: str, data: bytes) -> None:
+        if self.mode == "off":
+            return
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temp file in the same directory, then rename over the
+        # target so readers never see a partial entry.
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+            self._touch(path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self.record_write(len(data))
+
+    def put_text(self, key: str, text: str) -> None:
+        self.put(key, text.encode("utf-8"))
+
+    def put_file(self, key: str, src: pathlib.Path, evict: bool = True) -> Optional[pathlib.Path]:
+        """Move ``src`` into the cache (atomically). Returns the entry path, or None if off."""
+        if self.mode == "off":
+            return None
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        os.close(fd)
+        try:
+            shutil.move(str(src), tmp)
+            os.replace(tmp, path)
+            self._touch(path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        if evict:
+            self.record_write(path.stat().st_size)
+        return path
+
+    def fetch_file(self, key: str, dest: pathlib.Path, produce: Callable[[pathlib.Path], None]) -> bool:
+        """Materialise ``key`` at ``dest``, calling ``produce(tmp_path)`` on a miss.
+
+        Returns True on a cache hit.
+        """
+        dest = pathlib.Path(dest)
+        if self.materialize(key, dest):
+            return True
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(dest.name + ".part")
+        produce(tmp)
+        entry = self.put_file(key, tmp, evict=False)
+        if entry is None:
+            os.replace(tmp, dest)
+            return False
+        link_or_copy(entry, dest)
+        # Evict only after linking so an oversized entry still reaches dest
+        self.record_write(entry.stat().st_size)
+        return False
+
+    def _touch(self, path: pathlib.Path) -> None:
+        # mtime doubles as last-access time for LRU ordering; stamp it with the
+        # precise clock since filesystem timestamps are often tick-granular.
+        now = time.time_ns()
+        try:
+            os.utime(path, ns=(now, now))
+        except OSError:
+            pass
+
+    def record_write(self, size: int) -> None:
+        """Count a write and run :meth:`evict` only when a scan is due."""
+        if not self.max_bytes and not self.max_age:
+            return
+        with self._lock:
+            self._writes += 1
+            if self._size is not None:
+                self._size += size
+            due = (
+                self._size is None
+                or self._writes >= EVICT_EVERY
+                or (self.max_bytes and self._size > self.max_bytes)
+            )
+        if due:
+            self.evict()
+
+    def entries(self) -> list[tuple[float, int, pathlib.Path]]:
+        out = []
+        if not self.root.is_dir():
+            return out
+        for shard in self.root.iterdir():
+            if not shard.is_dir():
+                continue
+            for path in shard.iterdir():
+                if path.name.startswith(".tmp-"):
+                    continue
+                try:
+                    st = path.stat()
+                except FileNotFoundError:
+                    continue
+                out.append((st.st_mtime, st.st_size, path))
+        return out
+
+    def evict(self) -> int:
+        """Drop expired entries, then, if over ``max_bytes``, least-recently-used
+        ones until under ``EVICT_LOW_WATER * max_bytes``. Returns bytes freed."""
+        if not self.max_bytes and not self.max_age:
+            return 0
+        cutoff = time.time() - self.max_age if self.max_age else None
+        with self._lock:
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes
+            if self.max_bytes and total > self.max_bytes:
+                target = int(self.max_bytes * EVICT_LOW_WATER)
+            freed = 0
+            for mtime, size, path in sorted(entries):
+                expired = cutoff is not None and mtime < cutoff
+                if not expired and (not self.max_bytes or total - freed <= target):
+                    break
+                try:
+                    path.unlink()
+                    freed += size
+                except FileNotFoundError:
+                    pass
+            self._size = total - freed
+            self._writes = 0
+            return freed
+
+
+def open_cache(name: str, mode: str = "use", **kwargs: Any) -> DiskCache:
+    """Open the named sub-cache under :func:`default_cache_root`."""
+    return DiskCache(default_cache_root() / name, mode=mode, **kwargs)
+
+
+def add_cache_args(parser: argparse.ArgumentParser) -> None:
+    """Register the shared ``--no-cache`` / ``--refresh`` flags."""
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--no-cache", action="store_true", help="Bypass the on-disk result cache")
+    group.add_argument("--refresh", action="store_true", help="Ignore cached results but store fresh ones")
+
+
+def cache_mode_from_args(args: argparse.Namespace) -> str:
+    if getattr(args, "no_cache", False):
+        return "off"
+    if getattr(args, "refresh", False):
+        return "refresh"
+    return "use"
@@ -0,0 +1,128 @@
+"""
+WebVTT captions from narration text and measured audio durations.
+
+Each narration segment is one TTS call whose exact duration is known from its
+MP3 headers (:mod:`vi_pipeline.mp3`). Within a segment, sentences are timed in
+proportion to their syllable (or character) count, which tracks speech time
+closely for TTS voices; long sentences are split into cues of at most
+``MAX_CUE_LINES`` lines of ``MAX_LINE_CHARS``. No decode or speech
+recognition pass is needed.
+
+Sentences come from :func:`vi_pipeline.segmenter.split_sentences`, the same
+splitter that built the segments, so decimals, list numbers and abbreviations
+("approx.", "No. 2") do not end a sentence and the cues line up with the
+segment text.
+"""
+
+from __future__ import annotations
+
+import pathlib
+import re
+from dataclasses import dataclass
+from typing import Iterable, List, Sequence, Tuple, Union
+
+from vi_pipeline.segmenter import split_sentences
+
+PathLike = Union[str, pathlib.Path]
+
+CAPTION_WEIGHTS = ("syllables", "chars")
+MAX_LINE_CHARS = 42
+MAX_CUE_LINES = 2
+
+_WORD = re.compile(r"[A-Za-z]+|\d+")
+_VOWEL_GROUPS = re.compile(r"[aeiouy]+")
+
+
+@dataclass
+class Cue:
+    start: float
+    end: float
+    text: str
+
+
+def syllables(word: str) -> int:
+    """Rough English syllable count (vowel groups, silent final e); digits count one each."""
+    if word.isdigit():
+        return len(word)
+    w = word.lower()
+    n = len(_VOWEL_GROUPS.findall(w))
+    if w.endswith("e") and not w.endswith(("le", "ee")) and n > 1:
+        n -= 1
+    return max(1, n)
+
+
+def weight(text: str, by: str = "syllables") -> int:
+    if by == "chars":
+        return max(1, len(text.strip()))
+    return max(1, sum(syllables(w) for w in _WORD.findall(text)))
+
+
+def sentences(text: str) -> List[str]:
+    return [s.strip() for s in split_sentences(text) if s.strip()]
+
+
+def wrap(text: str, width: int = MAX_LINE_CHARS) -> List[str]:
+    lines: List[str] = []
+    line = ""
+    for word in text.split():
+        if line and len(line) + 1 + len(word) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def _chunks(sentence: str) -> List[str]:
+    """Split a sentence into caption-sized pieces of whole lines."""
+    lines = wrap(sentence)
+    return ["\n".join(lines[i:i + MAX_CUE_LINES]) for i in range(0, len(lines), MAX_CUE_LINES)]
+
+
+def segment_cues(text: str, start: float, duration: float, by: str = "syllables") -> List[Cue]:
+    """Cues for one segment spoken from ``start`` for ``duration`` seconds."""
+    pieces = [chunk for s in sentences(text) for chunk in _chunks(s)]
+    if not pieces or duration <= 0:
+        return []
+    weights = [weight(p, by) for p in pieces]
+    total = float(sum(weights))
+    cues: List[Cue] = []
+    done = 0
+    for piece, w in zip(pieces, weights):
+        t0 = start + duration * done / total
+        done += w
+        cues.append(Cue(t0, start + duration * done / total, piece))
+    return cues
+
+
+def build_cues(segments: Iterable[Tuple[str, float]], by: str = "syllables") -> List[Cue]:
+    """Cues for consecutive ``(text, duration_seconds)`` segments."""
+    cues: List[Cue] = []
+    t = 0.0
+    for text, duration in segments:
+        cues.extend(segment_cues(text, t, duration, by))
+        t += duration
+    return cues
+
+
+def format_timestamp(seconds: float) -> str:
+    ms = int(round(seconds * 1000))
+    h, ms = divmod(ms, 3_600_000)
+    m, ms = divmod(ms, 60_000)
+    s, ms = divmod(ms, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}" if h else f"{m:02d}:{s:02d}.{ms:03d}"
+
+
+def to_webvtt(cues: Sequence[Cue]) -> str:
+    blocks = ["WEBVTT"]
+    for cue in cues:
+        # "-->" would end the cue timing line early; it cannot appear in cue text
+        text = cue.text.replace("-->", "->")
+        blocks.append(f"{format_timestamp(cue.start)} --> {format_timestamp(cue.end)}\n{text}")
+    return "\n\n".join(blocks) + "\n"
+
+
+def write_webvtt(path: PathLike, cues: Sequence[Cue]) -> None:
+    pathlib.Path(path).write_text(to_webvtt(cues), encoding="utf-8")
@@ -0,0 +1,189 @@
+"""
+Concurrency primitives shared by the pipeline stages.
+
+``StageLimits`` caps how many callers may be inside a named stage at once
+(e.g. ``extract``, ``llm``, ``tts``, ``render``). It lets one long-lived
+process run many vehicles in parallel without oversubscribing the CPU with
+ffmpeg encodes or tripping API concurrency quotas.
+
+``RateLimiter`` enforces a provider's account-wide quota: requests in flight
+plus a sliding one-minute budget of units (characters for TTS).
+"""
+
+from __future__ import annotations
+
+import argparse
+import collections
+import contextlib
+import os
+import threading
+import time
+from typing import Callable, Deque, Dict, Iterable, Iterator, Mapping, Optional, Tuple
+
+# Defaults for a batch run. Network-bound stages can go wider than the
+# CPU-bound ones; ffmpeg already uses several threads per encode.
+DEFAULT_STAGE_LIMITS: Dict[str, int] = {
+    "extract": max(1, (os.cpu_count() or 2) // 2),
+    "llm": 8,
+    "tts": 4,
+    "render": max(1, (os.cpu_count() or 2) // 2),
+}
+
+
+class StageLimits:
+    """Per-stage bounded semaphores.
+
+    Stages without a configured limit are unbounded, so pipeline code can
+    always wrap its work in ``limits.slot(name)`` regardless of how the run
+    was configured.
+    """
+
+    def __init__(self, limits: Optional[Mapping[str, int]] = None):
+        self.limits: Dict[str, int] = dict(DEFAULT_STAGE_LIMITS)
+        if limits:
+            self.limits.update(limits)
+        self._sems = {
+            name: threading.BoundedSemaphore(n)
+            for name, n in self.limits.items()
+            if n and n > 0
+        }
+
+    @contextlib.contextmanager
+    def slot(self, stage: str) -> Iterator[None]:
+        sem = self._sems.get(stage)
+        if sem is None:
+            yield
+            return
+        with sem:
+            yield
+
+
+def stage_slot(limits: Optional[StageLimits], stage: str):
+    """Return ``limits.slot(stage)``, or a no-op context when ``limits`` is None."""
+    if limits is None:
+        return contextlib.nullcontext()
+    return limits.slot(stage)
+
+
+def parse_stage_limits(specs: Iterable[str]) -> Dict[str, int]:
+    """Parse ``["tts=4", "render=2"]`` style CLI values into a dict.
+
+    Raises:
+        ValueError: If an entry is not ``name=<positive int>``.
+    """
+    out: Dict[str, int] = {}
+    for spec in specs:
+        name, sep, value = spec.partition("=")
+        if not sep or not name.strip():
+            raise ValueError(f"Bad stage limit {spec!r}; expected name=N")
+        try:
+            n = int(value)
+        except ValueError:
+            raise ValueError(f"Bad stage limit {spec!r}; expected name=N with N a whole number") from None
+        if n < 1:
+            raise ValueError(f"Stage limit for {name!r} must be >= 1")
+        out[name.strip()] = n
+    return out
+
+
+def positive_int(value: str) -> int:
+    """argparse ``type=`` for counts that must be >= 1."""
+    try:
+        n = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a whole number, got {value!r}") from None
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"must be >= 1, got {n}")
+    return n
+
+
+def _env_int(name: str) -> Optional[int]:
+    raw = os.environ.get(name, "").strip()
+    if not raw:
+        return None
+    try:
+        n = int(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be a whole number, got {raw!r}") from None
+    if n < 1:
+        raise ValueError(f"{name} must be >= 1, got {n}")
+    return n
+
+
+# Account-level quotas per provider. ElevenLabs limits concurrent requests by
+# plan (2 on free, 3 on starter, 5+ on paid tiers); characters per minute is our
+# own budget so a batch cannot burn the monthly allowance in one burst.
+# Override with <PROVIDER>_CONCURRENCY / <PROVIDER>_CHARS_PER_MINUTE env vars.
+PROVIDER_QUOTAS: Dict[str, Dict[str, int]] = {
+    "elevenlabs": {"max_in_flight": 3, "units_per_minute": 20000},
+}
+
+
+class RateLimiter:
+    """Cap in-flight calls and units (e.g. characters) per rolling minute.
+
+    Use as ``with limiter.acquire(len(text)): ...``. A single request larger
+    than the whole per-minute budget is let through once the window is empty
+    rather than blocking forever.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        units_per_minute: Optional[int] = None,
+        window: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_in_flight < 1:
+            raise ValueError(f"max_in_flight must be >= 1, got {max_in_flight}")
+        if units_per_minute is not None and units_per_minute < 1:
+            raise ValueError(f"units_per_minute must be >= 1, got {units_per_minute}")
+        self.max_in_flight = max_in_flight
+        self.units_per_minute = units_per_minute
+        self.window = window
+        self._clock = clock
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._cond = threading.Condition()
+        self._spent: Deque[Tuple[float, int]] = collections.deque()
+        self._spent_total = 0
+
+    @classmethod
+    def for_provider(cls, provider: str, **overrides) -> "RateLimiter":
+        """The provider's quota with env-var and keyword overrides applied.
+
+        Raises:
+            ValueError: If an override is not a whole number >= 1.
+        """
+        quota = dict(PROVIDER_QUOTAS.get(provider, {"max_in_flight": 4}))
+        env = provider.upper()
+        for var, field in ((f"{env}_CONCURRENCY", "max_in_flight"), (f"{env}_CHARS_PER_MINUTE", "units_per_minute")):
+            value = _env_int(var)
+            if value is not None:
+                quota[field] = value
+        quota.update({k: v for k, v in overrides.items() if v is not None})
+        return cls(**quota)
+
+    def _expire(self, now: float) -> None:
+        while self._spent and now - self._spent[0][0] >= self.window:
+            _, units = self._spent.popleft()
+            self._spent_total -= units
+
+    def _reserve(self, units: int) -> None:
+        if not self.units_per_minute:
+            return
+        with self._cond:
+            while True:
+                now = self._clock()
+                self._expire(now)
+                if not self._spent or self._spent_total + units <= self.units_per_minute:
+                    self._spent.append((now, units))
+                    self._spent_total += units
+                    return
+                # Sleep until the oldest reservation leaves the window
+                self._cond.wait(timeout=max(0.01, self.window - (now - self._spent[0][0])))
+
+    @contextlib.contextmanager
+    def acquire(self, units: int = 1) -> Iterator[None]:
+        with self._in_flight:
+            self._reserve(units)
+            yield
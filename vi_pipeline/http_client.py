@@ -0,0 +1,196 @@
+"""
+Shared HTTP client for the OpenAI and ElevenLabs calls.
+
+One keep-alive ``requests.Session`` per host (so a batch pays one TLS
+handshake per connection, not per segment), retries with exponential backoff
+and full jitter on connection errors, 429 and 5xx, ``Retry-After`` honoured,
+and explicit connect/read timeouts on every request so a hung socket cannot
+block a batch worker forever. A read timeout on a POST is not retried unless
+the call opts in (``retry_read_timeout=True``): the server may already have
+done (and billed) the completion or synthesis, and each retry would add
+another full read timeout to the worst case.
+
+``OPENAI_BASE_URL`` / ``ELEVENLABS_BASE_URL`` redirect the respective API
+(e.g. to the local stand-in in ``benchmarks/stub_api.py``) without touching
+the pipelines' hard-coded URLs.
+"""
+
+from __future__ import annotations
+
+import email.utils
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from vi_pipeline import trace
+
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 120.0
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+# Connections kept alive per host; sized for concurrent TTS/LLM workers.
+POOL_MAXSIZE = 32
+
+Timeout = Union[float, Tuple[float, float]]
+
+# Default API base -> environment variable that may override it
+BASE_URL_ENV = {
+    "https://api.openai.com/v1": "OPENAI_BASE_URL",
+    "https://api.elevenlabs.io/v1": "ELEVENLABS_BASE_URL",
+}
+
+# Methods safe to resend after a read timeout
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+
+def resolve_url(url: str) -> str:
+    """Apply ``OPENAI_BASE_URL`` / ``ELEVENLABS_BASE_URL`` overrides to ``url``."""
+    for base, env in BASE_URL_ENV.items():
+        if url.startswith(base):
+            override = os.environ.get(env)
+            if override:
+                return override.rstrip("/") + url[len(base):]
+    return url
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Parse a ``Retry-After`` header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class HttpClient:
+    """Pooled, retrying HTTP client. Safe to share across threads."""
+
+    def __init__(
+        self,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        max_backoff: float = MAX_BACKOFF,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+    ):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def session_for(self, url: str) -> requests.Session:
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+                session.mount(host, adapter)
+                self._sessions[host] = session
+            return session
+
+    def _sleep_for(self, attempt: int, response: Optional[requests.Response]) -> float:
+        if response is not None:
+            hinted = retry_after_seconds(response.headers.get("Retry-After"))
+            if hinted is not None:
+                return min(hinted, self.max_backoff)
+        # Full jitter: uniform in [0, backoff * 2**attempt]
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        timeout: Optional[Timeout] = None,
+        retries: Optional[int] = None,
+        retry_read_timeout: Optional[bool] = None,
+        **kwargs,
+    ) -> requests.Response:
+        """Send a request, retrying transient failures.
+
+        ``timeout`` may be a read timeout (the connect timeout is then the
+        client default) or a ``(connect, read)`` tuple. Non-retryable
+        responses are returned as-is for the caller to inspect; after the last
+        retry the final response is returned, or the last exception raised.
+        The number of retries used is stored on ``response.retries``.
+
+        Connection errors and connect timeouts are always retried. Read
+        timeouts are retried only for idempotent methods unless
+        ``retry_read_timeout`` says otherwise.
+        """
+        if timeout is None:
+            timeout = (self.connect_timeout, self.read_timeout)
+        elif not isinstance(timeout, tuple):
+            timeout = (self.connect_timeout, float(timeout))
+        retries = self.retries if retries is None else retries
+        if retry_read_timeout is None:
+            retry_read_timeout = method.upper() in IDEMPOTENT_METHODS
+        url = resolve_url(url)
+        session = self.session_for(url)
+        attempt = 0
+        while True:
+            try:
+                response = session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                read_timeout = isinstance(exc, requests.ReadTimeout)
+                if attempt >= retries or (read_timeout and not retry_read_timeout):
+                    trace.add(http_requests=attempt + 1, retries=attempt)
+                    raise
+                time.sleep(self._sleep_for(attempt, None))
+                attempt += 1
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < retries:
+                delay = self._sleep_for(attempt, response)
+                response.close()
+                time.sleep(delay)
+                attempt += 1
+                continue
+            response.retries = attempt
+            trace.add(http_requests=attempt + 1, retries=attempt)
+            return response
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+_default: Optional[HttpClient] = None
+_default_lock = threading.Lock()
+
+
+def default_client() -> HttpClient:
+    """Process-wide client shared by every pipeline stage."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = HttpClient()
+        return _default
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    """``requests.post`` replacement using the shared pooled, retrying client."""
+    return default_client().post(url, **kwargs)
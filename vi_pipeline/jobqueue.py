@@ -0,0 +1,327 @@
+"""
+Durable job queue for pipeline runs on a local SQLite database.
+
+The PowerShell loops keep no job state, so a batch that dies at row 30 starts
+over. :class:`JobQueue` keeps one row per vehicle in a SQLite file in WAL
+mode, which any number of worker processes on the box can pull from:
+
+* :meth:`JobQueue.claim` takes the oldest runnable job inside a
+  ``BEGIN IMMEDIATE`` transaction and gives the caller a lease. A job is
+  runnable when it is queued and due, or running with an expired lease (its
+  worker crashed).
+* :class:`Lease` heartbeats in the background so a long render keeps its
+  job. A worker that loses its lease cannot complete or fail the job.
+* :meth:`JobQueue.fail` puts the job back with exponential backoff until
+  ``max_attempts`` claims have been used, then moves it to ``dead`` with
+  its last error. :meth:`JobQueue.retry_dead` requeues dead jobs.
+* Per-stage records (from the pipeline manifest) are stored beside each job,
+  so ``status`` shows where a vehicle got to. Within a job, the manifest's
+  stage checkpoints make a retry resume at the stage that failed.
+
+Enqueuing is idempotent on the job key: an unchanged payload keeps its job
+(done stays done), and a changed one requeues it.
+
+    python -m vi_pipeline.jobqueue jobs.db status
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import pathlib
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+PathLike = Union[str, pathlib.Path]
+
+DEFAULT_LEASE_SECONDS = 300.0
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 30.0
+MAX_RETRY_BACKOFF = 15 * 60.0
+BUSY_TIMEOUT_MS = 30_000
+STATES = ("queued", "running", "done", "dead")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_after REAL NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_runnable ON jobs (state, run_after, id);
+CREATE TABLE IF NOT EXISTS job_stages (
+    job_id INTEGER NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    seconds REAL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, stage)
+);
+"""
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+@dataclass
+class Job:
+    id: int
+    key: str
+    payload: Dict[str, Any]
+    attempts: int
+    max_attempts: int
+    owner: str
+
+
+class JobQueue:
+    """A SQLite-backed job queue, safe to share across threads and processes.
+
+    Args:
+        path: Database file; created (with its schema) on first use.
+        lease_seconds: How long a claim lasts without a heartbeat.
+        max_attempts: Claims a job may use before it is dead-lettered.
+    """
+
+    def __init__(self, path: PathLike, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.path = pathlib.Path(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are per thread; autocommit, with explicit transactions
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, sql: str, params: Tuple = ()) -> int:
+        return self._conn().execute(sql, params).rowcount
+
+    def enqueue(self, key: str, payload: Dict[str, Any], max_attempts: Optional[int] = None) -> str:
+        """Add a job; returns ``added``, ``requeued`` (payload changed) or ``kept``."""
+        now = time.time()
+        blob = json.dumps(payload, sort_keys=True)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT payload, state FROM jobs WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO jobs (key, payload, max_attempts, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, blob, max_attempts or self.max_attempts, now, now))
+                outcome = "added"
+            elif row["payload"] != blob and row["state"] != "running":
+                conn.execute(
+                    "UPDATE jobs SET payload = ?, state = 'queued', attempts = 0, run_after = 0, last_error = NULL,"
+                    " finished_at = NULL, updated_at = ? WHERE key = ?", (blob, now, key))
+                outcome = "requeued"
+            else:
+                outcome = "kept"
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return outcome
+
+    def claim(self, owner: Optional[str] = None) -> Optional[Job]:
+        """Lease the oldest runnable job to ``owner``, or return None if there is none."""
+        owner = owner or worker_id()
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # A lapsed lease on the final attempt means the job keeps killing its worker
+            conn.execute(
+                "UPDATE jobs SET state = 'dead', lease_owner = NULL, lease_expires = NULL, updated_at = ?,"
+                " last_error = COALESCE(last_error || '; ', '') || 'lease expired on the last attempt'"
+                " WHERE state = 'running' AND lease_expires < ? AND attempts >= max_attempts", (now, now))
+            row = conn.execute(
+                "SELECT id, key, payload, attempts, max_attempts FROM jobs"
+                " WHERE (state = 'queued' AND run_after <= ?) OR (state = 'running' AND lease_expires < ?)"
+                " ORDER BY id LIMIT 1", (now, now)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = 'running', attempts = attempts + 1, lease_owner = ?, lease_expires = ?,"
+                " updated_at = ? WHERE id = ?", (owner, now + self.lease_seconds, now, row["id"]))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return Job(row["id"], row["key"], json.loads(row["payload"]), row["attempts"] + 1, row["max_attempts"], owner)
+
+    def heartbeat(self, job: Job) -> bool:
+        """Extend ``job``'s lease. False if the lease was lost to another worker."""
+        now = time.time()
+        return self._write(
+            "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND state = 'running' AND lease_owner = ?",
+            (now + self.lease_seconds, now, job.id, job.owner)) == 1
+
+    def complete(self, job: Job) -> bool:
+        now = time.time()
+        return self._write(
+            "UPDATE jobs SET state = 'done', lease_owner = NULL, lease_expires = NULL, last_error = NULL,"
+            " finished_at = ?, updated_at = ? WHERE id = ? AND state = 'running' AND lease_owner = ?",
+            (now, now, job.id, job.owner)) == 1
+
+    def fail(self, job: Job, error: str) -> Optional[str]:
+        """Requeue ``job`` with backoff, or dead-letter it on its last attempt.
+
+        Returns the new state, or None if the lease was lost.
+        """
+        now = time.time()
+        if job.attempts >= job.max_attempts:
+            state, run_after = "dead", 0.0
+        else:
+            state, run_after = "queued", now + min(MAX_RETRY_BACKOFF, RETRY_BACKOFF * 2 ** (job.attempts - 1))
+        changed = self._write(
+            "UPDATE jobs SET state = ?, run_after = ?, last_error = ?, lease_owner = NULL, lease_expires = NULL,"
+            " finished_at = CASE WHEN ? = 'dead' THEN ? END, updated_at = ?"
+            " WHERE id = ? AND state = 'running' AND lease_owner = ?",
+            (state, run_after, error[-4000:], state, now, now, job.id, job.owner))
+        return state if changed == 1 else None
+
+    def record_stages(self, job: Job, stages: Dict[str, Dict[str, Any]]) -> None:
+        """Store a manifest's ``stages`` records against ``job``."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO job_stages (job_id, stage, status, skipped, seconds, updated_at) VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (job_id, stage) DO UPDATE SET status = excluded.status, skipped = excluded.skipped,"
+                " seconds = excluded.seconds, updated_at = excluded.updated_at",
+                [(job.id, name, rec.get("status", "?"), int(bool(rec.get("skipped"))), rec.get("seconds"), now)
+                 for name, rec in stages.items()])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def retry_dead(self, keys: Iterable[str] = ()) -> int:
+        """Requeue dead jobs (all of them, or just ``keys``) with fresh attempts."""
+        keys = list(keys)
+        sql = ("UPDATE jobs SET state = 'queued', attempts = 0, run_after = 0, finished_at = NULL, updated_at = ?"
+               " WHERE state = 'dead'")
+        params: Tuple = (time.time(),)
+        if keys:
+            sql += f" AND key IN ({', '.join('?' * len(keys))})"
+            params += tuple(keys)
+        return self._write(sql, params)
+
+    def counts(self) -> Dict[str, int]:
+        out = {state: 0 for state in STATES}
+        for row in self._conn().execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state"):
+            out[row["state"]] = row["n"]
+        return out
+
+    def pending(self) -> bool:
+        """Whether any job is queued or running (possibly on another worker)."""
+        return self._conn().execute("SELECT 1 FROM jobs WHERE state IN ('queued', 'running') LIMIT 1").fetchone() is not None
+
+    def jobs(self, state: Optional[str] = None) -> List[sqlite3.Row]:
+        sql = "SELECT * FROM jobs" + (" WHERE state = ?" if state else "") + " ORDER BY id"
+        return self._conn().execute(sql, (state,) if state else ()).fetchall()
+
+    def stages(self, job_id: int) -> List[sqlite3.Row]:
+        return self._conn().execute("SELECT * FROM job_stages WHERE job_id = ? ORDER BY updated_at, stage",
+                                    (job_id,)).fetchall()
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class Lease:
+    """Heartbeat a claimed job from a background thread while the block runs.
+
+    ``lost`` is set once a heartbeat finds the job leased to someone else.
+    """
+
+    def __init__(self, queue: JobQueue, job: Job, interval: Optional[float] = None):
+        self.queue = queue
+        self.job = job
+        self.interval = interval or max(1.0, queue.lease_seconds / 3)
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f"lease-{job.key}", daemon=True)
+
+    def _beat(self) -> None:
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    if not self.queue.heartbeat(self.job):
+                        self.lost = True
+                        return
+                except sqlite3.Error:
+                    pass  # busy database; the next beat retries well inside the lease
+        finally:
+            self.queue.close()
+
+    def __enter__(self) -> "Lease":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def add_queue_args(parser: argparse.ArgumentParser) -> None:
+    """Register the shared ``--lease`` / ``--max-attempts`` flags."""
+    parser.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS,
+                        help="Seconds a claimed job survives without a heartbeat")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help="Attempts before a job is dead-lettered")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Inspect or repair a pipeline job queue")
+    ap.add_argument("db")
+    ap.add_argument("command", choices=("status", "retry-dead"))
+    ap.add_argument("keys", nargs="*", help="Job keys for retry-dead (default: all dead jobs)")
+    a = ap.parse_args()
+    queue = JobQueue(a.db)
+    if a.command == "retry-dead":
+        print(f"requeued {queue.retry_dead(a.keys)} dead jobs")
+    print(", ".join(f"{state} {n}" for state, n in queue.counts().items()))
+    for row in queue.jobs():
+        if row["state"] == "done":
+            continue
+        stages = ", ".join(f"{s['stage']}={s['status']}" for s in queue.stages(row["id"]))
+        error = (row["last_error"] or "").strip().splitlines()[-1:] or [""]
+        print(f"  {row['key']}: {row['state']} (attempt {row['attempts']}/{row['max_attempts']}) {stages} {error[0]}".rstrip())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Offline JSONL batches for the narration-script chat completions.
+
+For a large catalogue, one synchronous chat completion per vehicle is the
+slowest and most expensive path. Batch mode splits it in two phases:
+
+1. ``batch_v3.py --llm-batch-out requests.jsonl`` runs every vehicle up to
+   its extract stage and writes the script request each one would send, one
+   per line in the OpenAI Batch API format (``custom_id``, ``method``,
+   ``url``, ``body``). Upload it to the batch endpoint (discounted pricing)
+   and download the results file when it completes.
+2. ``batch_v3.py --llm-batch-in results.jsonl`` stores every successful
+   result in the LLM cache, then runs the batch as usual: extraction is
+   skipped by its manifest checkpoint and the script stage is a cache hit,
+   so each vehicle resumes from the script stage without calling the API.
+
+Custom IDs are the LLM cache key of the request (``llm-<sha256>``), so they
+are stable across runs, vehicles with identical excerpts share one request,
+and results map straight back onto cache entries. ``benchmarks/stub_api.py
+--batch`` answers a requests file locally for tests.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import pathlib
+import tempfile
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+from vi_pipeline.cache import DiskCache
+
+PathLike = Union[str, pathlib.Path]
+
+BATCH_URL = "/v1/chat/completions"
+CUSTOM_ID_PREFIX = "llm-"
+
+
+def custom_id(key: str) -> str:
+    return CUSTOM_ID_PREFIX + key
+
+
+def key_for(cid: str) -> Optional[str]:
+    """The LLM cache key in a custom ID, or None if it is not one of ours."""
+    if not cid.startswith(CUSTOM_ID_PREFIX):
+        return None
+    key = cid[len(CUSTOM_ID_PREFIX):]
+    return key if len(key) == 64 and all(c in "0123456789abcdef" for c in key) else None
+
+
+def batch_request(key: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """One batch input line for the chat ``payload`` cached under ``key``."""
+    return {"custom_id": custom_id(key), "method": "POST", "url": BATCH_URL, "body": payload}
+
+
+def write_requests(path: PathLike, requests: Iterable[Dict[str, Any]]) -> int:
+    """Write batch input lines (first of each custom ID wins) atomically. Returns the count."""
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    seen = set()
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for request in requests:
+                if request["custom_id"] in seen:
+                    continue
+                seen.add(request["custom_id"])
+                f.write(json.dumps(request, ensure_ascii=False, separators=(",", ":")) + "\n")
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return len(seen)
+
+
+def read_jsonl(path: PathLike) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as exc:
+                raise SystemExit(f"[llm-batch] {path}:{n}: not JSON ({exc})")
+
+
+def _content(record: Dict[str, Any]) -> str:
+    """The completion text of a successful result line; raises ValueError otherwise."""
+    if record.get("error"):
+        error = record["error"]
+        if isinstance(error, dict):
+            error = error.get("message") or error.get("code") or error
+        raise ValueError(str(error))
+    response = record.get("response") or {}
+    status = response.get("status_code")
+    body = response.get("body") or {}
+    if status != 200:
+        raise ValueError(f"status {status}: {(body.get('error') or {}).get('message', '')}".strip())
+    try:
+        return body["choices"][0]["message"]["content"].strip()
+    except (KeyError, IndexError, TypeError, AttributeError):
+        raise ValueError("no completion in response body")
+
+
+@dataclass
+class IngestReport:
+    stored: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    unknown: List[str] = field(default_factory=list)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    def describe(self) -> str:
+        parts = [f"stored {len(self.stored)} scripts", f"{len(self.failed)} failed"]
+        if self.unknown:
+            parts.append(f"{len(self.unknown)} foreign custom IDs ignored")
+        if self.prompt_tokens or self.completion_tokens:
+            parts.append(f"{self.prompt_tokens} prompt + {self.completion_tokens} completion tokens")
+        return ", ".join(parts)
+
+
+def ingest(path: PathLike, cache: DiskCache) -> IngestReport:
+    """Store each successful result line of a batch output file in ``cache``."""
+    if cache.mode != "use":
+        raise SystemExit("[llm-batch] ingesting results needs the LLM cache (drop --no-cache / --refresh)")
+    report = IngestReport()
+    for record in read_jsonl(path):
+        cid = str(record.get("custom_id", ""))
+        key = key_for(cid)
+        if key is None:
+            report.unknown.append(cid)
+            continue
+        try:
+            text = _content(record)
+        except ValueError as exc:
+            report.failed[cid] = str(exc)
+            continue
+        if not text:
+            report.failed[cid] = "empty completion"
+            continue
+        cache.put_text(key, text)
+        report.stored.append(cid)
+        usage = ((record.get("response") or {}).get("body") or {}).get("usage") or {}
+        report.prompt_tokens += int(usage.get("prompt_tokens") or 0)
+        report.completion_tokens += int(usage.get("completion_tokens") or 0)
+    return report
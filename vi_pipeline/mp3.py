@@ -0,0 +1,359 @@
+"""
+Pure-Python MP3 probing: duration, bitrate, sample rate and frame offsets.
+
+Walks MPEG audio frame headers and sums samples per frame, so the result is
+exact for both CBR and VBR streams and needs no ffprobe subprocess. When the
+first frame is a Xing/Info or VBRI header (LAME, ffmpeg and most encoders
+write one) its frame count is used instead of walking the file, and the LAME
+encoder delay/padding are subtracted so the duration is the gapless length a
+decoder actually plays.
+
+:func:`probe` returns an :class:`MP3Info`, :func:`probe_many` probes a batch of
+files concurrently, and :func:`frame_index` / :func:`byte_offset_at` map a
+playback time to the byte offset of the frame that contains it, e.g. to find
+where each segment starts inside a concatenated narration.
+"""
+
+from __future__ import annotations
+
+import pathlib
+import struct
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, List, NamedTuple, Optional, Tuple, Union
+
+Source = Union[str, pathlib.Path, bytes, bytearray]
+
+# Bitrates in kbps, indexed by (version_is_mpeg1, layer)[bitrate_index]
+_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Sample rates by version bits (0 = MPEG2.5, 2 = MPEG2, 3 = MPEG1)
+_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000),
+}
+# Xing/Info flag bits
+_XING_FRAMES, _XING_BYTES, _XING_TOC, _XING_QUALITY = 0x1, 0x2, 0x4, 0x8
+# Probing workers for probe_many (file reads overlap; parsing is cheap)
+DEFAULT_PROBE_WORKERS = 8
+
+
+@dataclass
+class MP3Info:
+    """What :func:`probe` learns about one MP3 stream.
+
+    ``duration`` is in seconds after removing encoder delay and padding;
+    ``audio_offset`` / ``audio_bytes`` delimit the audio frames, excluding
+    ID3 tags and the Xing/VBRI header frame. ``header`` names the metadata
+    frame the counts came from (``"xing"``, ``"info"``, ``"vbri"``), is
+    ``"frames"`` when every frame header was walked, or ``"none"`` for the
+    zero-length :meth:`empty` info.
+    """
+
+    duration: float
+    sample_rate: int
+    channels: int
+    bitrate_kbps: float
+    frames: int
+    samples: int
+    audio_offset: int
+    audio_bytes: int
+    vbr: bool
+    encoder_delay: int = 0
+    encoder_padding: int = 0
+    header: str = "frames"
+
+    @property
+    def duration_ms(self) -> int:
+        return int(round(self.duration * 1000))
+
+    @classmethod
+    def empty(cls) -> "MP3Info":
+        """Zero-length info for a file without audio frames (e.g. an empty TTS response)."""
+        return cls(duration=0.0, sample_rate=0, channels=0, bitrate_kbps=0.0, frames=0, samples=0,
+                   audio_offset=0, audio_bytes=0, vbr=False, header="none")
+
+
+class FrameIndex(NamedTuple):
+    """Byte offset of every audio frame, for time -> byte lookups."""
+
+    offsets: array  # 'Q' array, one entry per audio frame
+    samples_per_frame: int
+    sample_rate: int
+    encoder_delay: int
+    end: int  # byte offset just past the last frame
+
+
+def _read(source: Source) -> bytes:
+    return source if isinstance(source, (bytes, bytearray)) else pathlib.Path(source).read_bytes()
+
+
+def _id3v2_size(data: bytes) -> int:
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _audio_end(data: bytes) -> int:
+    end = len(data)
+    if end >= 128 and data[end - 128:end - 125] == b"TAG":  # ID3v1
+        end -= 128
+    return end
+
+
+def parse_frame_header(data: bytes, pos: int) -> Optional[Tuple[int, int, int, int]]:
+    """Decode the frame header at ``pos``.
+
+    Returns ``(frame_length, samples, sample_rate, bitrate_kbps)`` or None if
+    there is no valid header there.
+    """
+    if pos + 4 > len(data):
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    if data[pos] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version = (b1 >> 3) & 0x03
+    layer_bits = (b1 >> 1) & 0x03
+    bitrate_index = (b2 >> 4) & 0x0F
+    rate_index = (b2 >> 2) & 0x03
+    if version == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    layer = 4 - layer_bits
+    mpeg1 = version == 3
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_index]
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 0x01
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate * 1000 // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or mpeg1) else 576
+        length = (samples // 8) * bitrate * 1000 // sample_rate + padding
+    if length < 4:
+        return None
+    # b3 carries channel mode / emphasis; emphasis 2 is reserved
+    if (b3 & 0x03) == 2:
+        return None
+    return length, samples, sample_rate, bitrate
+
+
+def _first_frame(data: bytes, pos: int, end: int) -> Optional[Tuple[int, Tuple[int, int, int, int]]]:
+    while pos + 4 <= end:
+        hdr = parse_frame_header(data, pos)
+        if hdr is not None:
+            return pos, hdr
+        pos += 1
+    return None
+
+
+def _channels(data: bytes, pos: int) -> int:
+    return 1 if (data[pos + 3] >> 6) == 3 else 2
+
+
+def _vbr_header(data: bytes, pos: int, length: int) -> Optional[Tuple[str, int, int, int]]:
+    """Parse a Xing/Info or VBRI header in the frame at ``pos``.
+
+    Returns ``(kind, frames, encoder_delay, encoder_padding)``; the frame
+    count excludes the header frame itself. None if the frame is audio.
+    """
+    frame = data[pos:pos + length]
+    mpeg1 = (data[pos + 1] >> 3) & 0x03 == 3
+    mono = _channels(data, pos) == 1
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    x = 4 + side_info
+    tag = frame[x:x + 4]
+    if tag in (b"Xing", b"Info") and len(frame) >= x + 8:
+        flags = struct.unpack_from(">I", frame, x + 4)[0]
+        if not flags & _XING_FRAMES:
+            return None
+        frames = struct.unpack_from(">I", frame, x + 8)[0]
+        lame = x + 8 + 4 * bool(flags & _XING_FRAMES) + 4 * bool(flags & _XING_BYTES)
+        lame += 100 * bool(flags & _XING_TOC) + 4 * bool(flags & _XING_QUALITY)
+        delay = padding = 0
+        # LAME extension: 9-byte encoder string, then delay/padding 12 bits each at +21
+        if len(frame) >= lame + 24 and frame[lame:lame + 4] in (b"LAME", b"Lavc", b"Lavf", b"L3.9"):
+            d = frame[lame + 21:lame + 24]
+            delay = (d[0] << 4) | (d[1] >> 4)
+            padding = ((d[1] & 0x0F) << 8) | d[2]
+        return ("xing" if tag == b"Xing" else "info"), frames, delay, padding
+    if frame[36:40] == b"VBRI" and len(frame) >= 36 + 18:
+        delay = struct.unpack_from(">H", frame, 36 + 6)[0]
+        frames = struct.unpack_from(">I", frame, 36 + 14)[0]
+        return "vbri", frames, delay, 0
+    return None
+
+
+def probe(source: Source, walk: bool = False) -> MP3Info:
+    """Describe an MP3 file (or its bytes).
+
+    Args:
+        source: Path or raw bytes.
+        walk: Count frames by walking every header even when a Xing/VBRI
+            header provides the count (e.g. to verify a truncated file).
+
+    Raises:
+        ValueError: If no MPEG audio frame is found.
+    """
+    data = _read(source)
+    end = _audio_end(data)
+    found = _first_frame(data, _id3v2_size(data), end)
+    if found is None:
+        raise ValueError("no MPEG audio frames found")
+    pos, (length, spf, sample_rate, bitrate) = found
+    channels = _channels(data, pos)
+    vbr = _vbr_header(data, pos, length)
+    delay = padding = 0
+    kind = "frames"
+    if vbr is not None:
+        kind, header_frames, delay, padding = vbr
+        pos += length  # the header frame decodes to silence and is not played
+    audio_offset = pos
+
+    if vbr is not None and header_frames and not walk:
+        frames = header_frames
+        audio_bytes = end - audio_offset
+        is_vbr = kind in ("xing", "vbri")
+    else:
+        frames = audio_bytes = 0
+        first_rate, is_vbr = None, False
+        while pos + 4 <= end:
+            hdr = parse_frame_header(data, pos)
+            if hdr is None:
+                pos += 1
+                continue
+            length, _, _, rate = hdr
+            if first_rate is None:
+                first_rate = rate
+            elif rate != first_rate:
+                is_vbr = True
+            frames += 1
+            audio_bytes += length
+            pos += length
+    total = frames * spf
+    samples = max(0, total - delay - padding)
+    seconds_coded = total / sample_rate if sample_rate else 0.0
+    return MP3Info(
+        duration=samples / sample_rate,
+        sample_rate=sample_rate,
+        channels=channels,
+        bitrate_kbps=(audio_bytes * 8 / seconds_coded / 1000) if seconds_coded else float(bitrate),
+        frames=frames,
+        samples=samples,
+        audio_offset=audio_offset,
+        audio_bytes=audio_bytes,
+        vbr=is_vbr,
+        encoder_delay=delay,
+        encoder_padding=padding,
+        header=kind,
+    )
+
+
+def _probe_or_empty(source: Source) -> MP3Info:
+    try:
+        return probe(source)
+    except ValueError:
+        return MP3Info.empty()
+
+
+def probe_many(sources: Iterable[Source], workers: int = DEFAULT_PROBE_WORKERS) -> List[MP3Info]:
+    """:func:`probe` each source concurrently; results are in input order.
+
+    A source without audio frames gets :meth:`MP3Info.empty` rather than
+    failing the whole batch, as :func:`mp3_duration` returns 0.0 for it.
+    """
+    sources = list(sources)
+    if len(sources) <= 1 or workers <= 1:
+        return [_probe_or_empty(s) for s in sources]
+    with ThreadPoolExecutor(max_workers=min(workers, len(sources))) as pool:
+        return list(pool.map(_probe_or_empty, sources))
+
+
+def mp3_duration(source: Source) -> float:
+    """Duration in seconds of an MP3 file (or its bytes); 0.0 if it has no frames."""
+    try:
+        return probe(source).duration
+    except ValueError:
+        return 0.0
+
+
+def frame_index(source: Source) -> FrameIndex:
+    """Walk every audio frame of ``source`` and record its byte offset.
+
+    Raises:
+        ValueError: If no MPEG audio frame is found.
+    """
+    data = _read(source)
+    end = _audio_end(data)
+    found = _first_frame(data, _id3v2_size(data), end)
+    if found is None:
+        raise ValueError("no MPEG audio frames found")
+    pos, (length, spf, sample_rate, _) = found
+    delay = 0
+    vbr = _vbr_header(data, pos, length)
+    if vbr is not None:
+        delay = vbr[2]
+        pos += length
+    offsets = array("Q")
+    last = pos
+    while pos + 4 <= end:
+        hdr = parse_frame_header(data, pos)
+        if hdr is None:
+            pos += 1
+            continue
+        offsets.append(pos)
+        pos += hdr[0]
+        last = pos
+    return FrameIndex(offsets, spf, sample_rate, delay, last)
+
+
+def byte_offset_at(index: FrameIndex, seconds: float) -> int:
+    """Byte offset of the frame holding playback time ``seconds``.
+
+    Playback time excludes the encoder delay, which is skipped on decode.
+    Times past the end map to ``index.end``.
+    """
+    sample = int(round(seconds * index.sample_rate)) + index.encoder_delay
+    frame = sample // index.samples_per_frame
+    if frame >= len(index.offsets):
+        return index.end
+    return index.offsets[frame]
+
+
+def byte_offsets(index: FrameIndex, starts: Iterable[float]) -> List[int]:
+    return [byte_offset_at(index, t) for t in starts]
+
+
+def locate_segments(segments: List[MP3Info], joined: Source) -> List[Tuple[int, int]]:
+    """``(byte_offset, byte_length)`` of each segment inside their concatenation.
+
+    If ``joined`` is a stream copy of the segments (its audio is exactly their
+    frames back to back), offsets are the running sum of the segments' audio
+    bytes. Otherwise (re-encoded) each segment start is mapped through the
+    joined file's frame index at its playback time.
+    """
+    info = probe(joined, walk=True)
+    if info.audio_bytes == sum(s.audio_bytes for s in segments):
+        starts, pos = [], info.audio_offset
+        for s in segments:
+            starts.append(pos)
+            pos += s.audio_bytes
+        end = pos
+    else:
+        index = frame_index(joined)
+        times, t = [], 0.0
+        for s in segments:
+            times.append(t)
+            t += s.duration
+        starts, end = byte_offsets(index, times), index.end
+    bounds = starts + [end]
+    return [(bounds[i], bounds[i + 1] - bounds[i]) for i in range(len(segments))]
@@ -0,0 +1,191 @@
+"""
+Persistent per-page text store keyed by the PDF's SHA-256.
+
+Each extracted manual is one ``.vipages`` file under
+``$VI_CACHE_DIR/pages`` (``~/.cache/vi-pipeline/pages``)::
+
+    header  "VIPG" | version u16 | reserved u16 | page_count u32 | stored u32
+    index   stored x (offset u64 | length u32 | method u8 | pad 3)
+    blob    UTF-8 page texts, back to back
+
+The file is memory-mapped and a page is decoded only when it is read, so
+fetching pages 10-12 of a 600-page manual touches a few hundred bytes.
+``stored`` may be less than ``page_count``: a budgeted read that stopped early
+stores the pages it saw, and a later, longer read extends the same file.
+
+Text depends on the extractor, so the fast PyMuPDF pass and the tiered
+extractor (:mod:`vi_pipeline.tiered`) are stored as separate variants.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import pathlib
+import struct
+import tempfile
+from typing import Callable, Iterator, List, Optional, Tuple, Union
+
+from vi_pipeline.cache import CACHE_MODES, default_cache_root
+from vi_pipeline.stages import file_sha256
+
+PathLike = Union[str, pathlib.Path]
+
+MAGIC = b"VIPG"
+VERSION = 1
+_HEADER = struct.Struct("<4sHHII")
+_ENTRY = struct.Struct("<QIB3x")
+
+# Stored as a byte per page; order is part of the file format.
+METHODS = ("pymupdf", "pdfminer", "ocr")
+
+# (start_page) -> iterator of (page_index, text, method)
+ExtractFn = Callable[[int], Iterator[Tuple[int, str, str]]]
+
+
+class PageText:
+    """Read-only, memory-mapped view of one ``.vipages`` file."""
+
+    def __init__(self, path: PathLike):
+        self.path = pathlib.Path(path)
+        self._file = open(self.path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, _, self.page_count, self.stored = _HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{self.path}: not a v{VERSION} page store")
+            self._blob = _HEADER.size + self.stored * _ENTRY.size
+        except BaseException:
+            self._file.close()
+            raise
+
+    @property
+    def complete(self) -> bool:
+        return self.stored >= self.page_count
+
+    def _entry(self, index: int) -> Tuple[int, int, int]:
+        if not 0 <= index < self.stored:
+            raise IndexError(index)
+        return _ENTRY.unpack_from(self._map, _HEADER.size + index * _ENTRY.size)
+
+    def text(self, index: int) -> str:
+        offset, length, _ = self._entry(index)
+        start = self._blob + offset
+        return self._map[start:start + length].decode("utf-8")
+
+    def method(self, index: int) -> str:
+        return METHODS[self._entry(index)[2]]
+
+    def iter_pages(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, str, str]]:
+        """Yield ``(page_index, text, method)`` for stored pages ``start <= i < stop``."""
+        stop = self.stored if stop is None else min(stop, self.stored)
+        for i in range(start, stop):
+            yield i, self.text(i), self.method(i)
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> "PageText":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def write_pages(path: PathLike, page_count: int, pages: List[Tuple[str, str]]) -> None:
+    """Atomically write ``pages`` (``(text, method)`` for pages 0..n-1)."""
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    blobs = [text.encode("utf-8") for text, _ in pages]
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, 0, page_count, len(pages)))
+            offset = 0
+            for blob, (_, method) in zip(blobs, pages):
+                f.write(_ENTRY.pack(offset, len(blob), METHODS.index(method)))
+                offset += len(blob)
+            for blob in blobs:
+                f.write(blob)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class PageStore:
+    """Directory of ``.vipages`` files.
+
+    Args:
+        root: Store directory.
+        mode: ``"use"`` (read and write), ``"refresh"`` (re-extract and
+            overwrite) or ``"off"`` (bypass), as for :class:`DiskCache`.
+    """
+
+    def __init__(self, root: PathLike, mode: str = "use"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"cache mode must be one of {CACHE_MODES}, not {mode!r}")
+        self.root = pathlib.Path(root)
+        self.mode = mode
+
+    def path_for(self, pdf_sha: str, variant: str) -> pathlib.Path:
+        return self.root / pdf_sha[:2] / f"{pdf_sha}.{variant}.vipages"
+
+    def open(self, pdf_sha: str, variant: str) -> Optional[PageText]:
+        if self.mode != "use":
+            return None
+        try:
+            return PageText(self.path_for(pdf_sha, variant))
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def iter_pages(
+        self,
+        pdf_path: PathLike,
+        variant: str,
+        extract: ExtractFn,
+        page_count: Callable[[], int],
+    ) -> Iterator[Tuple[int, str, str]]:
+        """Yield every page in order, from the store where possible.
+
+        Pages past the stored prefix come from ``extract(start)``. Whatever
+        was read is written back when the generator finishes or is closed
+        early, so the next run starts with a longer prefix. ``page_count``
+        (the document's total) is only called when something is written.
+        """
+        if self.mode == "off":
+            yield from extract(0)
+            return
+        sha = file_sha256(pdf_path)
+        pages: List[Tuple[str, str]] = []
+        stored = self.open(sha, variant)
+        if stored is not None:
+            with stored:
+                for i, text, method in stored.iter_pages():
+                    pages.append((text, method))
+                    yield i, text, method
+                if stored.complete:
+                    return
+        known = len(pages)
+        fresh = extract(known)
+        try:
+            for i, text, method in fresh:
+                pages.append((text, method))
+                yield i, text, method
+        finally:
+            fresh.close()
+            if len(pages) > known:
+                write_pages(self.path_for(sha, variant), page_count(), pages)
+
+
+def default_store_root() -> pathlib.Path:
+    root = os.environ.get("VI_PAGESTORE_DIR")
+    return pathlib.Path(root) if root else default_cache_root() / "pages"
+
+
+def open_page_store(mode: str = "use") -> PageStore:
+    return PageStore(default_store_root(), mode=mode)
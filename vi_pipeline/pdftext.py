@@ -0,0 +1,257 @@
+"""
+Streaming PDF text extraction with PyMuPDF.
+
+``iter_page_texts`` yields one page at a time (calling ``get_text()`` once per
+page), so callers with a character budget can stop as soon as it is met
+instead of extracting a 600-page manual and slicing it afterwards.
+
+For jobs that need the whole manual, ``iter_page_texts_parallel`` shards the
+document into page ranges, extracts them in a process pool and still yields
+pages strictly in order.
+
+``tiered=True`` on the readers routes extraction through
+:mod:`vi_pipeline.tiered`, which re-reads thin pages with pdfminer or OCR.
+``strip=`` takes a :class:`vi_pipeline.boilerplate.Stripper` that removes
+repeated headers, footers and warning boxes from each page before it is
+counted against a budget. ``pages=`` restricts the readers to a set of page
+indices (e.g. one section, see :mod:`vi_pipeline.sections`), read from the
+page store when it holds them and otherwise extracted page range by range.
+"""
+
+from __future__ import annotations
+
+import collections
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import TYPE_CHECKING, Deque, Iterator, List, Optional, Sequence, Tuple
+
+import fitz  # PyMuPDF
+
+from vi_pipeline.stages import file_sha256
+
+if TYPE_CHECKING:
+    from vi_pipeline.boilerplate import Stripper
+    from vi_pipeline.pagestore import PageStore
+    from vi_pipeline.prompt import Packed
+
+# Below this many pages the process-pool start-up costs more than it saves.
+PARALLEL_MIN_PAGES = 120
+DEFAULT_SHARD_PAGES = 16
+
+
+def page_count(pdf_path: str) -> int:
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def iter_page_texts(
+    pdf_path: str, start: int = 0, stop: Optional[int] = None
+) -> Iterator[Tuple[int, str]]:
+    """Yield ``(page_index, text)`` for pages ``start <= i < stop``."""
+    with fitz.open(pdf_path) as doc:
+        stop = doc.page_count if stop is None else min(stop, doc.page_count)
+        for i in range(start, stop):
+            yield i, doc.load_page(i).get_text()
+
+
+def _extract_range(pdf_path: str, start: int, stop: int) -> List[str]:
+    return [text for _, text in iter_page_texts(pdf_path, start, stop)]
+
+
+def iter_page_texts_parallel(
+    pdf_path: str,
+    workers: Optional[int] = None,
+    shard_pages: int = DEFAULT_SHARD_PAGES,
+) -> Iterator[Tuple[int, str]]:
+    """Like :func:`iter_page_texts` over the whole file, extracted in a process pool.
+
+    At most ``2 * workers`` shards are in flight, so memory stays bounded even
+    when the consumer is slower than extraction.
+    """
+    total = page_count(pdf_path)
+    workers = workers or min(8, os.cpu_count() or 1)
+    if workers <= 1 or total < 2 * shard_pages:
+        yield from iter_page_texts(pdf_path)
+        return
+    ranges = [(a, min(a + shard_pages, total)) for a in range(0, total, shard_pages)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending: Deque[Tuple[int, Future]] = collections.deque()
+        next_range = 0
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < 2 * workers:
+                a, b = ranges[next_range]
+                pending.append((a, pool.submit(_extract_range, pdf_path, a, b)))
+                next_range += 1
+            a, fut = pending.popleft()
+            for offset, text in enumerate(fut.result()):
+                yield a + offset, text
+
+
+def _runs(indices: Sequence[int]) -> List[Tuple[int, int]]:
+    """Sorted page indices as ``(start, stop)`` runs of consecutive pages."""
+    runs: List[Tuple[int, int]] = []
+    for i in sorted(set(indices)):
+        if runs and runs[-1][1] == i:
+            runs[-1] = (runs[-1][0], i + 1)
+        else:
+            runs.append((i, i + 1))
+    return runs
+
+
+def iter_selected_pages(
+    pdf_path: str,
+    pages: Sequence[int],
+    tiered: bool = False,
+    store: Optional["PageStore"] = None,
+) -> Iterator[Tuple[int, str]]:
+    """Yield ``(page_index, text)`` for just ``pages``, in order.
+
+    Runs the store already holds are read from it; the rest are extracted
+    directly. The store only keeps a prefix of each document, so pages read
+    here are not written back.
+    """
+    stored = None
+    if store is not None:
+        stored = store.open(file_sha256(pdf_path), "tiered" if tiered else "fast")
+    try:
+        for a, b in _runs(pages):
+            if stored is not None and b <= stored.stored:
+                for i, text, _ in stored.iter_pages(a, b):
+                    yield i, text
+            elif tiered:
+                from vi_pipeline.tiered import iter_page_tiers
+
+                for i, text, _ in iter_page_tiers(pdf_path, a, b):
+                    yield i, text
+            else:
+                yield from iter_page_texts(pdf_path, a, b)
+    finally:
+        if stored is not None:
+            stored.close()
+
+
+def _pages(
+    pdf_path: str,
+    tiered: bool,
+    store: Optional["PageStore"] = None,
+    workers: Optional[int] = 1,
+    subset: Optional[Sequence[int]] = None,
+) -> Iterator[Tuple[int, str]]:
+    if subset is not None:
+        return iter_selected_pages(pdf_path, subset, tiered, store)
+    if tiered:
+        from vi_pipeline.tiered import iter_page_tiers
+
+    def extract(start: int) -> Iterator[Tuple[int, str, str]]:
+        if tiered:
+            return iter_page_tiers(pdf_path, start)
+        n = workers
+        if start == 0 and n is None:
+            n = 0 if page_count(pdf_path) >= PARALLEL_MIN_PAGES else 1
+        if start == 0 and n != 1:
+            pages = iter_page_texts_parallel(pdf_path, workers=n or None)
+        else:
+            pages = iter_page_texts(pdf_path, start)
+        return ((i, text, "pymupdf") for i, text in pages)
+
+    if store is None:
+        return _drop_method(extract(0))
+    variant = "tiered" if tiered else "fast"
+    return _drop_method(store.iter_pages(pdf_path, variant, extract, lambda: page_count(pdf_path)))
+
+
+def _drop_method(pages: Iterator[Tuple[int, str, str]]) -> Iterator[Tuple[int, str]]:
+    try:
+        for i, text, _ in pages:
+            yield i, text
+    finally:
+        pages.close()  # propagate an early stop so the store saves what was read
+
+
+def _cleaned(pages: Iterator[Tuple[int, str]], strip: Optional["Stripper"]) -> Iterator[Tuple[int, str]]:
+    return pages if strip is None else strip.strip_pages(pages)
+
+
+def read_text_budget(
+    pdf_path: str,
+    max_chars: int,
+    sep: str = "\n\n",
+    tiered: bool = False,
+    store: Optional["PageStore"] = None,
+    strip: Optional["Stripper"] = None,
+    pages: Optional[Sequence[int]] = None,
+) -> str:
+    """Join stripped, non-empty page texts with ``sep``, stopping once ``max_chars`` is reached.
+
+    Equivalent to extracting every page and slicing ``[:max_chars]``, but only
+    touches as many pages as the budget needs. With a ``store``, stored pages
+    are read from it and the PDF is only opened for pages it does not hold.
+    """
+    parts: List[str] = []
+    size = 0
+    texts = _cleaned(_pages(pdf_path, tiered, store, subset=pages), strip)
+    for _, text in texts:
+        text = text.strip()
+        if not text:
+            continue
+        size += len(text) + (len(sep) if parts else 0)
+        parts.append(text)
+        if size >= max_chars:
+            break
+    texts.close()  # flush the pages read so far to the store
+    return sep.join(parts)[:max_chars]
+
+
+def read_token_budget(
+    pdf_path: str,
+    budget: int,
+    model: str,
+    sep: str = "\n\n",
+    tiered: bool = False,
+    store: Optional["PageStore"] = None,
+    strip: Optional["Stripper"] = None,
+    pages: Optional[Sequence[int]] = None,
+) -> "Packed":
+    """Pack whole paragraphs of the manual, in page order, into ``budget`` tokens of ``model``.
+
+    Like :func:`read_text_budget`, pages are read only until the budget is
+    full. The result records how many pages contributed out of the total
+    (or out of ``pages`` when given).
+    """
+    from vi_pipeline.prompt import Packer, paragraphs, tokenizer_for
+
+    packer = Packer(budget, tokenizer_for(model), sep)
+    used = 0
+    texts = _cleaned(_pages(pdf_path, tiered, store, subset=pages), strip)
+    for _, text in texts:
+        before = len(packer.parts)
+        for paragraph in paragraphs(text):
+            if not packer.offer(paragraph):
+                break
+        if len(packer.parts) > before:
+            used += 1
+        if packer.full:
+            break
+    texts.close()  # flush the pages read so far to the store
+    packed = packer.result()
+    packed.pages, packed.pages_total = used, len(set(pages)) if pages is not None else page_count(pdf_path)
+    return packed
+
+
+def read_all_text(
+    pdf_path: str,
+    sep: str = "\n",
+    workers: Optional[int] = None,
+    tiered: bool = False,
+    store: Optional["PageStore"] = None,
+    strip: Optional["Stripper"] = None,
+    pages: Optional[Sequence[int]] = None,
+) -> str:
+    """Whole-document text, page texts joined with ``sep`` (no stripping).
+
+    ``workers=None`` picks the page-parallel path automatically for long
+    documents; ``workers=1`` forces a single-process pass. With ``tiered`` the
+    PyMuPDF pass is single-process and only escalated pages fan out. A
+    ``store`` holding the whole document answers without opening the PDF.
+    """
+    return sep.join(text for _, text in _cleaned(_pages(pdf_path, tiered, store, workers=workers, subset=pages), strip))
@@ -0,0 +1,260 @@
+"""
+Token-budgeted prompt packing.
+
+Instead of slicing the manual to its first N characters (which wastes or
+overflows the context window depending on content, and cuts words and table
+rows in half), text is packed into a token budget one whole paragraph at a
+time. A heading travels with the paragraph after it, and when the next
+paragraph does not fit, as many of its whole lines as fit are kept, so
+nothing is split mid-line. Only when not even the first line (or word) fits
+an empty prompt is it cut at the token level, so the excerpt is never empty.
+
+Tokens are counted with ``tiktoken`` for the configured model when it is
+installed (it is optional); otherwise :func:`estimate_tokens` gives a
+slightly pessimistic word/punctuation estimate, so a packed prompt stays
+under budget either way. :class:`Packed` reports how much of the manual went
+in (paragraphs, characters or pages).
+"""
+
+from __future__ import annotations
+
+import functools
+import re
+import sys
+from dataclasses import dataclass
+from typing import List, Optional
+
+from vi_pipeline.summarize import is_heading
+
+# Encoding for models tiktoken does not know by name
+FALLBACK_ENCODING = "o200k_base"
+# Upper bound on characters per token for manual text; sizes extraction ahead of packing
+MAX_CHARS_PER_TOKEN = 6
+
+_PIECES = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+
+_warned = set()
+
+
+def _warn_once(key: str, reason: str) -> None:
+    if key not in _warned:
+        _warned.add(key)
+        print(f"[prompt] tiktoken unavailable ({reason}); estimating token counts", file=sys.stderr)
+
+
+def _piece_tokens(piece: str) -> int:
+    return -(-len(piece) // 5) if piece[0].isalpha() else 1
+
+
+def estimate_tokens(text: str) -> int:
+    """Token estimate without a tokenizer: ~5 letters per token, 3 digits, 1 per symbol."""
+    return sum(_piece_tokens(piece) for piece in _PIECES.findall(text))
+
+
+def truncate_estimate(text: str, budget: int) -> str:
+    """Longest prefix of ``text`` whose :func:`estimate_tokens` is within ``budget``."""
+    n = 0
+    for m in _PIECES.finditer(text):
+        cost = _piece_tokens(m.group())
+        if n + cost > budget:
+            # a long letter run is cut inside, at 5 letters per remaining token
+            return text[:m.start() + (budget - n) * 5 if m.group()[0].isalpha() else m.start()]
+        n += cost
+    return text
+
+
+class Tokenizer:
+    """Counts tokens for ``model`` with tiktoken, or estimates them if it is missing."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.name = "estimate"
+        self._encoding = None
+        try:
+            import tiktoken
+        except ImportError as exc:
+            _warn_once("import", str(exc))
+            return
+        try:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding(FALLBACK_ENCODING)
+        except Exception as exc:  # encoding files are fetched on first use; offline hosts may lack them
+            _warn_once("load", f"{type(exc).__name__}: {exc}")
+            return
+        self.name = f"tiktoken:{self._encoding.name}"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return estimate_tokens(text)
+
+    def truncate(self, text: str, budget: int) -> str:
+        """Longest prefix of ``text`` within ``budget`` tokens; may cut mid-word."""
+        if self._encoding is None:
+            return truncate_estimate(text, budget)
+        tokens = self._encoding.encode(text, disallowed_special=())
+        if len(tokens) <= budget:
+            return text
+        # A cut inside a multi-byte character decodes to U+FFFD; drop it. The
+        # prefix can re-encode to more tokens, so shorten until it fits.
+        keep = budget
+        head = self._encoding.decode(tokens[:keep]).rstrip("\ufffd")
+        while keep > 0 and self.count(head) > budget:
+            keep -= 1
+            head = self._encoding.decode(tokens[:keep]).rstrip("\ufffd")
+        return head
+
+
+@functools.lru_cache(maxsize=None)
+def tokenizer_for(model: str) -> Tokenizer:
+    return Tokenizer(model)
+
+
+def paragraphs(text: str) -> List[str]:
+    """Blank-line separated paragraphs, with heading-only paragraphs joined to the next one."""
+    out: List[str] = []
+    heading = ""
+    for block in re.split(r"\n\s*\n", text):
+        block = block.strip()
+        if not block:
+            continue
+        if "\n" not in block and is_heading(block):
+            heading = f"{heading}\n{block}" if heading else block
+            continue
+        out.append(f"{heading}\n{block}" if heading else block)
+        heading = ""
+    if heading:
+        out.append(heading)
+    return out
+
+
+@dataclass
+class Packed:
+    text: str
+    tokens: int
+    budget: int
+    tokenizer: str
+    paragraphs: int = 0
+    chars: int = 0
+    complete: bool = True
+    chars_total: Optional[int] = None
+    pages: int = 0
+    pages_total: Optional[int] = None
+
+    @property
+    def coverage(self) -> Optional[float]:
+        """Share of the source included, by characters when known, else by pages."""
+        if self.chars_total:
+            return self.chars / self.chars_total
+        if self.pages_total:
+            return self.pages / self.pages_total
+        return None
+
+    def describe(self) -> str:
+        parts = [f"{self.tokens}/{self.budget} tokens ({self.tokenizer})", f"{self.paragraphs} paragraphs"]
+        if self.chars_total:
+            parts.append(f"{self.chars} of {self.chars_total} chars")
+        if self.pages_total:
+            parts.append(f"{self.pages} of {self.pages_total} pages")
+        coverage = self.coverage
+        if coverage is not None:
+            parts.append(f"{coverage:.0%} included")
+        return ", ".join(parts)
+
+    def as_dict(self) -> dict:
+        coverage = self.coverage
+        return {
+            "tokens": self.tokens, "budget": self.budget, "tokenizer": self.tokenizer,
+            "paragraphs": self.paragraphs, "chars": self.chars, "chars_total": self.chars_total,
+            "pages": self.pages, "pages_total": self.pages_total, "complete": self.complete,
+            "coverage": None if coverage is None else round(coverage, 4),
+        }
+
+
+class Packer:
+    """Accumulate whole paragraphs until ``budget`` tokens are used.
+
+    :meth:`offer` returns False once the budget is full; feed paragraphs in
+    order and stop at the first False.
+    """
+
+    def __init__(self, budget: int, tokenizer: Tokenizer, sep: str = "\n\n"):
+        self.budget = budget
+        self.tokenizer = tokenizer
+        self.sep = sep
+        self.parts: List[str] = []
+        self.tokens = 0
+        self.full = False
+        self._sep_tokens = tokenizer.count(sep)
+
+    def _cost(self, text: str) -> int:
+        return self.tokenizer.count(text) + (self._sep_tokens if self.parts else 0)
+
+    def offer(self, paragraph: str) -> bool:
+        if self.full:
+            return False
+        cost = self._cost(paragraph)
+        if self.tokens + cost <= self.budget:
+            self.parts.append(paragraph)
+            self.tokens += cost
+            return True
+        # Keep the whole lines that fit (table rows and list items stay intact);
+        # only an empty prompt falls back to whole words
+        unit = "\n" if "\n" in paragraph or self.parts else " "
+        pieces = paragraph.split(unit)
+        used = self.tokens + (self._sep_tokens if self.parts else 0)
+        kept = 0
+        for piece in pieces:
+            cost = self.tokenizer.count(piece) + (self.tokenizer.count(unit) if kept else 0)
+            if used + cost > self.budget:
+                break
+            used += cost
+            kept += 1
+        if kept:
+            self.parts.append(unit.join(pieces[:kept]))
+            self.tokens = used
+        elif not self.parts:
+            # Not even the first line or word fits an empty prompt (one huge
+            # token run): cut it at the token level rather than send nothing
+            head = self.tokenizer.truncate(pieces[0], self.budget)
+            words = head.rsplit(None, 1)
+            if head != pieces[0] and not pieces[0][len(head)].isspace() and len(words) == 2 and len(words[1]) <= 32:
+                head = words[0]  # drop a cut-off word, but not a whole token run
+            head = head.rstrip()
+            if head:
+                self.parts.append(head)
+                self.tokens = self.tokenizer.count(head)
+        self.full = True
+        return False
+
+    def result(self) -> Packed:
+        text = self.sep.join(self.parts)
+        tokens = self.tokenizer.count(text)
+        # Per-part counts can differ slightly from the joined text's; trim lines until it fits
+        while tokens > self.budget and self.parts:
+            lines = self.parts[-1].split("\n")
+            if len(lines) > 1:
+                self.parts[-1] = "\n".join(lines[:-1])
+            else:
+                self.parts.pop()
+            self.full = True
+            text = self.sep.join(self.parts)
+            tokens = self.tokenizer.count(text)
+        return Packed(text=text, tokens=tokens, budget=self.budget, tokenizer=self.tokenizer.name,
+                      paragraphs=len(self.parts), chars=len(text), complete=not self.full)
+
+
+def pack(text: str, budget: int, model: str, sep: str = "\n\n") -> Packed:
+    """Pack ``text`` into ``budget`` tokens of ``model`` as whole paragraphs, in order."""
+    items = paragraphs(text)
+    packer = Packer(budget, tokenizer_for(model), sep)
+    for paragraph in items:
+        if not packer.offer(paragraph):
+            break
+    packed = packer.result()
+    packed.chars_total = len(sep.join(items))
+    return packed
@@ -0,0 +1,329 @@
+"""
+Local BM25 search over manual chunks, for feature-relevant prompt excerpts.
+
+A clip like "Use Apple CarPlay" may be covered on page 240, far past any
+leading-text budget. The manual is split into ~900-character chunks at
+paragraph boundaries (:func:`chunkify`, the chunking of
+``vi-seeder/seed_manual_chunks.mjs``); paragraphs longer than that, such as
+PyMuPDF pages without blank lines, are cut at line, sentence or word
+boundaries instead of mid-word. The chunks are indexed with Okapi BM25. The
+index is stored in CSR form in flat :mod:`array` buffers: per-term posting
+offsets, then chunk ids and term frequencies back to back. A query touches
+only its terms' postings, which takes milliseconds even for a 1,000-page
+manual.
+
+Indexes are persisted in the disk cache (``$VI_CACHE_DIR/bm25``) keyed on
+the PDF's SHA-256 and the extraction variant, so each manual is chunked and
+indexed once. :meth:`BM25Index.excerpt` packs the top-ranked chunks into a
+token budget (see :mod:`vi_pipeline.prompt`) and returns them in document
+order.
+
+    python -m vi_pipeline.search manual.pdf --query "Use Apple CarPlay"
+"""
+
+from __future__ import annotations
+
+import argparse
+import heapq
+import math
+import re
+import struct
+import sys
+from array import array
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from vi_pipeline.cache import DiskCache, cache_key
+from vi_pipeline.prompt import Packed, tokenizer_for
+
+CHUNK_TARGET = 900
+CHUNK_HARD_MAX = 1200
+DEFAULT_TOP_K = 8
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+MAGIC = b"VIBM"
+VERSION = 1
+# magic | version u16 | reserved u16 | chunks u32 | terms u32 | postings u32 | vocab bytes u32 | text bytes u64
+_HEADER = struct.Struct("<4sHHIIIIQ")
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# Where an over-long paragraph may be cut, coarsest first
+_BOUNDARIES = (re.compile(r"\n+"), re.compile(r"(?<=[.!?])\s+"), re.compile(r"\s+"))
+_STOPWORDS = frozenset("a an and are as at be by for from how in is it of on or the this to use with you your".split())
+
+
+def _pieces(text: str, limit: int, hard_max: int, level: int = 0) -> List[str]:
+    """``text`` cut at the coarsest boundaries (line, sentence, word) into pieces of at most ``limit`` chars.
+
+    Each piece keeps its trailing whitespace. Only a single word longer than
+    ``hard_max`` is sliced.
+    """
+    if len(text) <= limit:
+        return [text]
+    for n in range(level, len(_BOUNDARIES)):
+        cuts = [m.end() for m in _BOUNDARIES[n].finditer(text) if m.start() > 0 and m.end() < len(text)]
+        if cuts:
+            bounds = [0, *cuts, len(text)]
+            out: List[str] = []
+            for a, b in zip(bounds, bounds[1:]):
+                out.extend(_pieces(text[a:b], limit, hard_max, n + 1))
+            return out
+    return [text[i:i + hard_max] for i in range(0, len(text), hard_max)]
+
+
+def chunkify(text: str, target: int = CHUNK_TARGET, hard_max: int = CHUNK_HARD_MAX) -> List[str]:
+    """Split text into ~``target``-char chunks at blank-line paragraph boundaries.
+
+    Follows ``chunkify`` in vi-seeder/seed_manual_chunks.mjs (same chunks
+    while paragraphs fit ``target``). Where the seeder slices a longer
+    paragraph every ``hard_max`` chars, this cuts it at line, then sentence,
+    then word boundaries, so no chunk starts or ends mid-word.
+    """
+    chunks: List[str] = []
+    cur = ""
+    for p in re.split(r"\r?\n\s*\r?\n", text):
+        p = p.strip()
+        add = (cur + "\n\n" if cur else "") + p
+        if len(add) <= target:
+            cur = add
+            continue
+        if cur:
+            chunks.append(cur)
+            cur = ""
+        if len(p) <= target:
+            cur = p
+            continue
+        for piece in _pieces(p, target, hard_max):
+            if cur.strip() and len(cur.rstrip()) + len(piece.rstrip()) > target:
+                chunks.append(cur)
+                cur = ""
+            cur += piece
+        cur = cur.strip()
+    if cur.strip():
+        chunks.append(cur.strip())
+    return [c for c in (c.replace("\x00", "").strip() for c in chunks) if c]
+
+
+def splits_words(text: str, chunks: Sequence[str]) -> bool:
+    """Whether ``chunks`` lose text or cut a word of ``text`` across a chunk boundary."""
+    return " ".join(chunks).split() != text.replace("\x00", "").split()
+
+
+def tokenize(text: str) -> List[str]:
+    out = []
+    for word in _TOKEN.findall(text.lower()):
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        out.append(word)
+    return out
+
+
+def _le(arr: array) -> array:
+    """``arr`` in little-endian byte order (the on-disk order)."""
+    if sys.byteorder == "big":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr
+
+
+class BM25Index:
+    """Okapi BM25 over a manual's chunks, backed by flat arrays.
+
+    Args:
+        chunks: Chunk texts, in document order.
+        vocab: Term -> term id.
+        term_offsets: ``array('I')`` of ``len(vocab) + 1`` offsets into the postings.
+        post_docs: ``array('I')`` chunk ids, grouped by term.
+        post_tfs: ``array('H')`` term frequencies, parallel to ``post_docs``.
+        doc_lengths: ``array('I')`` token count per chunk.
+    """
+
+    def __init__(self, chunks: List[str], vocab: Dict[str, int], term_offsets: array,
+                 post_docs: array, post_tfs: array, doc_lengths: array):
+        self.chunks = chunks
+        self.vocab = vocab
+        self.term_offsets = term_offsets
+        self.post_docs = post_docs
+        self.post_tfs = post_tfs
+        self.doc_lengths = doc_lengths
+        self.avg_length = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+
+    @classmethod
+    def build(cls, chunks: List[str]) -> "BM25Index":
+        vocab: Dict[str, int] = {}
+        per_term: List[List[Tuple[int, int]]] = []
+        doc_lengths = array("I")
+        for doc, chunk in enumerate(chunks):
+            counts: Dict[int, int] = {}
+            tokens = tokenize(chunk)
+            for token in tokens:
+                tid = vocab.get(token)
+                if tid is None:
+                    tid = vocab[token] = len(vocab)
+                    per_term.append([])
+                counts[tid] = counts.get(tid, 0) + 1
+            for tid, tf in counts.items():
+                per_term[tid].append((doc, min(tf, 0xFFFF)))
+            doc_lengths.append(len(tokens))
+        term_offsets, post_docs, post_tfs = array("I", [0]), array("I"), array("H")
+        for postings in per_term:
+            for doc, tf in postings:
+                post_docs.append(doc)
+                post_tfs.append(tf)
+            term_offsets.append(len(post_docs))
+        return cls(chunks, vocab, term_offsets, post_docs, post_tfs, doc_lengths)
+
+    def search(self, query: str, k: int = DEFAULT_TOP_K) -> List[Tuple[int, float]]:
+        """Top ``k`` ``(chunk_id, score)`` for ``query``, best first."""
+        n = len(self.chunks)
+        if not n:
+            return []
+        scores: Dict[int, float] = {}
+        norm = BM25_K1 * (1 - BM25_B)
+        slope = BM25_K1 * BM25_B / (self.avg_length or 1.0)
+        lengths, docs, tfs, offsets = self.doc_lengths, self.post_docs, self.post_tfs, self.term_offsets
+        for term in set(tokenize(query)):
+            tid = self.vocab.get(term)
+            if tid is None:
+                continue
+            lo, hi = offsets[tid], offsets[tid + 1]
+            idf = math.log(1 + (n - (hi - lo) + 0.5) / ((hi - lo) + 0.5))
+            for i in range(lo, hi):
+                doc, tf = docs[i], tfs[i]
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm + slope * lengths[doc])
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def excerpt(self, query: str, budget: int, model: str, k: int = DEFAULT_TOP_K, sep: str = "\n\n") -> Packed:
+        """Best chunks for ``query`` within ``budget`` tokens, joined in document order.
+
+        When no chunk matches, the leading chunks are used instead, as a
+        plain truncated excerpt would.
+        """
+        tokenizer = tokenizer_for(model)
+        hits = [doc for doc, _ in self.search(query, k)]
+        ranked = bool(hits)
+        kept: List[int] = []
+        used = 0
+        for doc in hits or range(len(self.chunks)):
+            cost = tokenizer.count(self.chunks[doc]) + (tokenizer.count(sep) if kept else 0)
+            if used + cost <= budget:
+                kept.append(doc)
+                used += cost
+            elif not ranked:
+                break
+        kept.sort()
+        text = sep.join(self.chunks[d] for d in kept)
+        return Packed(text=text, tokens=tokenizer.count(text), budget=budget, tokenizer=tokenizer.name,
+                      paragraphs=len(kept), chars=len(text), complete=False,
+                      chars_total=sum(len(c) for c in self.chunks) or None)
+
+    def to_bytes(self) -> bytes:
+        vocab = "\n".join(sorted(self.vocab, key=self.vocab.__getitem__)).encode("utf-8")
+        texts = [c.encode("utf-8") for c in self.chunks]
+        text_offsets = array("Q", [0])
+        for t in texts:
+            text_offsets.append(text_offsets[-1] + len(t))
+        parts = [
+            _HEADER.pack(MAGIC, VERSION, 0, len(self.chunks), len(self.vocab), len(self.post_docs),
+                         len(vocab), text_offsets[-1]),
+            _le(self.doc_lengths).tobytes(), _le(text_offsets).tobytes(), _le(self.term_offsets).tobytes(),
+            _le(self.post_docs).tobytes(), _le(self.post_tfs).tobytes(), vocab, b"".join(texts),
+        ]
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BM25Index":
+        magic, version, _, n_docs, n_terms, n_post, vocab_len, text_len = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"not a v{VERSION} BM25 index")
+        view = memoryview(data)
+        pos = _HEADER.size
+
+        def take(typecode: str, count: int) -> array:
+            nonlocal pos
+            arr = array(typecode)
+            size = arr.itemsize * count
+            arr.frombytes(view[pos:pos + size])
+            pos += size
+            return _le(arr)
+
+        doc_lengths = take("I", n_docs)
+        text_offsets = take("Q", n_docs + 1)
+        term_offsets = take("I", n_terms + 1)
+        post_docs = take("I", n_post)
+        post_tfs = take("H", n_post)
+        terms = bytes(view[pos:pos + vocab_len]).decode("utf-8").split("\n") if n_terms else []
+        pos += vocab_len
+        blob = view[pos:pos + text_len]
+        if len(terms) != n_terms or len(blob) != text_len:
+            raise ValueError("truncated BM25 index")
+        chunks = [bytes(blob[text_offsets[i]:text_offsets[i + 1]]).decode("utf-8") for i in range(n_docs)]
+        return cls(chunks, {t: i for i, t in enumerate(terms)}, term_offsets, post_docs, post_tfs, doc_lengths)
+
+
+def text_variant(tiered: bool = False, stripped: bool = False, pages: Optional[Sequence[int]] = None) -> str:
+    """Name for how the indexed text was extracted, part of the cache key."""
+    return f"{'tiered' if tiered else 'fast'}:{'strip' if stripped else 'raw'}:{','.join(map(str, pages)) if pages else 'all'}"
+
+
+def open_index(cache: Optional[DiskCache], pdf_sha: str, variant: str, text: Callable[[], str]) -> BM25Index:
+    """The index for a manual, from ``cache`` when present, else built from ``text()`` and stored.
+
+    ``variant`` names the extraction that produced the text (extractor,
+    boilerplate stripping) so differently extracted texts are not mixed.
+    """
+    key = cache_key("bm25/v2", pdf_sha, variant, CHUNK_TARGET, CHUNK_HARD_MAX)
+    if cache is not None:
+        data = cache.get(key)
+        if data is not None:
+            try:
+                return BM25Index.from_bytes(data)
+            except (ValueError, struct.error, UnicodeDecodeError):
+                pass
+    index = BM25Index.build(chunkify(text()))
+    if cache is not None:
+        cache.put(key, index.to_bytes())
+    return index
+
+
+def search_excerpt(index: BM25Index, queries: Sequence[str], budget: int, model: str,
+                   k: int = DEFAULT_TOP_K) -> Packed:
+    """Prompt excerpt for one or more feature titles (queried together)."""
+    return index.excerpt(" ".join(queries), budget, model, k=k)
+
+
+def add_search_args(parser: argparse.ArgumentParser) -> None:
+    """Register the shared ``--search`` / ``--search-k`` flags."""
+    parser.add_argument(
+        "--search",
+        action="append",
+        default=[],
+        metavar="TITLE",
+        help="Build the prompt excerpt from the manual chunks that best match TITLE (BM25), e.g. \"Use Apple CarPlay\"",
+    )
+    parser.add_argument("--search-k", type=int, default=DEFAULT_TOP_K, help="Chunks considered for a --search excerpt")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Chunk a manual, check the chunk boundaries and run BM25 queries")
+    ap.add_argument("pdf")
+    ap.add_argument("--query", action="append", default=[], help="Feature title to search for")
+    ap.add_argument("-k", type=int, default=DEFAULT_TOP_K)
+    a = ap.parse_args()
+    from vi_pipeline.pdftext import read_all_text
+
+    text = read_all_text(a.pdf, sep="\n\n")
+    chunks = chunkify(text)
+    sizes = sorted(len(c) for c in chunks)
+    print(f"{len(chunks)} chunks, median {sizes[len(sizes) // 2] if sizes else 0} / max {sizes[-1] if sizes else 0} chars; "
+          f"{'WORDS SPLIT at chunk boundaries' if splits_words(text, chunks) else 'no word split at a chunk boundary'}")
+    index = BM25Index.build(chunks)
+    for query in a.query:
+        for doc, score in index.search(query, a.k):
+            print(f"{query!r} #{doc} {score:.2f}: {chunks[doc][:100]!r}")
+
+
+if __name__ == "__main__":
+    main()
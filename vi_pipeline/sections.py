@@ -0,0 +1,247 @@
+"""
+Section index for targeted, partial manual extraction.
+
+Clips are per feature ("Reset TPMS", "Pair Bluetooth"), so the pipelines only
+need the pages that cover that feature. :func:`build_index` maps section
+titles to page ranges once per PDF, from the outline (``doc.get_toc()``) when
+the PDF has one and otherwise from headings detected by font size. The index
+is saved as JSON next to the extracted text and reused while the PDF's
+SHA-256 matches (:func:`load_or_build`).
+
+:meth:`SectionIndex.pages_for` resolves ``--section`` / ``--feature`` queries
+by title words. Action verbs ("reset", "pair", "setup") only count when they
+are all the query has, acronyms match the initials of title words ("TPMS" ->
+"Tire Pressure Monitoring System"), and when a section and one of its
+subsections both match, only the subsection's pages are used.
+
+    python -m vi_pipeline.sections manual.pdf --find "Reset TPMS"
+"""
+
+from __future__ import annotations
+
+import argparse
+import collections
+import json
+import pathlib
+import re
+from dataclasses import asdict, dataclass, field
+from typing import Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+import fitz  # PyMuPDF
+
+from vi_pipeline.stages import file_sha256, write_json_atomic
+
+PathLike = Union[str, pathlib.Path]
+
+SECTION_INDEX_VERSION = 1
+# Lines at least this much larger than the body text are heading candidates
+HEADING_SCALE = 1.15
+MAX_HEADING_LEVELS = 3
+# A query matches a title when this share of its words do
+MIN_MATCH = 0.5
+
+_WORD = re.compile(r"[a-z0-9]+")
+_WEAK = frozenset("""
+    a an and the of to for on in with your my how use using set setup up reset pair pairing
+    adjust change turn enable disable activate operate operating
+""".split())
+
+
+def _stem(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def words(text: str) -> List[str]:
+    return [_stem(w) for w in _WORD.findall(text.lower())]
+
+
+@dataclass
+class Section:
+    title: str
+    level: int
+    start: int  # first page, 0-based
+    stop: int  # one past the last page
+
+    @property
+    def pages(self) -> range:
+        return range(self.start, self.stop)
+
+    def contains(self, other: "Section") -> bool:
+        return self is not other and self.start <= other.start and other.stop <= self.stop and self.level < other.level
+
+
+def _match(query: Sequence[str], title: str) -> float:
+    """Share of the query's words found in ``title`` (as words or as initials)."""
+    title_words = words(title)
+    content = [w for w in title_words if w not in _WEAK] or title_words
+    initials = {"".join(w[0] for w in content[i:j]) for i in range(len(content)) for j in range(i + 2, len(content) + 1)}
+    strong = [w for w in query if w not in _WEAK] or list(query)
+    if not strong:
+        return 0.0
+    hits = sum(1 for w in strong if w in title_words or w in initials)
+    return hits / len(strong)
+
+
+@dataclass
+class SectionIndex:
+    pdf_sha: str
+    page_count: int
+    source: str  # "toc" or "headings"
+    sections: List[Section] = field(default_factory=list)
+    version: int = SECTION_INDEX_VERSION
+
+    def find(self, query: str) -> List[Section]:
+        """Best-matching sections for ``query`` in page order, preferring subsections."""
+        q = words(query)
+        scored = [(s, _match(q, s.title)) for s in self.sections]
+        best = max((score for _, score in scored), default=0.0)
+        if best < MIN_MATCH:
+            return []
+        hits = [s for s, score in scored if score == best]
+        # Drop a section when one of its own subsections matched just as well
+        return [s for s in hits if not any(s.contains(o) for o in hits)]
+
+    def pages_for(self, queries: Iterable[str]) -> List[int]:
+        pages: Set[int] = set()
+        for query in queries:
+            for section in self.find(query):
+                pages.update(section.pages)
+        return sorted(pages)
+
+    def to_dict(self) -> dict:
+        return {
+            "version": self.version, "pdf_sha": self.pdf_sha, "page_count": self.page_count,
+            "source": self.source, "sections": [asdict(s) for s in self.sections],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SectionIndex":
+        return cls(
+            pdf_sha=data["pdf_sha"], page_count=data["page_count"], source=data["source"],
+            sections=[Section(**s) for s in data.get("sections", [])], version=data.get("version", 0),
+        )
+
+    def save(self, path: PathLike) -> None:
+        write_json_atomic(path, self.to_dict())
+
+    @classmethod
+    def load(cls, path: PathLike) -> "SectionIndex":
+        return cls.from_dict(json.loads(pathlib.Path(path).read_text(encoding="utf-8")))
+
+
+def _ranges(entries: List[Tuple[int, str, int]], page_count: int) -> List[Section]:
+    """Sections from ``(level, title, start_page)`` in document order.
+
+    A section runs to the page where the next section of the same or a higher
+    level starts, inclusive, since that page usually begins with its tail.
+    """
+    sections: List[Section] = []
+    for n, (level, title, start) in enumerate(entries):
+        stop = page_count
+        for next_level, _, next_start in entries[n + 1:]:
+            if next_level <= level:
+                stop = min(page_count, next_start + 1)
+                break
+        sections.append(Section(title=title.strip(), level=level, start=start, stop=max(stop, start + 1)))
+    return sections
+
+
+def from_toc(toc: List[list], page_count: int) -> List[Section]:
+    entries = [(level, title, page - 1) for level, title, page, *_ in toc if 1 <= page <= page_count and title.strip()]
+    return _ranges(entries, page_count)
+
+
+def from_headings(doc: "fitz.Document") -> List[Section]:
+    """Sections from lines set noticeably larger than the body text."""
+    sizes: collections.Counter = collections.Counter()
+    lines: List[Tuple[int, float, str]] = []
+    for pno in range(doc.page_count):
+        for block in doc.load_page(pno).get_text("dict")["blocks"]:
+            if block.get("type") != 0:
+                continue
+            for line in block["lines"]:
+                text = "".join(span["text"] for span in line["spans"]).strip()
+                if not text:
+                    continue
+                size = round(max(span["size"] for span in line["spans"]), 1)
+                sizes[size] += len(text)
+                lines.append((pno, size, text))
+    if not sizes:
+        return []
+    body = sizes.most_common(1)[0][0]
+    levels = sorted({size for _, size, _ in lines if size >= body * HEADING_SCALE}, reverse=True)
+    level_of = {size: min(n + 1, MAX_HEADING_LEVELS) for n, size in enumerate(levels)}
+    entries: List[Tuple[int, str, int]] = []
+    for pno, size, text in lines:
+        if size not in level_of or len(text) > 80 or text[-1] in ".,;:" or not any(c.isalpha() for c in text):
+            continue
+        if entries and entries[-1][1] == text:
+            continue  # repeated running heading
+        entries.append((level_of[size], text, pno))
+    return _ranges(entries, doc.page_count)
+
+
+def build_index(pdf_path: PathLike) -> SectionIndex:
+    with fitz.open(str(pdf_path)) as doc:
+        toc = doc.get_toc(simple=True)
+        sections = from_toc(toc, doc.page_count)
+        source = "toc"
+        if not sections:
+            sections, source = from_headings(doc), "headings"
+        return SectionIndex(pdf_sha=file_sha256(pdf_path), page_count=doc.page_count, source=source, sections=sections)
+
+
+def load_or_build(pdf_path: PathLike, path: Optional[PathLike] = None) -> SectionIndex:
+    """The index saved at ``path`` if it is for this PDF, else a fresh one (saved there)."""
+    if path is not None:
+        try:
+            index = SectionIndex.load(path)
+            if index.version == SECTION_INDEX_VERSION and index.pdf_sha == file_sha256(pdf_path):
+                return index
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+    index = build_index(pdf_path)
+    if path is not None:
+        index.save(path)
+    return index
+
+
+def resolve_pages(index: SectionIndex, queries: Sequence[str]) -> List[int]:
+    """Pages for ``queries``; exits with the known titles when nothing matches."""
+    pages = index.pages_for(queries)
+    if not pages:
+        titles = "; ".join(s.title for s in index.sections[:25]) or "none"
+        raise SystemExit(f"No section of the manual matches {', '.join(queries)!r} (sections: {titles})")
+    return pages
+
+
+def add_section_args(parser: argparse.ArgumentParser) -> None:
+    """Register the shared ``--section`` / ``--feature`` flag."""
+    parser.add_argument(
+        "--section", "--feature",
+        dest="sections",
+        action="append",
+        default=[],
+        metavar="TITLE",
+        help="Only extract the manual pages of sections matching TITLE (repeatable), e.g. \"Reset TPMS\"",
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Show a manual's section index or the pages for a feature")
+    ap.add_argument("pdf")
+    ap.add_argument("--find", action="append", default=[], help="Section/feature title to resolve")
+    ap.add_argument("--save", help="Write the index JSON here")
+    a = ap.parse_args()
+    index = load_or_build(a.pdf, a.save)
+    print(f"{len(index.sections)} sections from {index.source}, {index.page_count} pages")
+    if not a.find:
+        for s in index.sections:
+            print(f"{'  ' * (s.level - 1)}{s.title}  [pages {s.start + 1}-{s.stop}]")
+    for query in a.find:
+        matches = index.find(query)
+        print(f"{query!r}: " + (", ".join(f"{s.title} [{s.start + 1}-{s.stop}]" for s in matches) or "no match"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Order-preserving, duration-balanced script segmentation.
+
+The narration script is split into sentences and then into ``n`` contiguous
+runs of sentences whose estimated speaking times are as even as possible
+(the longest segment is minimised). Segments are synthesised and rendered
+concurrently, so the longest one sets the wall time; keeping them contiguous
+also keeps the narration in order, which round-robin assignment did not.
+
+Speaking time is estimated by :class:`SpeechModel` (words per second plus a
+pause per sentence). The defaults suit ElevenLabs' stock voices; fit them to
+real output with :func:`calibrate`, e.g. from the ``text`` / ``duration_ms``
+pairs pipeline_v3 records per segment:
+
+    python -m vi_pipeline.segmenter dist/pipeline-output/*_manifest.json
+
+Sentence detection keeps decimals ("2.5L", "0.5 mm"), list numbering
+("1. Press ...") and titles before a name ("Dr. Smith") intact. Other
+abbreviations ("e.g.", "approx.", "Fig.") only continue the sentence when the
+next word starts lower-case or with a digit, so "... to max. Then press ..."
+still splits.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import pathlib
+import re
+from dataclasses import dataclass
+from typing import Iterable, List, Sequence, Tuple
+
+DEFAULT_WORDS_PER_SECOND = 2.6
+DEFAULT_SENTENCE_PAUSE = 0.35
+
+# Lower-cased, without the trailing period. Only forms that are not also
+# ordinary words ("min", "max", "no") or single letters ("button A.")
+ABBREVIATIONS = frozenset("""
+    e.g i.e etc vs approx appx fig figs secs ch vol pp pg
+    jr sr inc ltd corp dept incl excl
+    ft lb lbs oz qt mph km kph hr hrs yr yrs
+    a.m p.m u.s u.k
+""".split())
+# Always followed by a capitalised name, never the end of a sentence
+TITLES = frozenset("mr mrs ms dr".split())
+# "No. 3": an abbreviation only in front of a number
+NUMBER_ABBREVIATIONS = frozenset("no nos".split())
+
+_BULLET = re.compile(r"^\s*[•*–-]\s+")
+_LIST_NUMBER = re.compile(r"^\s*(?:\d+|[A-Za-z])[.)]\s+")
+# Candidate boundary: terminal punctuation (plus closing quotes/brackets) then whitespace
+_BOUNDARY = re.compile(r"[.!?]+[\"')\]]*(?=\s+)")
+_WORD = re.compile(r"\S+")
+
+
+def _is_abbreviation(text: str, end: int) -> bool:
+    """Whether the period at ``end`` belongs to an abbreviation inside the sentence."""
+    start = end
+    while start > 0 and not text[start - 1].isspace() and text[start - 1] not in "(\"'":
+        start -= 1
+    token = text[start:end].rstrip(".").lower()
+    following = text[end + 1:].lstrip()[:1]
+    if not following:
+        return False
+    if token in TITLES:
+        return following.isupper()
+    if token in NUMBER_ABBREVIATIONS:
+        return following.isdigit()
+    return token in ABBREVIATIONS and (following.islower() or following.isdigit())
+
+
+def _line_sentences(line: str) -> List[str]:
+    line = _BULLET.sub("", line).strip()
+    # Keep "1. Press ..." / "a) Open ..." markers attached to their sentence
+    marker = _LIST_NUMBER.match(line)
+    head, body = (line[:marker.end()], line[marker.end():]) if marker else ("", line)
+    out, start = [], 0
+    for m in _BOUNDARY.finditer(body):
+        if body[m.start()] == "." and m.end() - m.start() == 1 and _is_abbreviation(body, m.start()):
+            continue
+        out.append(body[start:m.end()].strip())
+        start = m.end()
+    out.append(body[start:].strip())
+    out = [s for s in out if s]
+    if out and head:
+        out[0] = head + out[0]
+    return out
+
+
+def split_sentences(text: str) -> List[str]:
+    """Sentences of ``text`` in order; every line break is also a boundary."""
+    sentences: List[str] = []
+    for line in text.splitlines():
+        if line.strip():
+            sentences.extend(_line_sentences(line))
+    return sentences
+
+
+@dataclass
+class SpeechModel:
+    words_per_second: float = DEFAULT_WORDS_PER_SECOND
+    sentence_pause: float = DEFAULT_SENTENCE_PAUSE
+
+    @staticmethod
+    def words(text: str) -> float:
+        """Spoken-word estimate: numbers read as several words ("2.5L" -> ~3)."""
+        n = 0.0
+        for token in _WORD.findall(text):
+            digits = sum(c.isdigit() for c in token)
+            n += 1 + digits // 2 if digits else 1
+        return n
+
+    def seconds(self, text: str, sentences: int = 1) -> float:
+        return self.words(text) / self.words_per_second + self.sentence_pause * sentences
+
+
+def calibrate(samples: Iterable[Tuple[str, float]]) -> SpeechModel:
+    """Least-squares fit of ``seconds = words / wps + pause * sentences``.
+
+    Falls back to the defaults when the samples cannot support a fit.
+    """
+    sww = sws = sss = swy = ssy = 0.0
+    for text, seconds in samples:
+        w, s = SpeechModel.words(text), float(len(split_sentences(text)) or 1)
+        sww += w * w
+        sws += w * s
+        sss += s * s
+        swy += w * seconds
+        ssy += s * seconds
+    det = sww * sss - sws * sws
+    if det <= 0:
+        return SpeechModel()
+    a = (swy * sss - ssy * sws) / det  # seconds per word
+    b = (sww * ssy - sws * swy) / det  # seconds per sentence
+    if a <= 0:
+        return SpeechModel()
+    return SpeechModel(words_per_second=1.0 / a, sentence_pause=max(0.0, b))
+
+
+def _split_words(sentence: str, parts: int) -> List[str]:
+    words = sentence.split()
+    parts = max(1, min(parts, len(words)))
+    size, extra = divmod(len(words), parts)
+    out, i = [], 0
+    for k in range(parts):
+        j = i + size + (1 if k < extra else 0)
+        out.append(" ".join(words[i:j]))
+        i = j
+    return out
+
+
+def _ensure_pieces(sentences: List[str], n: int) -> List[str]:
+    """Split the longest sentences at word boundaries until there are ``n`` pieces."""
+    pieces = list(sentences)
+    while len(pieces) < n:
+        i = max(range(len(pieces)), key=lambda k: len(pieces[k].split()))
+        if len(pieces[i].split()) < 2:
+            break
+        pieces[i:i + 1] = _split_words(pieces[i], 2)
+    return pieces
+
+
+def partition(costs: Sequence[float], n: int) -> List[int]:
+    """Start index of each of ``n`` contiguous groups minimising the largest group cost."""
+    m = len(costs)
+    n = max(1, min(n, m))
+    prefix = [0.0]
+    for c in costs:
+        prefix.append(prefix[-1] + c)
+    inf = float("inf")
+    # best[k][i]: minimal max-cost splitting the first i items into k groups
+    best = [[inf] * (m + 1) for _ in range(n + 1)]
+    cut = [[0] * (m + 1) for _ in range(n + 1)]
+    best[0][0] = 0.0
+    for k in range(1, n + 1):
+        prev = best[k - 1]
+        for i in range(k, m - (n - k) + 1):
+            # prev[j] grows with j and the last group's cost shrinks, so the
+            # optimum sits where they cross: binary-search the first j with
+            # prev[j] >= prefix[i] - prefix[j], then compare it with j - 1
+            lo, hi = k - 1, i - 1
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if prev[mid] >= prefix[i] - prefix[mid]:
+                    hi = mid
+                else:
+                    lo = mid + 1
+            for j in (lo - 1, lo):
+                if j < k - 1:
+                    continue
+                cost = max(prev[j], prefix[i] - prefix[j])
+                # strict < keeps the earlier cut (smaller j), so on ties the
+                # earlier segments come out shorter and the last one longer
+                if cost < best[k][i]:
+                    best[k][i] = cost
+                    cut[k][i] = j
+    starts, i = [], m
+    for k in range(n, 0, -1):
+        i = cut[k][i]
+        starts.append(i)
+    return starts[::-1]
+
+
+def _finish(sentence: str) -> str:
+    return sentence if sentence[-1] in ".!?\"')]:" else sentence + "."
+
+
+def split_balanced(script: str, n_segments: int, model: SpeechModel = None) -> List[str]:
+    """Split ``script`` into up to ``n_segments`` contiguous, duration-balanced segments.
+
+    Fewer segments come back only if the script has fewer words than
+    ``n_segments``; every returned segment is non-empty.
+    """
+    model = model or SpeechModel()
+    sentences = split_sentences(script) or ([script.strip()] if script.strip() else [])
+    if not sentences:
+        return []
+    sentences = _ensure_pieces([_finish(s) for s in sentences], n_segments)
+    costs = [model.seconds(s) for s in sentences]
+    starts = partition(costs, n_segments)
+    bounds = starts + [len(sentences)]
+    return [" ".join(sentences[bounds[k]:bounds[k + 1]]) for k in range(len(starts))]
+
+
+def _manifest_samples(paths: Iterable[str]) -> List[Tuple[str, float]]:
+    samples = []
+    for path in paths:
+        data = json.loads(pathlib.Path(path).read_text(encoding="utf-8"))
+        for seg in data.get("segments", []):
+            if seg.get("text") and seg.get("duration_ms"):
+                samples.append((seg["text"], seg["duration_ms"] / 1000.0))
+    return samples
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Fit the speech-time model to pipeline_v3 manifests")
+    ap.add_argument("manifests", nargs="+", help="<vehicle>_manifest.json files with per-segment duration_ms")
+    a = ap.parse_args()
+    samples = _manifest_samples(a.manifests)
+    model = calibrate(samples)
+    print(f"{len(samples)} segments: --speech-wps {model.words_per_second:.2f} --speech-pause {model.sentence_pause:.2f}")
+
+
+if __name__ == "__main__":
+    main()
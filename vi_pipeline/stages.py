@@ -0,0 +1,163 @@
+"""
+Resumable stage checkpoints recorded in the pipeline manifest.
+
+Each stage records a hash of its inputs and of every output file in
+``manifest["stages"][name]``, and the manifest is rewritten (atomically) after
+every stage. On a rerun a stage is skipped when its input hash is unchanged and
+all of its outputs still exist with the recorded hashes, so a crash in the last
+concat no longer forces extraction, the LLM call and TTS to run again.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from vi_pipeline import trace
+from vi_pipeline.cache import cache_key
+
+PathLike = Union[str, pathlib.Path]
+
+
+def file_sha256(path: PathLike, chunk_size: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def inputs_hash(inputs: Dict[str, Any]) -> str:
+    return cache_key("stage/v1", inputs)
+
+
+def write_json_atomic(path: PathLike, data: Any) -> None:
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class StageManifest:
+    """Incrementally written manifest with per-stage input/output hashes.
+
+    Args:
+        path: Manifest JSON path; an existing file is loaded so its stage
+            records can be reused.
+        base: Top-level fields to start a fresh manifest with.
+        resume: When False every stage runs regardless of recorded hashes.
+        on_stage: Called with ``(name, record)`` as each stage finishes or is
+            skipped, e.g. to mirror progress into a job queue.
+    """
+
+    def __init__(self, path: PathLike, base: Optional[Dict[str, Any]] = None, resume: bool = True,
+                 on_stage: Optional[Callable[[str, Dict[str, Any]], None]] = None):
+        self.path = pathlib.Path(path)
+        self.resume = resume
+        self.on_stage = on_stage
+        self._lock = threading.RLock()
+        previous: Dict[str, Any] = {}
+        if self.path.is_file():
+            try:
+                previous = json.loads(self.path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                previous = {}
+        self._previous_stages: Dict[str, Any] = previous.get("stages", {}) if resume else {}
+        self.data: Dict[str, Any] = dict(base or {})
+        self.data["stages"] = {}
+        self.ran: List[str] = []
+        self.skipped: List[str] = []
+
+    def _outputs_verify(self, record: Dict[str, Any]) -> bool:
+        outputs = record.get("outputs") or {}
+        for name, digest in outputs.items():
+            p = pathlib.Path(name)
+            if not p.is_file() or file_sha256(p) != digest:
+                return False
+        return True
+
+    def is_current(self, name: str, digest: str) -> bool:
+        record = self._previous_stages.get(name)
+        return bool(
+            record
+            and record.get("status") == "done"
+            and record.get("inputs") == digest
+            and self._outputs_verify(record)
+        )
+
+    def run(
+        self,
+        name: str,
+        inputs: Dict[str, Any],
+        outputs: Iterable[PathLike],
+        fn: Callable[[], Any],
+    ) -> bool:
+        """Run ``fn`` unless the stage is already current. Returns True if it ran.
+
+        Either way the stage is traced as a span named ``name`` (see
+        :mod:`vi_pipeline.trace`), with the size of its outputs as ``bytes_out``.
+        """
+        outputs = [pathlib.Path(o) for o in outputs]
+        digest = inputs_hash(inputs)
+        with trace.span(name, vehicle=self.data.get("vehicle")) as span:
+            if self.resume and self.is_current(name, digest):
+                span.status = "skipped"
+                with self._lock:
+                    record = dict(self._previous_stages[name])
+                    record["skipped"] = True
+                    self.data["stages"][name] = record
+                    self.skipped.append(name)
+                    self.save()
+                if self.on_stage is not None:
+                    self.on_stage(name, record)
+                return False
+            start = time.perf_counter()
+            fn()
+            record = {
+                "status": "done",
+                "inputs": digest,
+                "outputs": {str(o): file_sha256(o) for o in outputs},
+                "seconds": round(time.perf_counter() - start, 3),
+                "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "skipped": False,
+            }
+            span.set(bytes_out=sum(o.stat().st_size for o in outputs))
+        with self._lock:
+            self.data["stages"][name] = record
+            self.ran.append(name)
+            self.save()
+        if self.on_stage is not None:
+            self.on_stage(name, record)
+        return True
+
+    def output_hash(self, name: str, path: PathLike) -> Optional[str]:
+        record = self.data["stages"].get(name) or {}
+        return (record.get("outputs") or {}).get(str(pathlib.Path(path)))
+
+    def update(self, **fields: Any) -> None:
+        with self._lock:
+            self.data.update(fields)
+            self.save()
+
+    def summary(self) -> Dict[str, List[str]]:
+        return {"ran": list(self.ran), "skipped": list(self.skipped)}
+
+    def save(self) -> None:
+        with self._lock:
+            self.data["run"] = self.summary()
+            write_json_atomic(self.path, self.data)
@@ -0,0 +1,184 @@
+"""
+Encode-once still-image video tracks.
+
+The legacy render (``-loop 1 -i image ... -c:v libx264 -shortest``) encodes
+the same picture at 25 fps for the whole narration. Here each image is encoded
+once, as a one-frame, keyframe-only clip at ``STILL_FPS`` and the target size.
+Every segment then loops that clip with ``-stream_loop -1 -c:v copy`` and cuts
+it at the audio's duration, so the video track is a remux and costs about the
+same for a 10 second segment as for a 10 minute one.
+
+The audio is transcoded to AAC by default, as the legacy path did and as every
+pipeline asks for; ``audio_codec="copy"`` keeps the MP3 (MP3 in MP4 plays in
+browsers, iOS and ExoPlayer) and makes the whole render a remux.
+Because the video track moves in whole frames, it can end up to
+``1 / STILL_FPS`` seconds after the audio; when segments are concatenated,
+cut each one at its audio duration (concat ``outpoint``).
+"""
+
+from __future__ import annotations
+
+import os
+import pathlib
+import subprocess
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple, Union
+
+from vi_pipeline import trace
+from vi_pipeline.cache import DiskCache, cache_key
+from vi_pipeline.mp3 import mp3_duration
+from vi_pipeline.stages import file_sha256
+
+PathLike = Union[str, pathlib.Path]
+
+STILL_SIZE = (1280, 720)
+STILL_FPS = 1
+STILL_AUDIO_CODECS = ("copy", "aac")
+
+
+def still_filter(size: Tuple[int, int] = STILL_SIZE) -> str:
+    w, h = size
+    return (
+        f"scale={w}:{h}:force_original_aspect_ratio=decrease,"
+        f"pad={w}:{h}:(ow-iw)/2:(oh-ih)/2,setsar=1,format=yuv420p"
+    )
+
+
+def encode_still_cmd(
+    ffmpeg: str,
+    image: PathLike,
+    out_mp4: PathLike,
+    size: Tuple[int, int] = STILL_SIZE,
+    fps: int = STILL_FPS,
+    vcodec: str = "libx264",
+) -> List[str]:
+    if vcodec == "libx264":
+        codec = ["-c:v", "libx264", "-tune", "stillimage", "-g", "1", "-bf", "0"]
+    else:
+        codec = ["-c:v", vcodec, "-q:v", "2", "-g", "1"]
+    return [
+        ffmpeg, "-y", "-loop", "1", "-framerate", str(fps), "-i", str(image),
+        "-vf", still_filter(size), "-frames:v", "1", "-r", str(fps), *codec, "-an", str(out_mp4),
+    ]
+
+
+def mux_cmd(
+    ffmpeg: str,
+    still_mp4: PathLike,
+    audio: PathLike,
+    duration: float,
+    out_mp4: PathLike,
+    audio_codec: str = "aac",
+) -> List[str]:
+    audio_args = ["-c:a", "copy"] if audio_codec == "copy" else ["-c:a", audio_codec, "-b:a", "192k"]
+    return [
+        ffmpeg, "-y", "-stream_loop", "-1", "-i", str(still_mp4), "-i", str(audio),
+        "-map", "0:v:0", "-map", "1:a:0", "-c:v", "copy", *audio_args,
+        # -shortest does not stop a looped stream-copy input; cut explicitly
+        "-t", f"{duration:.3f}", "-movflags", "+faststart", str(out_mp4),
+    ]
+
+
+def _run(cmd: List[str]) -> subprocess.CompletedProcess:
+    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    trace.note_ffmpeg(p.returncode)
+    return p
+
+
+class StillRenderer:
+    """Render image + audio pairs from once-encoded still clips.
+
+    Args:
+        ffmpeg: ffmpeg executable.
+        cache: Optional cache for the encoded clips, keyed by image hash,
+            size and frame rate, so a clip is reused across segments,
+            vehicles and runs. Without one, clips go to a temporary
+            directory for the life of the renderer.
+        size: Output frame size.
+        fps: Still clip frame rate.
+    """
+
+    def __init__(
+        self,
+        ffmpeg: str = "ffmpeg",
+        cache: Optional[DiskCache] = None,
+        size: Tuple[int, int] = STILL_SIZE,
+        fps: int = STILL_FPS,
+    ):
+        self.ffmpeg = ffmpeg
+        self.cache = cache if cache is not None and cache.mode != "off" else None
+        self.size = tuple(size)
+        self.fps = fps
+        self._clips: Dict[str, pathlib.Path] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._tmpdir: Optional[tempfile.TemporaryDirectory] = None
+
+    def _encode(self, image: PathLike, out_mp4: pathlib.Path) -> None:
+        p = _run(encode_still_cmd(self.ffmpeg, image, out_mp4, self.size, self.fps))
+        if p.returncode != 0 and b"libx264" in p.stderr:
+            p = _run(encode_still_cmd(self.ffmpeg, image, out_mp4, self.size, self.fps, vcodec="mpeg4"))
+        if p.returncode != 0:
+            raise RuntimeError("FFmpeg still encode failed:\n" + p.stderr.decode(errors="ignore")[-2000:])
+
+    def still_for(self, image: PathLike) -> pathlib.Path:
+        """Path of the encoded clip for ``image``, encoding it on first use."""
+        key = cache_key("still/v1", file_sha256(image), self.size, self.fps)
+        with self._lock:
+            if key in self._clips:
+                return self._clips[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:  # concurrent segments sharing an image encode it once
+            with self._lock:
+                if key in self._clips:
+                    return self._clips[key]
+            path = self.cache.get_path(key) if self.cache is not None else None
+            if path is None:
+                path = self._produce(key, image)
+            with self._lock:
+                self._clips[key] = path
+            return path
+
+    def _produce(self, key: str, image: PathLike) -> pathlib.Path:
+        if self.cache is None:
+            with self._lock:
+                if self._tmpdir is None:
+                    self._tmpdir = tempfile.TemporaryDirectory(prefix="vi-still-")
+            path = pathlib.Path(self._tmpdir.name) / f"{key}.mp4"
+            self._encode(image, path)
+            return path
+        fd, tmp = tempfile.mkstemp(suffix=".mp4")
+        os.close(fd)
+        try:
+            self._encode(image, pathlib.Path(tmp))
+            return self.cache.put_file(key, pathlib.Path(tmp))
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def render(
+        self,
+        image: PathLike,
+        audio: PathLike,
+        out_mp4: PathLike,
+        duration: Optional[float] = None,
+        audio_codec: str = "aac",
+    ) -> None:
+        """Mux ``audio`` (MP3) under the still clip for ``image`` into ``out_mp4``.
+
+        Raises:
+            RuntimeError: If ffmpeg fails; callers fall back to the legacy
+                loop encode.
+        """
+        clip = self.still_for(image)
+        if duration is None:
+            duration = mp3_duration(audio)
+        p = _run(mux_cmd(self.ffmpeg, clip, audio, duration, out_mp4, audio_codec))
+        if p.returncode != 0:
+            raise RuntimeError("FFmpeg still mux failed:\n" + p.stderr.decode(errors="ignore")[-2000:])
+
+    def close(self) -> None:
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+            self._tmpdir = None
@@ -0,0 +1,84 @@
+"""
+Pipe streamed audio straight into a running ffmpeg process.
+
+Instead of downloading the whole TTS response (to disk or into memory) and
+only then starting ffmpeg, chunks are written to ffmpeg's stdin as they
+arrive, so encoding starts on the first bytes and peak memory stays flat for
+long narrations. The bytes can optionally be teed to an MP3 file.
+"""
+
+from __future__ import annotations
+
+import pathlib
+import subprocess
+import threading
+from dataclasses import dataclass
+from typing import IO, Iterable, List, Optional, Union
+
+from vi_pipeline import trace
+
+PathLike = Union[str, pathlib.Path]
+
+# Use in place of an audio path in an ffmpeg command line: "-f mp3 -i pipe:0"
+STDIN_MP3 = ["-f", "mp3", "-i", "pipe:0"]
+# Output options replacing a plain "-shortest" when the audio arrives on a pipe:
+# the looped still image is otherwise encoded seconds ahead of the audio and
+# -shortest overshoots; buffering the interleave queue keeps the cut on the audio end.
+SHORTEST_FROM_PIPE = ["-shortest", "-fflags", "+shortest", "-max_interleave_delta", "100M"]
+
+
+@dataclass
+class StreamResult:
+    returncode: int
+    stderr: bytes
+    bytes_in: int
+
+
+def _drain(pipe: IO[bytes], sink: List[bytes]) -> None:
+    for chunk in iter(lambda: pipe.read(65536), b""):
+        sink.append(chunk)
+
+
+def pipe_to_ffmpeg(
+    chunks: Iterable[bytes], cmd: List[str], tee: Optional[PathLike] = None
+) -> StreamResult:
+    """Feed ``chunks`` to ``cmd``'s stdin, optionally copying them to ``tee``.
+
+    ``cmd`` must read its audio input from ``pipe:0`` (see ``STDIN_MP3``).
+    If ffmpeg stops reading early (e.g. ``-shortest``) the remaining chunks
+    are still consumed, so the tee file is always complete.
+    """
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    err: List[bytes] = []
+    # stderr must be drained concurrently or ffmpeg can block on a full pipe
+    reader = threading.Thread(target=_drain, args=(proc.stderr, err), daemon=True)
+    reader.start()
+    tee_file = open(tee, "wb") if tee is not None else None
+    total = 0
+    stdin_open = True
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            total += len(chunk)
+            if tee_file is not None:
+                tee_file.write(chunk)
+            if stdin_open:
+                try:
+                    proc.stdin.write(chunk)
+                except (BrokenPipeError, OSError):
+                    stdin_open = False
+                    if tee_file is None:
+                        break
+    finally:
+        if tee_file is not None:
+            tee_file.close()
+        try:
+            proc.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        returncode = proc.wait()
+        reader.join()
+    trace.note_ffmpeg(returncode)
+    trace.add(bytes_in=total)
+    return StreamResult(returncode, b"".join(err), total)
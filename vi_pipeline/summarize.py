@@ -0,0 +1,185 @@
+"""
+Map-reduce summarisation for long manuals.
+
+Instead of truncating a manual to its first N characters, the text is split
+into section-aligned chunks, each chunk is condensed concurrently (map), and
+the partial summaries are handed to the pipeline's own narration prompt
+(reduce). If the joined summaries are still over the reduce budget they are
+re-chunked and condensed again, so coverage scales to full manuals while wall
+time tracks the slowest chunk rather than the document length.
+
+Map calls are cached on their exact prompt: the chunk text plus "section i
+of n". A rerun reuses every chunk whose text, index and chunk count are
+unchanged. An edit that keeps the chunk boundaries only re-summarises its own
+chunk. One that moves text across a boundary re-summarises every later chunk,
+and one that changes the number of chunks changes "of n" in every prompt, so
+the whole manual is re-summarised.
+Each call can take a slot from the caller's ``llm`` stage limit, so a map
+fan-out counts against ``--limit llm=N`` call by call.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, ContextManager, List, Optional
+
+from vi_pipeline import trace
+from vi_pipeline.cache import DiskCache, llm_cache_key
+
+SUMMARIZE_MODES = ("truncate", "map-reduce")
+
+MAP_SYSTEM_PROMPT = (
+    "You condense sections of a vehicle owner's manual for a narration writer. "
+    "Keep every concrete procedure, control name, indicator, warning and number; "
+    "drop legal boilerplate, repeated cautions and page furniture."
+)
+MAP_USER_TEMPLATE = (
+    "Manual section {index} of {total}:\n\n{text}\n\n"
+    "Summarise this section as terse bullet points, at most {max_words} words."
+)
+MAP_TEMPERATURE = 0.2
+MAP_MAX_WORDS = 150
+DEFAULT_CHUNK_CHARS = 8000
+DEFAULT_MAP_WORKERS = 8
+MAX_REDUCE_LEVELS = 3
+
+_NUMBERED_HEADING = re.compile(r"^\s*(\d+(\.\d+)*|[A-Z]-\d+|Chapter\s+\d+|Section\s+\d+)[.)]?\s+\S", re.I)
+
+# (system_prompt, user_prompt, temperature) -> completion text
+CompleteFn = Callable[[str, str, float], str]
+# Context held around each LLM call, e.g. lambda: stage_slot(limits, "llm")
+SlotFn = Callable[[], ContextManager[None]]
+
+
+def is_heading(line: str) -> bool:
+    """Cheap heading test for extracted manual text."""
+    s = line.strip()
+    if not s or len(s) > 80 or s[-1] in ".,;:":
+        return False
+    if _NUMBERED_HEADING.match(s):
+        return True
+    letters = [c for c in s if c.isalpha()]
+    if len(letters) >= 3 and all(c.isupper() for c in letters):
+        return True
+    words = s.split()
+    return 1 <= len(words) <= 8 and all(w[0].isupper() or not w[0].isalpha() for w in words)
+
+
+def split_sections(text: str, target_chars: int = DEFAULT_CHUNK_CHARS, max_chars: Optional[int] = None) -> List[str]:
+    """Split text into chunks of roughly ``target_chars``, preferring to break at headings.
+
+    A chunk is closed at a heading once it holds at least half the target, at
+    a blank line once it reaches the target, and unconditionally before it
+    would exceed ``max_chars`` (default 1.5x target).
+    """
+    max_chars = max_chars or int(target_chars * 1.5)
+    chunks: List[str] = []
+    cur: List[str] = []
+    size = 0
+
+    def flush() -> None:
+        nonlocal cur, size
+        chunk = "\n".join(cur).strip()
+        if chunk:
+            chunks.append(chunk)
+        cur, size = [], 0
+
+    for line in text.splitlines():
+        n = len(line) + 1
+        if cur and (
+            size + n > max_chars
+            or (size >= target_chars // 2 and is_heading(line))
+            or (size >= target_chars and not line.strip())
+        ):
+            flush()
+        while len(line) > max_chars:  # pathological single line
+            cur.append(line[:max_chars])
+            flush()
+            line = line[max_chars:]
+        cur.append(line)
+        size += n
+    flush()
+    return chunks
+
+
+def _summarise_chunks(
+    chunks: List[str],
+    complete: CompleteFn,
+    model: str,
+    workers: int,
+    cache: Optional[DiskCache],
+    slot: SlotFn,
+) -> List[str]:
+    total = len(chunks)
+
+    def one(index: int, chunk: str) -> str:
+        with trace.span(f"map:{index}", chars_in=len(chunk)) as span:
+            # "section i of n" is part of the prompt, so it is part of the key
+            user = MAP_USER_TEMPLATE.format(index=index, total=total, text=chunk, max_words=MAP_MAX_WORDS)
+            key = llm_cache_key(user, model, MAP_SYSTEM_PROMPT, MAP_USER_TEMPLATE, MAP_TEMPERATURE)
+            if cache is not None:
+                hit = cache.get_text(key)
+                if hit is not None:
+                    span.status = "skipped"
+                    return hit
+            with slot():
+                out = complete(MAP_SYSTEM_PROMPT, user, MAP_TEMPERATURE)
+            if cache is not None:
+                cache.put_text(key, out)
+            return out
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, total))) as pool:
+        return list(pool.map(one, range(1, total + 1), chunks))
+
+
+def join_summaries(summaries: List[str]) -> str:
+    return "\n\n".join(f"Part {i}:\n{s.strip()}" for i, s in enumerate(summaries, start=1))
+
+
+def map_reduce(
+    text: str,
+    complete: CompleteFn,
+    reduce: Callable[[str], str],
+    model: str,
+    reduce_budget: int,
+    chunk_chars: int = DEFAULT_CHUNK_CHARS,
+    workers: int = DEFAULT_MAP_WORKERS,
+    cache: Optional[DiskCache] = None,
+    log: Callable[[str], None] = print,
+    slot: Optional[SlotFn] = None,
+) -> str:
+    """Summarise ``text`` chunk by chunk, then call ``reduce`` on the merged summaries.
+
+    Args:
+        text: The full manual text.
+        complete: Chat completion used for the map calls.
+        reduce: The pipeline's script generator, applied once to the merged
+            partial summaries.
+        model: Model name; part of the per-chunk cache key.
+        reduce_budget: Character budget the reduce input must fit into.
+        chunk_chars: Target chunk size for the map step.
+        workers: Maximum concurrent map calls.
+        cache: Optional cache for map results.
+        log: Progress printer.
+        slot: Context manager factory held around every map and reduce
+            call (not around the whole fan-out), e.g. a stage limit slot.
+    """
+    slot = slot or contextlib.nullcontext
+    if len(text) <= reduce_budget:
+        with slot():
+            return reduce(text)
+    chunks = split_sections(text, chunk_chars)
+    log(f"Map-reduce: {len(chunks)} chunks, {workers} workers")
+    summaries = _summarise_chunks(chunks, complete, model, workers, cache, slot)
+    joined = join_summaries(summaries)
+    level = 1
+    while len(joined) > reduce_budget and len(summaries) > 1 and level < MAX_REDUCE_LEVELS:
+        chunks = split_sections(joined, chunk_chars)
+        log(f"Map-reduce: level {level + 1}, {len(chunks)} chunks")
+        summaries = _summarise_chunks(chunks, complete, model, workers, cache, slot)
+        joined = join_summaries(summaries)
+        level += 1
+    with slot():
+        return reduce(joined)
@@ -0,0 +1,182 @@
+"""
+Per-page extraction tiers: PyMuPDF, then pdfminer, then OCR.
+
+Every page gets the fast PyMuPDF pass and a text-density score (letters and
+digits per square inch, ignoring U+FFFD from unmapped glyphs). Only pages
+scoring below ``min_density`` are re-read with pdfminer, and only pages that
+are still thin *and* carry images are rasterised and OCR'd. Results are merged
+in page order, so a mostly digital manual with a few scanned pages gets
+those pages OCR'd without paying OCR for the rest.
+
+pdfminer (``pdfminer.six``) and OCR (``pytesseract`` + ``Pillow`` and a
+tesseract binary) are optional; a missing tier is skipped with a warning and
+the best text found so far is kept.
+"""
+
+from __future__ import annotations
+
+import collections
+import importlib
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Counter, Dict, Iterator, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+# Letters+digits per square inch; a full page of body text scores ~20.
+DEFAULT_MIN_DENSITY = 1.0
+DEFAULT_WINDOW = 16
+OCR_DPI = 200
+TIERS = ("pymupdf", "pdfminer", "ocr")
+
+_warned = set()
+
+
+def _warn_once(tier: str, reason: str) -> None:
+    if tier not in _warned:
+        _warned.add(tier)
+        print(f"[extract] {tier} tier unavailable ({reason}); keeping lower-tier text", file=sys.stderr)
+
+
+def text_density(text: str, area_sq_in: float) -> float:
+    good = sum(1 for c in text if c.isalnum())
+    return good / max(area_sq_in, 1.0)
+
+
+def _pdfminer_pages(pdf_path: str, pages: List[int]) -> Dict[int, str]:
+    try:
+        from pdfminer.high_level import extract_text
+    except ImportError as exc:
+        _warn_once("pdfminer", str(exc))
+        return {}
+    # One parse for the whole window; pages come back form-feed terminated
+    raw = extract_text(pdf_path, page_numbers=pages) or ""
+    parts = raw.split("\x0c")
+    return {i: parts[n] for n, i in enumerate(sorted(pages)) if n < len(parts)}
+
+
+def _ocr_page(pdf_path: str, index: int, dpi: int, lang: str) -> str:
+    import pytesseract
+    from PIL import Image
+
+    with fitz.open(pdf_path) as doc:
+        pix = doc.load_page(index).get_pixmap(dpi=dpi, alpha=False)
+        img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    try:
+        return pytesseract.image_to_string(img, lang=lang)
+    finally:
+        img.close()
+
+
+def _ocr_pages(pdf_path: str, pages: List[int], workers: int, dpi: int, lang: str) -> Dict[int, str]:
+    try:
+        import pytesseract
+        # Availability probe: _ocr_page imports Pillow itself in the worker
+        # threads, so check it once here and warn instead of failing per page
+        importlib.import_module("PIL.Image")
+    except ImportError as exc:
+        _warn_once("ocr", str(exc))
+        return {}
+    if os.environ.get("TESSERACT_PATH"):
+        pytesseract.pytesseract.tesseract_cmd = os.environ["TESSERACT_PATH"]
+
+    def ocr(i: int) -> Optional[str]:
+        try:
+            return _ocr_page(pdf_path, i, dpi, lang)
+        except pytesseract.TesseractNotFoundError:
+            raise  # no binary: give up on the tier (it subclasses OSError)
+        except (pytesseract.TesseractError, OSError) as exc:
+            # one bad page keeps its text-layer result; the others still OCR
+            print(f"[extract] OCR failed on page {i + 1} ({exc}); keeping lower-tier text", file=sys.stderr)
+            return None
+
+    # tesseract runs as a subprocess, so threads give real parallelism here
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pages)))) as pool:
+        texts = pool.map(ocr, pages)
+        try:
+            return {i: text for i, text in zip(pages, texts) if text is not None}
+        except pytesseract.TesseractNotFoundError as exc:
+            _warn_once("ocr", str(exc))
+            return {}
+
+
+def iter_page_texts_tiered(
+    pdf_path: str,
+    start: int = 0,
+    stop: Optional[int] = None,
+    stats: Optional[Counter[str]] = None,
+    **options,
+) -> Iterator[Tuple[int, str]]:
+    """Yield ``(page_index, text)`` like :func:`vi_pipeline.pdftext.iter_page_texts`,
+    escalating low-density pages to pdfminer and then OCR.
+
+    Pages are processed a window at a time so a caller with a character
+    budget can still stop early. ``stats`` (if given) counts pages per tier;
+    ``options`` are passed to :func:`iter_page_tiers`.
+    """
+    for i, text, tier in iter_page_tiers(pdf_path, start, stop, **options):
+        if stats is not None:
+            stats[tier] += 1
+        yield i, text
+
+
+def iter_page_tiers(
+    pdf_path: str,
+    start: int = 0,
+    stop: Optional[int] = None,
+    min_density: float = DEFAULT_MIN_DENSITY,
+    window: int = DEFAULT_WINDOW,
+    ocr_workers: Optional[int] = None,
+    ocr_dpi: int = OCR_DPI,
+    lang: str = "eng",
+) -> Iterator[Tuple[int, str, str]]:
+    """Yield ``(page_index, text, tier)``, processing ``window`` pages at a time."""
+    ocr_workers = ocr_workers or min(4, os.cpu_count() or 1)
+    with fitz.open(pdf_path) as doc:
+        stop = doc.page_count if stop is None else min(stop, doc.page_count)
+        for a in range(start, stop, window):
+            b = min(a + window, stop)
+            best: Dict[int, Tuple[float, str, str]] = {}
+            area: Dict[int, float] = {}
+            has_images: Dict[int, bool] = {}
+            for i in range(a, b):
+                page = doc.load_page(i)
+                area[i] = (page.rect.width / 72.0) * (page.rect.height / 72.0)
+                text = page.get_text()
+                best[i] = (text_density(text, area[i]), text, "pymupdf")
+                has_images[i] = bool(page.get_images(full=False))
+
+            low = [i for i in range(a, b) if best[i][0] < min_density]
+            if low:
+                for i, text in _pdfminer_pages(pdf_path, low).items():
+                    score = text_density(text, area[i])
+                    if score > best[i][0]:
+                        best[i] = (score, text, "pdfminer")
+            # Thin pages without images are genuinely sparse (covers, blanks)
+            scans = [i for i in low if best[i][0] < min_density and has_images[i]]
+            if scans:
+                for i, text in _ocr_pages(pdf_path, scans, ocr_workers, ocr_dpi, lang).items():
+                    score = text_density(text, area[i])
+                    if score > best[i][0]:
+                        best[i] = (score, text, "ocr")
+
+            for i in range(a, b):
+                _, text, tier = best[i]
+                yield i, text, tier
+
+
+def format_stats(stats: Counter[str]) -> str:
+    return ", ".join(f"{tier} {stats[tier]}" for tier in TIERS if stats[tier]) or "no pages"
+
+
+if __name__ == "__main__":
+    # python -m vi_pipeline.tiered <in.pdf> <out.txt>
+    if len(sys.argv) < 3:
+        print("Usage: python -m vi_pipeline.tiered <in.pdf> <out.txt>")
+        sys.exit(2)
+    counts: Counter[str] = collections.Counter()
+    with open(sys.argv[2], "w", encoding="utf-8") as out:
+        for n, (_, page_text) in enumerate(iter_page_texts_tiered(sys.argv[1], stats=counts)):
+            out.write(("\n" if n else "") + page_text)
+    print(f"Wrote {sys.argv[2]} (pages by tier: {format_stats(counts)})")
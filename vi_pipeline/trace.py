@@ -0,0 +1,250 @@
+"""
+JSON-lines span tracing for the pipelines.
+
+Every stage and segment runs inside a span (``StageManifest.run`` opens one
+per checkpointed stage; the single-file pipelines open them directly). When a
+span ends, one JSON object is appended to the trace file:
+
+    {"event": "span", "run": "...", "span": "tts:03", "stage": "tts",
+     "vehicle": "camry-2025", "status": "ok", "start": 1718000000.123,
+     "end": 1718000004.567, "ms": 4444.0, "tts_chars": 812, "retries": 1,
+     "http_requests": 2, "bytes_out": 131072}
+
+Shared code adds counters to whichever span is open on the calling thread:
+the HTTP client records ``http_requests`` and ``retries``, OpenAI calls record
+``prompt_tokens`` / ``completion_tokens``, and ffmpeg invocations record
+``ffmpeg_runs`` and the last ``ffmpeg_exit``. With no span open these calls
+do nothing.
+
+:meth:`Tracer.close` appends a ``{"event": "summary"}`` line with p50/p95
+durations and counter totals per stage; :func:`format_summary` renders the
+same as a table. Tracing is enabled with ``--trace PATH`` (see
+:func:`add_trace_args`) or ``$VI_TRACE``; without it spans are still timed
+for the summary but nothing is written.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import pathlib
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+PathLike = Union[str, pathlib.Path]
+
+# Span statuses; skipped stages are left out of the duration percentiles
+STATUSES = ("ok", "error", "skipped")
+
+
+class Span:
+    def __init__(self, span_id: int, name: str, stage: str, parent: Optional[int], attrs: Dict[str, Any]):
+        self.id = span_id
+        self.name = name
+        self.stage = stage
+        self.parent = parent
+        self.attrs = attrs
+        self.status = "ok"
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.seconds = 0.0
+
+    def add(self, **counts: float) -> None:
+        for key, n in counts.items():
+            self.attrs[key] = self.attrs.get(key, 0) + n
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def finish(self) -> None:
+        self.seconds = time.perf_counter() - self._t0
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list (``q`` in 0..100)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * q // 100))  # ceil
+    return sorted_values[int(rank) - 1]
+
+
+class Tracer:
+    """Collect spans, append them to ``path`` as JSON lines and summarise per stage.
+
+    Args:
+        path: Trace file, appended to (several runs can share one file; the
+            ``run`` field tells them apart). ``None`` keeps spans in memory
+            for :meth:`summary` only.
+        run_id: Identifier written on every event; random by default.
+    """
+
+    def __init__(self, path: Optional[PathLike] = None, run_id: Optional[str] = None):
+        self.path = pathlib.Path(path) if path else None
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+        self._file = None
+        self._seconds: Dict[str, List[float]] = {}
+        self._counts: Dict[str, Dict[str, float]] = {}
+        self._statuses: Dict[str, Dict[str, int]] = {}
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+
+    def _stack(self) -> List[Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current(self) -> Optional[Span]:
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextlib.contextmanager
+    def span(self, name: str, stage: Optional[str] = None, **attrs: Any) -> Iterator[Span]:
+        """Time the block as span ``name`` (stage defaults to the part before ``:``)."""
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        sp = Span(next(self._ids), name, stage or name.split(":", 1)[0], parent.id if parent else None, attrs)
+        stack.append(sp)
+        try:
+            yield sp
+        except BaseException as exc:
+            sp.status = "error"
+            sp.set(error=f"{type(exc).__name__}: {str(exc)[:300]}")
+            raise
+        finally:
+            stack.pop()
+            sp.finish()
+            self._record(sp)
+
+    def _record(self, sp: Span) -> None:
+        event = {
+            "event": "span", "run": self.run_id, "span": sp.name, "stage": sp.stage, "id": sp.id,
+            "parent": sp.parent, "status": sp.status, "start": round(sp.start, 3),
+            "end": round(sp.start + sp.seconds, 3), "ms": round(sp.seconds * 1000, 1), **sp.attrs,
+        }
+        with self._lock:
+            statuses = self._statuses.setdefault(sp.stage, {})
+            statuses[sp.status] = statuses.get(sp.status, 0) + 1
+            if sp.status != "skipped":
+                self._seconds.setdefault(sp.stage, []).append(sp.seconds)
+            counts = self._counts.setdefault(sp.stage, {})
+            for key, value in sp.attrs.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool) and key != "ffmpeg_exit":
+                    counts[key] = counts.get(key, 0) + value
+            self._write(event)
+
+    def _write(self, event: Dict[str, Any]) -> None:
+        if self._file is not None:
+            self._file.write(json.dumps(event, default=str) + "\n")
+            self._file.flush()
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Per stage: span counts by status, p50/p95/max/total seconds, counter totals."""
+        with self._lock:
+            out: Dict[str, Dict[str, Any]] = {}
+            for stage in sorted(self._statuses):
+                secs = sorted(self._seconds.get(stage, []))
+                out[stage] = {
+                    **self._statuses[stage],
+                    "p50_s": round(percentile(secs, 50), 3),
+                    "p95_s": round(percentile(secs, 95), 3),
+                    "max_s": round(secs[-1], 3) if secs else 0.0,
+                    "total_s": round(sum(secs), 3),
+                    **{k: round(v, 3) for k, v in sorted(self._counts.get(stage, {}).items())},
+                }
+            return out
+
+    def close(self) -> Dict[str, Dict[str, Any]]:
+        """Append the summary event, close the file and return the summary."""
+        summary = self.summary()
+        with self._lock:
+            self._write({"event": "summary", "run": self.run_id, "end": round(time.time(), 3), "stages": summary})
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        return summary
+
+
+def format_summary(summary: Dict[str, Dict[str, Any]]) -> str:
+    lines = [f"{'stage':<10} {'ran':>5} {'skip':>5} {'err':>4} {'p50 s':>8} {'p95 s':>8} {'max s':>8} {'total s':>9}  counters"]
+    for stage, s in summary.items():
+        counters = ", ".join(
+            f"{k}={int(v) if float(v).is_integer() else v}" for k, v in s.items()
+            if k not in STATUSES and not k.endswith("_s")
+        )
+        lines.append(
+            f"{stage:<10} {s.get('ok', 0):>5} {s.get('skipped', 0):>5} {s.get('error', 0):>4} "
+            f"{s['p50_s']:>8.2f} {s['p95_s']:>8.2f} {s['max_s']:>8.2f} {s['total_s']:>9.2f}  {counters}"
+        )
+    return "\n".join(lines)
+
+
+_tracer = Tracer()
+_tracer_lock = threading.Lock()
+
+
+def configure(path: Optional[PathLike] = None, run_id: Optional[str] = None) -> Tracer:
+    """Replace the process-wide tracer (``path`` defaults to ``$VI_TRACE``)."""
+    global _tracer
+    with _tracer_lock:
+        _tracer = Tracer(path or os.environ.get("VI_TRACE") or None, run_id)
+        return _tracer
+
+
+def tracer() -> Tracer:
+    return _tracer
+
+
+def span(name: str, stage: Optional[str] = None, **attrs: Any):
+    """Open a span on the process-wide tracer (``with trace.span("extract"): ...``)."""
+    return _tracer.span(name, stage, **attrs)
+
+
+def add(**counts: float) -> None:
+    """Add to counters on the current thread's innermost span, if any."""
+    sp = _tracer.current()
+    if sp is not None:
+        sp.add(**counts)
+
+
+def annotate(**attrs: Any) -> None:
+    """Set attributes on the current thread's innermost span, if any."""
+    sp = _tracer.current()
+    if sp is not None:
+        sp.set(**attrs)
+
+
+def note_ffmpeg(returncode: int) -> None:
+    """Record one ffmpeg invocation and its exit code on the current span."""
+    sp = _tracer.current()
+    if sp is not None:
+        sp.add(ffmpeg_runs=1)
+        sp.set(ffmpeg_exit=returncode)
+
+
+def note_usage(payload: Dict[str, Any]) -> None:
+    """Record token counts from an OpenAI response body on the current span."""
+    usage = payload.get("usage") if isinstance(payload, dict) else None
+    if usage:
+        add(llm_calls=1, prompt_tokens=usage.get("prompt_tokens", 0), completion_tokens=usage.get("completion_tokens", 0))
+    else:
+        add(llm_calls=1)
+
+
+def add_trace_args(parser: argparse.ArgumentParser) -> None:
+    """Register the shared ``--trace`` flag."""
+    parser.add_argument(
+        "--trace",
+        default=os.environ.get("VI_TRACE"),
+        metavar="PATH",
+        help="Append JSON-lines span events and a per-stage p50/p95 summary to PATH (default: $VI_TRACE)",
+    )